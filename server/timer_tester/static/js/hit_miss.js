@@ -156,6 +156,76 @@ async function getHitMiss(clockMethod, repetitions){
   return {'hits' : hits, 'misses' : misses};
 }
 
+/*******************************************************************************
+                                   Batches
+*******************************************************************************/
+
+/**
+ * hitMissState - State shared by successive batches of measurements: the clock and the eviction set.
+ * @global
+ */
+var hitMissState = null;
+
+/**
+ * initHitMiss - Prepare measurements in batches for a specific clock.
+ * Long runs are split in batches so that the caller can save results as they come.
+ * Async because it may initialize a SAB clock.
+ *
+ * @param  {String} clockMethod A string describing which clock is used.
+ * @return {Boolean}            True once the clock is ready.
+ */
+async function initHitMiss(clockMethod){
+  endHitMiss();
+  hitMissState = {'clockMethod': clockMethod, 'timer': null, 'evictionSet': generateRandomArray(CACHE_SIZE)};
+  if (clockMethod == 'SharedArrayBuffer'){
+    hitMissState.timer = await initSAB();
+  }
+  return true;
+}
+
+/**
+ * getHitMissBatch - Measure a batch of cache hits or misses, with the clock given to initHitMiss.
+ *
+ * @param  {String} kind        Either 'hits' or 'misses'.
+ * @param  {Int} repetitions    The number of measurements in the batch.
+ * @return {Array[Int]}         The timings.
+ */
+function getHitMissBatch(kind, repetitions){
+  var timings = [];
+  var clockMethod = hitMissState.clockMethod;
+  for (var i = 0; i < repetitions; i ++){
+    if (kind == 'hits') {
+      if (clockMethod == 'performance.now'){
+        timings.push(testHitPerf());
+      }
+      else if (clockMethod == 'SharedArrayBuffer') {
+        timings.push(testHitSAB(hitMissState.timer));
+      }
+    }
+    else {
+      if (clockMethod == 'performance.now'){
+        timings.push(testMissPerf(hitMissState.evictionSet));
+      }
+      else if (clockMethod == 'SharedArrayBuffer') {
+        timings.push(testMissSAB(hitMissState.evictionSet, hitMissState.timer));
+      }
+    }
+  }
+  return timings;
+}
+
+/**
+ * endHitMiss - Release the state of measurements in batches.
+ *
+ * @return {Void}
+ */
+function endHitMiss(){
+  if (hitMissState != null && hitMissState.timer != null) {
+    killSAB(hitMissState.timer);
+  }
+  hitMissState = null;
+}
+
 /**
  * plotHitMiss - Plot the cache hit/miss histogram.
  * Async because it calls an async function
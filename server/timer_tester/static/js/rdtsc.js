@@ -28,6 +28,39 @@ function measurePerf() {
 }
 
 
+/**
+ * measurePerfCall - Measure the execution time of a call to performance.now.
+ *
+ * @return {Int}  Call time (pseudo-cycles)
+ */
+function measurePerfCall() {
+  let begin,end, tmp;
+  begin = performance.rdtsc();
+  tmp = performance.now();
+  end = performance.rdtsc();
+  return end - begin;
+}
+
+
+/**
+ * measureTSCFrequency - Calibrate performance.rdtsc against performance.now.
+ * Spins for a given duration, so that the resolution of performance.now is negligible.
+ *
+ * @param  {Int} duration Calibration time (ms)
+ * @return {Float}        Frequency of the time stamp counter (GHz)
+ */
+function measureTSCFrequency(duration) {
+  let begin, end, start, elapsed;
+  start = performance.now();
+  begin = performance.rdtsc();
+  do {
+    elapsed = performance.now() - start;
+  } while (elapsed < duration);
+  end = performance.rdtsc();
+  return (end - begin) / (elapsed * 1e6);
+}
+
+
 /**
  * measureSABRead - Measure the execution time of a read in a SAB.
  *
@@ -51,9 +84,9 @@ function measureSABRead(clock) {
  * @return {Int}        Write time (pseudo-cycles)
  */
 function measureSABIncr(clock) {
-  let begin,end, tmp;
+  let begin,end;
   begin = performance.rdtsc();
-  tmp = clock.array[0];
+  Atomics.add(clock.array,0,1);
   end = performance.rdtsc();
   return end - begin;
 }
@@ -84,6 +117,15 @@ async function getTimerMeasurements(repetitions) {
     results['perf'].push(measurePerf());
   }
 
+  console.log("measuring performance.now call");
+  results['perf_call'] = [];
+  for (let i = 0; i < repetitions; i++) {
+    results['perf_call'].push(measurePerfCall());
+  }
+
+  console.log("calibrating performance.rdtsc");
+  results['tsc_ghz'] = measureTSCFrequency(1000);
+
   if (typeof(SharedArrayBuffer) != "undefined") {
     // SAB read
     var clock = await initSAB();
@@ -127,6 +169,10 @@ async function displayMeasurements() {
   divValue += "Average performance.now measurement time: " + perf;
   divValue += "</br>";
 
+  var perfCall = average(results.perf_call) - overhead
+  divValue += "Average performance.now call time: " + perfCall;
+  divValue += "</br>";
+
   if (typeof(SharedArrayBuffer) != "undefined") {
     var SABRead = average(results.sab_read) - overhead
     divValue += "Average SAB read time: " + SABRead;
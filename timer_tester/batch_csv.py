@@ -0,0 +1,194 @@
+#!usr/bin/python3
+''' Regenerate the csv files of all stored results at once.
+Every combination found in the results (browser, version, clock, COOP/COEP) gives
+csv jobs: hit/miss histogram (hit_miss.py), error rate by repetitions
+(error_rate_repetitions.py), distribution of ticks and jitter boxes (jitter_boxplot.py).
+Jobs run in a pool of worker processes, and a csv file newer than all the result
+files it is computed from is not written again.
+
+A manifest.json in the csv folder of each browser lists the csv files, what they
+were computed from, and whether they were written, up to date or failed.
+'''
+# Imports :
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Locals:
+import cache
+import config
+import error_rate_repetitions
+import hit_miss
+import jitter_boxplot
+import results_store
+
+
+KINDS = ['hit_miss', 'error_rep', 'distribution', 'jitter']
+MANIFEST = 'manifest.json'
+
+
+def get_jobs(browsers, kinds = KINDS):
+    ''' List the csv jobs of the stored results, using the index of the results.
+
+    Parameters:
+    browsers(list(str)): Browsers whose results are exported.
+    kinds(list(str)): Kinds of csv files, among KINDS.
+
+    Returns:
+    list(dict): The jobs: kind, browser, version, clock_method and coop (version and clock are None when unused).
+    '''
+    jobs = []
+    for browser in browsers:
+        for (version, metadata, length) in results_store.list_results(browser):
+            if not length:
+                continue
+            coop = metadata.get('coop')
+            if metadata.get('name') == 'hit/miss':
+                for kind in ('hit_miss', 'error_rep'):
+                    jobs.append({'kind': kind, 'browser': browser, 'version': version, 'clock_method': metadata.get('clock_method'), 'coop': coop})
+            elif metadata.get('name') == 'Tick distibution':
+                jobs.append({'kind': 'distribution', 'browser': browser, 'version': version, 'clock_method': None, 'coop': coop})
+                jobs.append({'kind': 'jitter', 'browser': browser, 'version': None, 'clock_method': None, 'coop': coop})
+    unique = {json.dumps(job, sort_keys=True): job for job in jobs if job['kind'] in kinds}
+    return list(unique.values())
+
+
+def get_output(job):
+    ''' Return the path of the csv file of a job. '''
+    (browser, version, clock_method, coop) = (job['browser'], job['version'], job['clock_method'], job['coop'])
+    if job['kind'] == 'hit_miss':
+        return hit_miss.get_csv_path(browser, version, clock_method, coop)
+    if job['kind'] == 'error_rep':
+        return error_rate_repetitions.get_csv_path(browser, version, clock_method, coop)
+    if job['kind'] == 'distribution':
+        return config.CSV_DIR[browser] + 'distribution-' + browser + '-' + str(version) + '-coop-' + str(coop) + '.csv'
+    return jitter_boxplot.get_csv_path(browser, coop)
+
+
+def get_inputs(job):
+    ''' Return the result files a job is computed from, with their modification time (see cache.get_sources).
+    The jitter boxes use the results of all versions.
+    '''
+    if job['version'] is not None:
+        return cache.get_sources(job['browser'], job['version'])
+    return [source for version in results_store.list_versions(job['browser']) for source in cache.get_sources(job['browser'], version)]
+
+
+def is_up_to_date(output, inputs):
+    ''' Check if a csv file is newer than all the files it is computed from. '''
+    try:
+        output_mtime = os.stat(output).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return all(output_mtime >= mtime for (_, mtime, _) in inputs)
+
+
+def run_job(job, step = 1, resamples = 0):
+    ''' Write the csv file of a job (run in a worker process).
+    Exceptions are caught so that a failing job does not stop the others.
+
+    Parameters:
+    job(dict): The job, see get_jobs.
+    step(float): Bin size of hit/miss and distribution histograms.
+    resamples(int): If set, error rates get bootstrap confidence intervals with this number of resamples.
+
+    Returns:
+    (float, str): The wall time of the job in seconds, and the error if it failed (None otherwise).
+    '''
+    start = time.time()
+    error = None
+    (browser, version, clock_method, coop) = (job['browser'], job['version'], job['clock_method'], job['coop'])
+    try:
+        if job['kind'] == 'hit_miss':
+            hit_miss.export_csv(browser, version, clock_method, coop, step = step)
+        elif job['kind'] == 'error_rep':
+            error_rate_repetitions.get_error_repetition(browser, version, clock_method, coop, csv = True, resamples = resamples, workers = 1)
+        elif job['kind'] == 'distribution':
+            jitter_boxplot.distribution_csv(jitter_boxplot.load_data(browser, version, coop), get_output(job), step)
+        else:
+            jitter_boxplot.boxes_csv(jitter_boxplot.get_boxes(browser, coop, workers = 1), get_output(job))
+    except Exception as e:
+        error = type(e).__name__ + ': ' + str(e)
+    return (time.time() - start, error)
+
+
+def write_manifest(browser, entries):
+    ''' Write the manifest of the csv files of a browser, replacing the previous one at once.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    entries(list(dict)): One entry by csv file.
+    '''
+    path = config.CSV_DIR[browser] + MANIFEST
+    os.makedirs(config.CSV_DIR[browser], exist_ok=True)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(entries, file, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def export_all(browsers, workers = None, kinds = KINDS, step = 1, force = False, resamples = 0):
+    ''' Write the csv files of all stored results, several at the same time.
+
+    Parameters:
+    browsers(list(str)): Browsers whose results are exported.
+    workers(int): Number of csv files computed at the same time. Default is the number of cores.
+    kinds(list(str)): Kinds of csv files, among KINDS.
+    step(float): Bin size of hit/miss and distribution histograms.
+    force(bool): Also write csv files which are up to date.
+    resamples(int): If set, error rates get bootstrap confidence intervals with this number of resamples.
+
+    Returns:
+    list(dict): The manifest entries of all csv files.
+    '''
+    entries = []
+    todo = []
+    for job in get_jobs(browsers, kinds):
+        inputs = get_inputs(job)
+        entry = dict(job, output=get_output(job), inputs=[path for (path, _, _) in inputs], status='up to date', wall_time=0, error=None)
+        entries.append(entry)
+        if force or not is_up_to_date(entry['output'], inputs):
+            todo.append(entry)
+    print(str(len(todo)) + ' csv files to write, ' + str(len(entries) - len(todo)) + ' up to date.')
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = {executor.submit(run_job, {key: entry[key] for key in ('kind', 'browser', 'version', 'clock_method', 'coop')}, step, resamples): entry for entry in todo}
+        for job in as_completed(jobs):
+            entry = jobs[job]
+            (entry['wall_time'], entry['error']) = job.result()
+            entry['status'] = 'written' if entry['error'] is None else 'failed'
+            print(entry['output'] + ' ' + entry['status'] + ' in ' + str(round(entry['wall_time'], 1)) + 's'
+                  + ('' if entry['error'] is None else ' (' + entry['error'] + ')'))
+    print('Done in ' + str(round(time.time() - start, 1)) + 's.')
+
+    for browser in browsers:
+        write_manifest(browser, [entry for entry in entries if entry['browser'] == browser])
+    return entries
+
+
+#                                     MAIN                                     #
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--browser', help='Only export the results of this browser. Default is all browsers.', type=str)
+    parser.add_argument('-w', '--workers', help='Number of csv files computed at the same time. Default is the number of cores.', type=int, default=None)
+    parser.add_argument('-k', '--kinds', help='Kinds of csv files to write.', nargs='+', choices=KINDS, default=KINDS)
+    parser.add_argument('--step', help='Bin size of hit/miss and distribution histograms.', type=float, default=1)
+    parser.add_argument('--bootstrap', help='Add bootstrap confidence intervals to error rates, with this number of resamples.', type=int, default=0)
+    parser.add_argument('-f', '--force', help='Also write csv files newer than their results.', action='store_true',default=False)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
+        sys.exit(1)
+    args = parse_arguments()
+    browsers = [args.browser] if args.browser else list(config.RESULTS_DIR)
+    entries = export_all(browsers, args.workers, args.kinds, args.step, args.force, args.bootstrap)
+    if any(entry['status'] == 'failed' for entry in entries):
+        sys.exit(1)
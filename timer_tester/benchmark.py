@@ -0,0 +1,270 @@
+#!usr/bin/python3
+''' Benchmarks of the analysis scripts, to check changes for regressions.
+Each benchmark runs an analysis function on synthetic measurements (seeded, so
+every run uses the same inputs), for growing numbers of samples (1e3 to 1e7)
+or of results in a file (1 to 1000). It reports the best time over a few runs,
+the throughput (samples or results per second), and the peak memory allocated
+during one more run (tracemalloc, which numpy reports its arrays to).
+
+Result files are written in a temporary folder, so the results and cache of the
+current folder are left untouched.
+
+Results can be saved as a baseline (json), and later runs compared to it:
+    python3 benchmark.py --save baseline.json
+    python3 benchmark.py --compare baseline.json
+The comparison fails if a benchmark got slower, or uses more memory, than the
+baseline by more than the tolerance. Baselines are only comparable on the same machine.
+'''
+# Imports :
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+# Locals:
+import config
+import error_rate_repetitions
+import hit_miss
+import jitter_boxplot
+import utility
+
+
+SAMPLES = [10**3, 10**4, 10**5, 10**6, 10**7]
+RECORDS = [1, 10, 100, 1000]
+RECORD_SIZE = 1000 # Measurements in each result of the file benchmarks.
+REPEAT = 3
+TOLERANCE = 0.2
+SEED = 0
+
+
+#                                  INPUTS                                      #
+
+def get_hits_misses(size):
+    ''' Return synthetic hit and miss timings, misses being slower on average. '''
+    rng = np.random.default_rng(SEED)
+    return (rng.poisson(20, size), rng.poisson(25, size))
+
+def write_distributions(version, records):
+    ''' Write a result file with some tick distribution results, as the testers do. '''
+    rng = np.random.default_rng(SEED)
+    for _ in range(records):
+        utility.write_distribution(rng.poisson(100, RECORD_SIZE).tolist(), version, False, 'firefox')
+
+
+#                                BENCHMARKS                                    #
+# Each benchmark takes the size of its input, prepares it, and returns the function to time.
+
+def bench_best_error_rate(size):
+    (hits, misses) = get_hits_misses(size)
+    return lambda: error_rate_repetitions.get_best_error_rate(hits, misses, 'SharedArrayBuffer')
+
+def bench_best_error_rates(size):
+    (hits, misses) = get_hits_misses(size)
+    return lambda: error_rate_repetitions.get_best_error_rates(hits, misses, 'SharedArrayBuffer')
+
+def bench_mean_rep(size):
+    (hits, misses) = get_hits_misses(size)
+    return lambda: error_rate_repetitions.get_mean_rep(hits, misses, 10)
+
+def bench_histogram(size):
+    (hits, misses) = get_hits_misses(size)
+    results = [{'hit/miss': 'hits', 'values': hits}, {'hit/miss': 'misses', 'values': misses}]
+    return lambda: hit_miss.get_histogram(results, 0, int(max(hits.max(), misses.max())))
+
+def bench_stats(size):
+    (hits, _) = get_hits_misses(size)
+    return lambda: utility.get_stats(hits, data=False)
+
+def bench_write_results(records):
+    ''' Append results one by one to a new file, which grows up to records results. '''
+    values = np.random.default_rng(SEED).poisson(100, RECORD_SIZE).tolist()
+    versions = iter(range(10**6))
+    def write():
+        version = 'write-' + str(records) + '-' + str(next(versions))
+        for _ in range(records):
+            utility.write_results({'name': 'Tick distibution', 'values': values, 'coop': False}, version, 'firefox')
+    return write
+
+def bench_load_data(records):
+    version = 'load-' + str(records)
+    write_distributions(version, records)
+    def load():
+        cache_size = config.CACHE_SIZE
+        config.CACHE_SIZE = 0 # Parse the result file every time.
+        try:
+            jitter_boxplot.load_data('firefox', version, False)
+        finally:
+            config.CACHE_SIZE = cache_size
+    return load
+
+def bench_load_data_cached(records):
+    version = 'cached-' + str(records)
+    write_distributions(version, records)
+    jitter_boxplot.load_data('firefox', version, False) # Fill the cache.
+    return lambda: np.asarray(jitter_boxplot.load_data('firefox', version, False)).sum()
+
+# Name: (benchmark, sizes, unit of the throughput)
+BENCHMARKS = {'error_rate_repetitions.get_best_error_rate': (bench_best_error_rate, SAMPLES, 'samples'),
+              # Averages of all repetition counts take about 700 bytes per sample: several GB at 1e7.
+              'error_rate_repetitions.get_best_error_rates': (bench_best_error_rates, SAMPLES[:-1], 'samples'),
+              'error_rate_repetitions.get_mean_rep': (bench_mean_rep, SAMPLES, 'samples'),
+              'hit_miss.get_histogram': (bench_histogram, SAMPLES, 'samples'),
+              'utility.get_stats': (bench_stats, SAMPLES, 'samples'),
+              'utility.write_results': (bench_write_results, RECORDS, 'results'),
+              'jitter_boxplot.load_data': (bench_load_data, RECORDS, 'results'),
+              'jitter_boxplot.load_data (cached)': (bench_load_data_cached, RECORDS, 'results'),
+              }
+
+
+#                                 MEASURES                                     #
+
+def measure(function, repeat = REPEAT):
+    ''' Time a function and measure its peak memory.
+
+    Parameters:
+    function(function): The function to measure, without arguments.
+    repeat(int): Number of timed runs.
+
+    Returns:
+    dict: The best time in seconds, and the peak memory in bytes (in an extra run, as tracemalloc slows it down).
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'time': min(times), 'peak': peak}
+
+
+def run(names = None, max_samples = SAMPLES[-1], max_records = RECORDS[-1], repeat = REPEAT):
+    ''' Run the benchmarks in a temporary folder.
+
+    Parameters:
+    names(list(str)): Benchmarks to run, among BENCHMARKS. Default is all of them.
+    max_samples(int): Largest number of samples.
+    max_records(int): Largest number of results in a file.
+    repeat(int): Number of timed runs of each benchmark.
+
+    Returns:
+    dict: For each benchmark and size, its time, peak memory and throughput.
+    '''
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir) # Paths of the config file are relative.
+        try:
+            for (name, (benchmark, sizes, unit)) in BENCHMARKS.items():
+                if names and name not in names:
+                    continue
+                results[name] = {}
+                for size in sizes:
+                    if size > (max_samples if unit == 'samples' else max_records):
+                        continue
+                    measures = measure(benchmark(size), repeat)
+                    measures['throughput'] = size / measures['time'] if measures['time'] > 0 else float('inf')
+                    measures['unit'] = unit + '/s'
+                    results[name][str(size)] = measures
+                    print_measures(name, size, measures)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+#                                 BASELINES                                    #
+
+def save(results, path):
+    ''' Save benchmark results as a baseline, with the machine they ran on. '''
+    baseline = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'machine': platform.platform(),
+                'processor': platform.processor(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'results': results,
+                }
+    with open(path, 'w') as file:
+        json.dump(baseline, file, indent=1)
+
+
+def compare(results, baseline, tolerance = TOLERANCE):
+    ''' Compare benchmark results to a baseline.
+
+    Parameters:
+    results(dict): Benchmark results, see run.
+    baseline(dict): A baseline, see save.
+    tolerance(float): Allowed increase of time and memory, as a fraction of the baseline.
+
+    Returns:
+    list((str, str, str, float, float)): The regressions: benchmark, size, measure ('time' or 'peak'), baseline and new value.
+    '''
+    regressions = []
+    for (name, sizes) in results.items():
+        for (size, measures) in sizes.items():
+            old = baseline['results'].get(name, {}).get(size)
+            if old is None:
+                continue
+            for key in ('time', 'peak'):
+                if measures[key] > old[key] * (1 + tolerance):
+                    regressions.append((name, size, key, old[key], measures[key]))
+    return regressions
+
+
+#                                   DISPLAY                                    #
+
+def print_measures(name, size, measures):
+    print(name + ' ' + str(size) + ': ' + format(measures['time'], '.4g') + 's, '
+          + format(measures['throughput'], '.3g') + ' ' + measures['unit'] + ', '
+          + format(measures['peak'] / 2**20, '.1f') + ' MiB')
+
+def print_regressions(regressions, tolerance):
+    if regressions == []:
+        print('No regression above ' + str(round(tolerance * 100)) + '%.')
+        return
+    print(str(len(regressions)) + ' regression(s) above ' + str(round(tolerance * 100)) + '%:')
+    for (name, size, key, old, new) in regressions:
+        print(name + ' ' + size + ' ' + key + ': ' + format(old, '.4g') + ' -> ' + format(new, '.4g')
+              + ' (+' + str(round((new / old - 1) * 100)) + '%)')
+
+
+#                                     MAIN                                     #
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--benchmarks', help='Benchmarks to run. Default is all of them.', nargs='+', choices=list(BENCHMARKS))
+    parser.add_argument('--max_samples', help='Largest number of samples.', type=int, default=SAMPLES[-1])
+    parser.add_argument('--max_records', help='Largest number of results in a file.', type=int, default=RECORDS[-1])
+    parser.add_argument('-r', '--repeat', help='Number of timed runs of each benchmark, the best is kept.', type=int, default=REPEAT)
+    parser.add_argument('--save', help='Save the results as a baseline in this json file.', type=str)
+    parser.add_argument('--compare', help='Compare the results to the baseline in this json file.', type=str)
+    parser.add_argument('-t', '--tolerance', help='Allowed increase of time and memory over the baseline, in percent.', type=float, default=TOLERANCE * 100)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
+        sys.exit(1)
+    args = parse_arguments()
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+    results = run(args.benchmarks, args.max_samples, args.max_records, args.repeat)
+    if args.save:
+        save(results, args.save)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance / 100)
+        print_regressions(regressions, args.tolerance / 100)
+        if regressions:
+            sys.exit(1)
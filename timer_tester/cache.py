@@ -0,0 +1,190 @@
+#!usr/bin/python3
+''' On-disk cache of the measurement arrays read by the analysis scripts.
+Gathering the hits, misses or ticks of a version means parsing its result files,
+which takes long for large files. The gathered arrays are kept as .npy files in
+the cache folder (see CACHE_DIR in the config file), and memory-mapped when
+the same arrays are asked again.
+
+An entry is keyed by the browser, the version, the filters used (clock, COOP/COEP...)
+and the modification time and size of the result files it was read from, so it
+is never used once a result file has changed. Entries of a version are also
+deleted as soon as a result of this version is written (see results_store.py).
+The cache is bounded (CACHE_SIZE in the config file): the least recently used
+entries are deleted first.
+
+The cache can be emptied with:
+    python3 cache.py --clear
+'''
+# Imports :
+import hashlib
+import json
+import os
+import shutil
+import sys
+import argparse
+import tempfile
+import numpy as np
+
+# Locals:
+import config
+import results_store
+
+
+def get_sources(browser, version):
+    ''' Return the result files of a version, with their modification time and size.
+    Arrays stored as .npy files are written before their result line, so the result files are enough.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+
+    Returns:
+    list((str, int, int)): Path, modification time and size of each existing result file.
+    '''
+    sources = []
+    for extension in (results_store.EXTENSION, results_store.LEGACY_EXTENSION):
+        path = results_store.get_path(browser, version, extension)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        sources.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+    return sources
+
+
+def get_entry(browser, version, filters):
+    ''' Return the path of the cache entry of some arrays.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+    filters(dict): The filters the arrays were read with.
+
+    Returns:
+    String: The path of the entry folder.
+    '''
+    key = json.dumps([get_sources(browser, version), sorted(filters.items())], default=str)
+    return os.path.join(config.CACHE_DIR, browser + '-' + str(version) + '-' + hashlib.sha1(key.encode()).hexdigest())
+
+
+def load(browser, version, read, **filters):
+    ''' Return arrays from the cache, reading them with read() and caching them if they are not there.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+    read(function): Reads the arrays from the results, returns a dict of arrays,
+    or None if they can not be cached (e.g. values stored as sketches).
+    filters: The filters read() uses, e.g. clock_method='performance.now', coop=True.
+
+    Returns:
+    dict: The arrays, by name (memory-mapped when they come from the cache). None if read() gave None.
+    '''
+    if config.CACHE_SIZE <= 0:
+        return read()
+    entry = get_entry(browser, version, filters)
+    try:
+        arrays = {filename[:-len('.npy')]: np.load(os.path.join(entry, filename), mmap_mode='r')
+                  for filename in os.listdir(entry)}
+        os.utime(entry) # Last use, for eviction.
+        return arrays
+    except (OSError, ValueError):
+        pass
+    arrays = read()
+    if arrays is None:
+        return None
+    store(entry, arrays)
+    evict()
+    return arrays
+
+
+def store(entry, arrays):
+    ''' Write arrays in a cache entry.
+    They are written in a temporary folder, renamed once complete, so an entry is never partially read.
+
+    Parameters:
+    entry(str): The path of the entry folder.
+    arrays(dict): The arrays, by name.
+    '''
+    os.makedirs(config.CACHE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=config.CACHE_DIR, prefix='.tmp-')
+    try:
+        for (name, values) in arrays.items():
+            np.save(os.path.join(tmp_dir, name + '.npy'), np.asarray(values))
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmp_dir, entry)
+    except OSError as e: # Another process may have written the same entry, the cache is only an optimization.
+        print('Could not cache ' + os.path.basename(entry) + ': ' + str(e))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def list_entries():
+    ''' List the cache entries.
+
+    Returns:
+    list((str, float, int)): Path, last use and size in bytes of each entry, least recently used first.
+    '''
+    if not os.path.exists(config.CACHE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(config.CACHE_DIR):
+        entry = os.path.join(config.CACHE_DIR, name)
+        if name.startswith('.tmp-') or not os.path.isdir(entry):
+            continue
+        try:
+            size = sum(os.path.getsize(os.path.join(entry, filename)) for filename in os.listdir(entry))
+            entries.append((entry, os.stat(entry).st_mtime, size))
+        except FileNotFoundError: # Deleted by another process.
+            continue
+    return sorted(entries, key=lambda entry: entry[1])
+
+
+def evict(max_size = None):
+    ''' Delete the least recently used entries until the cache fits in max_size bytes.
+
+    Parameters:
+    max_size(int): Size of the cache. Default is set in config file.
+    '''
+    max_size = config.CACHE_SIZE if max_size is None else max_size
+    entries = list_entries()
+    size = sum(entry[2] for entry in entries)
+    for (entry, _, entry_size) in entries:
+        if size <= max_size:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        size -= entry_size
+
+
+def invalidate(browser, version):
+    ''' Delete the cache entries of a version, e.g. when a result is added.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+    '''
+    if not os.path.exists(config.CACHE_DIR):
+        return
+    prefix = browser + '-' + str(version) + '-'
+    for name in os.listdir(config.CACHE_DIR):
+        if name.startswith(prefix) and len(name) == len(prefix) + 40: # sha1 digest
+            shutil.rmtree(os.path.join(config.CACHE_DIR, name), ignore_errors=True)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clear', help='Delete all cache entries.', action='store_true',default=False)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
+        sys.exit(1)
+    args = parse_arguments()
+    if args.clear:
+        evict(0)
+    entries = list_entries()
+    print(str(len(entries)) + ' entries, ' + str(sum(entry[2] for entry in entries) // 2**20) + ' MiB used of '
+          + str(config.CACHE_SIZE // 2**20) + ' MiB in ' + config.CACHE_DIR)
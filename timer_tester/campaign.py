@@ -0,0 +1,218 @@
+#!usr/bin/python3
+''' Run the client-side tests of several browser versions in parallel.
+Each version is a job, run by ff_tester or chrome_tester in a pool of worker
+processes. Every worker uses its own local server, on port base_port + worker
+number, so that browser sessions do not share a server. The servers can be
+started by this script (--start_servers), otherwise they must already be running,
+for instance with docker: docker run -p 8001:8000 ...
+
+Results of all workers are appended to the result files safely (see results_store.py).
+At the end, the wall time of every job is reported.
+'''
+# Imports :
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.request import urlopen
+
+# Locals:
+import config
+import resume
+import utility
+
+
+TESTERS = {'firefox': 'ff_tester',
+           'chrome': 'chrome_tester',
+           }
+
+
+def get_tester(browser):
+    ''' Import the tester module of a browser.
+    Testers are imported lazily, so that only the needed Selenium parts are loaded.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+
+    Returns:
+    module: ff_tester or chrome_tester.
+    '''
+    if browser not in TESTERS:
+        raise Exception('Select a valid browser')
+    return __import__(TESTERS[browser])
+
+
+def get_base_url(port):
+    return 'http://localhost:' + str(port)
+
+
+def init_worker(ports, values_format, display):
+    ''' Initialize a worker process: take a free server port and use it for all its jobs.
+
+    Parameters:
+    ports(multiprocessing.Queue): Ports not yet used by a worker.
+    values_format(str): 'json', 'npy' or 'sketch', see config file.
+    display(str): 'window', 'headless' or 'xvfb', see config file.
+    '''
+    port = ports.get()
+    config.BASE_URL = get_base_url(port)
+    config.URLS = config.get_urls(config.BASE_URL)
+    config.VALUES_FORMAT = values_format
+    config.DISPLAY = display
+
+
+def run_job(browser, version, tests, coop, repetitions, single_session = False, batch_size = None, todo = None):
+    ''' Run the tests of a version in a worker.
+    Exceptions are caught so that a failing version does not stop the campaign.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int): Tested version.
+    tests(list(str)): Tests to run, among utility.TESTS.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements.
+    single_session(bool): Share one browser between the tests of the version.
+    batch_size(int): If set, measure in batches saved as they come (see checkpoint.py).
+    todo(dict): The measurements still to do by step (see resume.py). Default is every step of tests.
+
+    Returns:
+    (float, str): The wall time of the job in seconds, and the error if it failed (None otherwise).
+    '''
+    start = time.time()
+    error = None
+    try:
+        get_tester(browser).run_tests(version, tests, coop, repetitions, single_session, batch_size, todo)
+    except Exception as e:
+        error = type(e).__name__ + ': ' + str(e)
+    return (time.time() - start, error)
+
+
+def start_servers(ports):
+    ''' Start a local server on each port and wait until they answer.
+
+    Parameters:
+    ports(list(int)): Ports of the servers.
+
+    Returns:
+    list(subprocess.Popen): The server processes.
+    '''
+    servers = []
+    for port in ports:
+        servers.append(subprocess.Popen([sys.executable, os.path.join(config.SERVER_DIR, 'manage.py'),
+                                         'runserver', '127.0.0.1:' + str(port), '--noreload'],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    for port in ports:
+        for attempt in range(60):
+            try:
+                urlopen(get_base_url(port)).close()
+                break
+            except OSError:
+                time.sleep(1)
+        else:
+            print('The server on port ' + str(port) + ' does not answer.')
+    return servers
+
+
+def run_campaign(browser, versions, tests, coop, repetitions, workers, base_port = 8000, servers = False, single_session = False, batch_size = None, todo = None):
+    ''' Run the tests on all versions, with several versions at the same time.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    versions(list(int)): Tested versions.
+    tests(list(str)): Tests to run, among utility.TESTS.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements.
+    workers(int): Number of versions tested at the same time.
+    base_port(int): Port of the server of the first worker.
+    servers(bool): Start the local servers instead of using running ones.
+    single_session(bool): Share one browser between the tests of a version.
+    batch_size(int): If set, measure in batches saved as they come (see checkpoint.py).
+    todo(dict): For each version, the measurements still to do by step (see resume.py). Default is every step of tests.
+
+    Returns:
+    dict: For each version, its wall time in seconds and its error (None if it succeeded).
+    '''
+    if todo is None:
+        todo = {version: None for version in versions}
+    workers = max(1, min(workers, len(versions)))
+    ports = [base_port + worker for worker in range(workers)]
+    processes = start_servers(ports) if servers else []
+    free_ports = multiprocessing.Queue()
+    for port in ports:
+        free_ports.put(port)
+
+    report = {}
+    start = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(free_ports, config.VALUES_FORMAT, config.DISPLAY)) as executor:
+            jobs = {executor.submit(run_job, browser, version, tests, coop, repetitions, single_session, batch_size, todo[version]): version for version in versions}
+            for job in as_completed(jobs):
+                version = jobs[job]
+                report[version] = job.result()
+                (wall_time, error) = report[version]
+                print(browser + ' ' + str(version) + ' done in ' + str(round(wall_time, 1)) + 's' + ('' if error is None else ' (failed: ' + error + ')'))
+    finally:
+        for process in processes:
+            process.terminate()
+
+    print()
+    print('Campaign done in ' + str(round(time.time() - start, 1)) + 's with ' + str(workers) + ' workers.')
+    print('version wall_time(s) status')
+    for version in sorted(report):
+        (wall_time, error) = report[version]
+        print(str(version) + ' ' + str(round(wall_time, 1)) + ' ' + ('ok' if error is None else 'failed'))
+    return report
+
+
+#                                  MAIN                                        #
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--browser', help='Use a specific browser.', type=str, default='firefox')
+    parser.add_argument('-v', '--version', help='Use a specific version. By default, runs all versions available.', type=int)
+    parser.add_argument('-r', '--repetitions', help='Number of measurements for hit/miss and distribution.', type=int, default=config.REPETITIONS)
+    parser.add_argument('-c', '--coop', help = 'Enables COOP and COEP. Default is off.', action='store_true',default=False)
+    parser.add_argument('-w', '--workers', help='Number of versions tested at the same time.', type=int, default=max(1, os.cpu_count()//4))
+    parser.add_argument('--base_port', help='Port of the local server of the first worker. Worker i uses base_port + i.', type=int, default=8000)
+    parser.add_argument('--start_servers', help='Start one local server per worker (requires the server requirements).', action='store_true',default=False)
+    parser.add_argument('--sab', help='Run the availablity tests for SharedArrayBuffer.', action='store_true',default=False)
+    parser.add_argument('--distribution', help='Evaluates the number of incrementation per clock period.', action='store_true',default=False)
+    parser.add_argument('--hit_miss', help='Evaluates timings for cache hits and misses. This can take a while.', action='store_true',default=False)
+    parser.add_argument('--session', help='Run all tests of a version in a single browser session.', action='store_true',default=False)
+    parser.add_argument('--batch', help='Measure in batches of this size, saved as they come, to resume interrupted runs.', type=int)
+    parser.add_argument('--resume', help='Only run the tests and measurements missing from the stored results.', action='store_true',default=False)
+    parser.add_argument('--display', help='Show browsers in a window, run them headless, or on a virtual display (Xvfb, one per worker).', choices=['window', 'headless', 'xvfb'], default=config.DISPLAY)
+    parser.add_argument('--npy', help='Store measurement values as binary .npy files instead of json.', action='store_true',default=False)
+    parser.add_argument('--sketch', help='Only store summaries (sketches) of tick distribution and rdtsc values, see sketch.py.', action='store_true',default=False)
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    if args.npy:
+        config.VALUES_FORMAT = 'npy'
+    if args.sketch:
+        config.VALUES_FORMAT = 'sketch'
+    config.DISPLAY = args.display
+    versions = get_tester(args.browser).select_versions(args.version)
+    tests = utility.get_tests(args)
+    todo = None
+    if args.resume:
+        todo = resume.plan(args.browser, versions, tests, args.coop, args.repetitions)
+        versions = [version for version in versions if todo[version]]
+        if versions == []:
+            print('Nothing left to do.')
+            return
+    print('Running ' + ', '.join(tests) + ' on ' + args.browser + ' ' + str(versions) + ' with ' + str(args.workers) + ' workers.')
+    run_campaign(args.browser, versions, tests, args.coop, args.repetitions, args.workers, args.base_port, args.start_servers, args.session, args.batch, todo)
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
+        sys.exit(1)
+    args = parse_arguments()
+    main(args)
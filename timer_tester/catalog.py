@@ -0,0 +1,185 @@
+#!usr/bin/python3
+''' SQLite index over the results of a browser.
+For every stored result, the index keeps its metadata (name, version, clock,
+COOP/COEP, hit or miss), the number of measurements, and where the result is
+in its JSON Lines file. Looking results up then only reads the matching lines.
+
+The index is a cache: it lives in the results folder (index.sqlite3) and can be
+deleted at any time, it is rebuilt from the result files when needed.
+As result files are append-only, only the bytes added since the last update of
+a file are indexed. A file replaced by a new one (migration) is indexed again.
+'''
+# Imports :
+import json
+import os
+import sqlite3
+import numpy as np
+
+# Locals:
+import config
+
+
+INDEX_NAME = 'index.sqlite3'
+
+# Result fields that can be used to filter results, and their column in the index.
+COLUMNS = {'name': 'name',
+           'clock_method': 'clock_method',
+           'coop': 'coop',
+           'hit/miss': 'hit_miss',
+           }
+
+
+def get_index_path(browser):
+    ''' Return the path of the index of a browser.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+
+    Returns:
+    String: The path to the index.
+    '''
+    return config.RESULTS_DIR[browser] + INDEX_NAME
+
+
+def connect(browser):
+    ''' Open the index of a browser, creating it if needed.
+    The timeout lets several processes write results at the same time.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+
+    Returns:
+    sqlite3.Connection: The connection to the index.
+    '''
+    os.makedirs(config.RESULTS_DIR[browser], exist_ok=True)
+    connection = sqlite3.connect(get_index_path(browser), timeout=60, isolation_level=None)
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            inode INTEGER,
+            size INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS results (
+            path TEXT,
+            version TEXT,
+            offset INTEGER,
+            size INTEGER,
+            name TEXT,
+            clock_method TEXT,
+            coop INTEGER,
+            hit_miss TEXT,
+            length INTEGER,
+            metadata TEXT
+        );
+        CREATE INDEX IF NOT EXISTS results_lookup ON results (name, coop, clock_method, hit_miss, version);
+    ''')
+    return connection
+
+
+def get_length(result, array_dir):
+    ''' Return the number of measurements of a result.
+    For arrays stored as .npy files, only the header of the file is read,
+    and for sketches, their count is used.
+
+    Parameters:
+    result(dict): A stored result.
+    array_dir(str): Folder of the .npy files of the version.
+
+    Returns:
+    int: The number of values, None if the result has no values.
+    '''
+    if 'values' in result:
+        return len(result['values'])
+    if 'values' in result.get('arrays', {}):
+        return len(np.load(array_dir + result['arrays']['values'], mmap_mode='r'))
+    if 'values' in result.get('sketches', {}):
+        return result['sketches']['values']['count']
+    return None
+
+
+def get_metadata(result):
+    ''' Keep the small fields of a result, measurement arrays excluded. '''
+    return {key: value for (key, value) in result.items() if not isinstance(value, list) and key not in ('arrays', 'sketches')}
+
+
+def update_file(connection, version, path, array_dir):
+    ''' Index the results added to a result file since its last update.
+    Unfinished lines (interrupted write or concurrent append) are left for a
+    later update, and lines that cannot be parsed are skipped, as they are when
+    reading results.
+
+    Parameters:
+    connection(sqlite3.Connection): The index.
+    version(int or str): The version of the result file.
+    path(str): Path of the JSON Lines result file.
+    array_dir(str): Folder of the .npy files of the version.
+    '''
+    if not os.path.exists(path):
+        return
+    # The whole update is a single write transaction, so that two processes
+    # updating the same file can not index the same lines twice.
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        status = os.stat(path)
+        row = connection.execute('SELECT inode, size FROM files WHERE path = ?', (path,)).fetchone()
+        start = 0
+        if row is not None:
+            (inode, size) = row
+            if inode == status.st_ino and size <= status.st_size:
+                start = size
+            else:
+                connection.execute('DELETE FROM results WHERE path = ?', (path,))
+        rows = []
+        offset = start
+        if start < status.st_size:
+            with open(path, 'rb') as file:
+                file.seek(start)
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        result = json.loads(line)
+                    except json.decoder.JSONDecodeError:
+                        result = None
+                    if isinstance(result, dict):
+                        rows.append((path, str(version), offset, len(line),
+                                     result.get('name'), result.get('clock_method'), result.get('coop'), result.get('hit/miss'),
+                                     get_length(result, array_dir), json.dumps(get_metadata(result))))
+                    offset += len(line)
+        connection.executemany('INSERT INTO results VALUES (?,?,?,?,?,?,?,?,?,?)', rows)
+        connection.execute('INSERT OR REPLACE INTO files VALUES (?,?,?)', (path, status.st_ino, offset))
+        connection.execute('COMMIT')
+    except:
+        connection.execute('ROLLBACK')
+        raise
+
+
+def find(connection, versions = None, **filters):
+    ''' Look up results in the index.
+
+    Parameters:
+    connection(sqlite3.Connection): The index.
+    versions(list): Only keep results of these versions. Default is all versions.
+    filters: Required values of result fields, e.g. name='hit/miss', coop=True.
+    The 'hit/miss' field is given as hit_miss.
+
+    Returns:
+    list(tuple): (version, path, offset, size, length, metadata) of the matching results, in file order.
+    '''
+    clauses = []
+    parameters = []
+    for (key, value) in filters.items():
+        column = COLUMNS.get(key.replace('hit_miss', 'hit/miss'))
+        if column is None:
+            raise Exception('Results can not be filtered on ' + key)
+        clauses.append(column + ' = ?')
+        parameters.append(value)
+    if versions is not None:
+        clauses.append('version IN (' + ','.join('?' * len(versions)) + ')')
+        parameters.extend(str(version) for version in versions)
+    query = 'SELECT version, path, offset, size, length, metadata FROM results'
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    query += ' ORDER BY path, offset'
+    return [(version, path, offset, size, length, json.loads(metadata))
+            for (version, path, offset, size, length, metadata) in connection.execute(query, parameters)]
@@ -0,0 +1,187 @@
+#!usr/bin/python3
+''' Long in-browser measurements, in batches saved as they come.
+Instead of a single script call returning all measurements at the end, the
+measurements are done in batches. Every batch is appended to a checkpoint file
+as soon as it is received, and the progress is printed with an estimated end.
+If the browser crashes, a new one is started and the measurements resume from
+the last checkpoint. Checkpoints also survive the script: running the same test
+again resumes it. Once all measurements are done, the result is written as usual
+and the checkpoint is removed.
+'''
+# Imports :
+import json
+import os
+import time
+
+# Locals:
+import config
+import session
+import utility
+
+
+MAX_RESTARTS = 3
+
+
+def get_path(browser, version, test, coop):
+    ''' Return the path of the checkpoint of a test.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int): Tested version.
+    test(str): Name of the test, e.g. 'hit_miss-performance.now'.
+    coop(bool): True if COOP/COEP is enabled.
+
+    Returns:
+    String: The path to the checkpoint file.
+    '''
+    return config.RESULTS_DIR[browser] + 'checkpoints/' + browser + '-' + str(version) + '-' + test + '-coop-' + str(coop) + '.jsonl'
+
+
+def load(path, kinds):
+    ''' Read the measurements saved in a checkpoint.
+    An unfinished last line (crash while saving) is ignored.
+
+    Parameters:
+    path(str): Path of the checkpoint.
+    kinds(list(str)): Kinds of measurements, e.g. ['hits', 'misses'].
+
+    Returns:
+    dict: The saved measurements of each kind.
+    '''
+    collected = {kind: [] for kind in kinds}
+    if not os.path.exists(path):
+        return collected
+    with open(path, 'r') as file:
+        for line in file:
+            try:
+                batch = json.loads(line)
+            except json.decoder.JSONDecodeError:
+                continue
+            collected[batch['kind']].extend(batch['values'])
+    return collected
+
+
+def save(path, kind, values):
+    ''' Append a batch of measurements to a checkpoint, synced to the disk. '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as file:
+        file.write(json.dumps({'kind': kind, 'values': values}) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def format_duration(seconds):
+    (minutes, seconds) = divmod(int(seconds), 60)
+    (hours, minutes) = divmod(minutes, 60)
+    return str(hours) + 'h' + str(minutes).zfill(2) + 'm' + str(seconds).zfill(2) + 's'
+
+
+def run_batches(launch, prepare, measure, kinds, repetitions, batch_size, path, restarts = MAX_RESTARTS, close = True):
+    ''' Measure in batches until every kind has enough measurements.
+    Exceptions raised while the browser still answers (e.g. a JavaScript error)
+    are not crashes and are raised again, the checkpoint being kept.
+
+    Parameters:
+    launch(function): Starts the browser and returns its webdriver.
+    prepare(function): Takes the webdriver and loads/initializes the test page.
+    measure(function): Takes the webdriver, a kind and a number of measurements, and returns the measurements.
+    kinds(list(str)): Kinds of measurements, done one after the other.
+    repetitions(int): The number of measurements of each kind.
+    batch_size(int): The number of measurements by script call.
+    path(str): Path of the checkpoint.
+    restarts(int): Number of browser crashes tolerated.
+    close(bool): Close the browser at the end.
+
+    Returns:
+    dict: The measurements of each kind.
+    '''
+    collected = load(path, kinds)
+    total = repetitions * len(kinds)
+    done = sum(min(len(collected[kind]), repetitions) for kind in kinds)
+    if done > 0:
+        print('Resuming from checkpoint ' + path + ': ' + str(done) + '/' + str(total) + ' measurements already done.')
+    start = time.time()
+    measured = 0
+    driver = None
+    try:
+        while any(len(collected[kind]) < repetitions for kind in kinds):
+            try:
+                if driver is None:
+                    driver = launch()
+                    prepare(driver)
+                for kind in kinds:
+                    while len(collected[kind]) < repetitions:
+                        count = min(batch_size, repetitions - len(collected[kind]))
+                        values = measure(driver, kind, count)
+                        save(path, kind, values)
+                        collected[kind].extend(values)
+                        measured += len(values)
+                        done += len(values)
+                        elapsed = time.time() - start
+                        eta = elapsed / measured * (total - done)
+                        print(kind + ': ' + str(len(collected[kind])) + '/' + str(repetitions)
+                              + ' (' + str(round(100 * done / total, 1)) + '% done, ETA ' + format_duration(eta) + ')')
+            except Exception as e:
+                if driver is not None and session.is_alive(driver):
+                    raise
+                if restarts <= 0:
+                    raise
+                restarts -= 1
+                print('The browser crashed (' + type(e).__name__ + '), restarting from the last checkpoint.')
+                if driver is not None:
+                    session.quit(driver)
+                driver = None
+    finally:
+        if driver is not None and close:
+            session.quit(driver)
+    return {kind: collected[kind][:repetitions] for kind in kinds}
+
+
+def stream_hits_misses(launch, browser, version, clock_method, coop, repetitions, batch_size, restarts = MAX_RESTARTS, close = True):
+    ''' Measure cache hits and misses in batches, then write the result and remove the checkpoint.
+    See run_batches for the parameters.
+
+    Returns:
+    dict: The hit timings and miss timings, under 'hits' and 'misses'.
+    '''
+    path = get_path(browser, version, 'hit_miss-' + clock_method, coop)
+
+    def prepare(driver):
+        driver.get(utility.get_url('hit_miss', coop))
+        driver.set_script_timeout(10000000000)
+        driver.execute_script("return initHitMiss('" + clock_method + "')")
+
+    def measure(driver, kind, count):
+        return driver.execute_script("return getHitMissBatch('" + kind + "'," + str(count) + ")")
+
+    results = run_batches(launch, prepare, measure, ['hits', 'misses'], repetitions, batch_size, path, restarts, close)
+    utility.write_hits_misses(results, version, clock_method, coop, browser)
+    remove(path)
+    return results
+
+
+def stream_distribution(launch, browser, version, coop, repetitions, batch_size, restarts = MAX_RESTARTS, close = True):
+    ''' Measure the number of ticks in clock periods in batches, then write the result and remove the checkpoint.
+    See run_batches for the parameters.
+
+    Returns:
+    list(int): The number of incrementations for each clock period.
+    '''
+    path = get_path(browser, version, 'distribution', coop)
+
+    def prepare(driver):
+        driver.get(utility.get_url('distribution', coop))
+        driver.set_script_timeout(10000000000)
+
+    def measure(driver, kind, count):
+        return driver.execute_script("return test_clock_edges(" + str(count) + ")")
+
+    timings = run_batches(launch, prepare, measure, ['ticks'], repetitions, batch_size, path, restarts, close)['ticks']
+    utility.write_distribution(timings, version, coop, browser)
+    remove(path)
+    return timings
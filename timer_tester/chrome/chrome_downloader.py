@@ -3,14 +3,34 @@ import subprocess
 import sys
 import os
 import argparse
+import shutil
+import tarfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from bs4 import BeautifulSoup
 from urllib.request import urlopen
 ''' chrome_downloader.py - Download and extract available chrome releases.
 Code by Pierre Laperdrix.
+
+Packages are extracted in-process, several at the same time: the ar archive of
+each .deb is read directly, its version is taken from the package metadata
+(control file), and data.tar.xz is decompressed while it is extracted into
+browsers/chrome-<major version>.
 '''
 #                                     VARIABLES                                #
 ZIP_DIR = './zips/'
 BROWSER_DIR = './browsers/'
+WORKERS = os.cpu_count()
+
+AR_MAGIC = b'!<arch>\n'
+AR_HEADER_SIZE = 60
+
+# Compression of the tar members of a package, by file extension.
+COMPRESSIONS = {'.xz': 'xz',
+                '.lzma': 'xz',
+                '.gz': 'gz',
+                '.bz2': 'bz2',
+                '.tar': '',
+                }
 
 #                                     FUNCTIONS                                #
 def download_versions():
@@ -31,26 +51,164 @@ def download_versions():
                 else:
                     subprocess.run("wget --content-disposition -P "+ ZIP_DIR + " 'https://www.slimjet.com/chrome/" + link + "'", shell=True, check=True)
 
-def extract():
+
+class MemberReader:
+    ''' Read-only file-like object over a member of an ar archive. '''
+    def __init__(self, file, offset, size):
+        self.file = file
+        self.offset = offset
+        self.remaining = size
+        self.file.seek(offset)
+
+    def read(self, size = -1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+def read_members(file):
+    ''' List the members of an ar archive (the format of .deb packages).
+
+    Parameters:
+    file(file): The archive, opened in binary mode.
+
+    Returns:
+    dict: For each member name, its offset in the archive and its size.
+    '''
+    if file.read(len(AR_MAGIC)) != AR_MAGIC:
+        raise Exception('Not a .deb package')
+    members = {}
+    offset = len(AR_MAGIC)
+    while True:
+        file.seek(offset)
+        header = file.read(AR_HEADER_SIZE)
+        if len(header) < AR_HEADER_SIZE:
+            break
+        if header[58:60] != b'`\n':
+            raise Exception('Corrupted .deb package')
+        name = header[0:16].decode('ascii').strip().rstrip('/')
+        size = int(header[48:58].decode('ascii'))
+        members[name] = (offset + AR_HEADER_SIZE, size)
+        offset += AR_HEADER_SIZE + size + size % 2 # Members are aligned on 2 bytes.
+    return members
+
+
+def open_tar(file, members, prefix):
+    ''' Open the tar member of a package starting with prefix (control.tar or data.tar) as a stream. '''
+    for (name, (offset, size)) in members.items():
+        if name.startswith(prefix):
+            compression = COMPRESSIONS.get(os.path.splitext(name)[1])
+            if compression is None:
+                raise Exception('Unknown compression for ' + name)
+            return tarfile.open(fileobj=MemberReader(file, offset, size), mode='r|' + compression)
+    raise Exception('No ' + prefix + ' in the package')
+
+
+def read_control(file, members):
+    ''' Read the metadata of a package.
+
+    Parameters:
+    file(file): The package, opened in binary mode.
+    members(dict): Its members (see read_members).
+
+    Returns:
+    dict: The fields of the control file, e.g. 'Package' and 'Version'.
+    '''
+    fields = {}
+    with open_tar(file, members, 'control.tar') as control:
+        for member in control:
+            if os.path.basename(member.name) == 'control':
+                for line in control.extractfile(member).read().decode('utf-8').splitlines():
+                    if ':' in line and not line[0].isspace():
+                        (key, value) = line.split(':', 1)
+                        fields[key.strip()] = value.strip()
+                break
+    return fields
+
+
+def get_major_version(version):
+    ''' Return the major version of a package version, e.g. 86 for 86.0.4240.75-1. '''
+    return int(version.split(':')[-1].split('.')[0])
+
+
+def extract_package(path):
+    ''' Extract the browser of a Chrome package in BROWSER_DIR/chrome-<major version>.
+    The browser is extracted in a temporary folder, renamed once complete.
+
+    Parameters:
+    path(str): The path of the .deb package.
+
+    Returns:
+    int: The major version of the browser, None if it was already extracted.
+    '''
+    with open(path, 'rb') as file:
+        members = read_members(file)
+        control = read_control(file, members)
+        version = get_major_version(control['Version'])
+        destination = BROWSER_DIR + "chrome-" + str(version)
+        if os.path.exists(destination):
+            print("Chrome " + str(version) + " (" + control['Version'] + ") is already unpacked, skipping...")
+            return None
+        tmp_dir = BROWSER_DIR + ".chrome-" + str(version) + "-" + str(os.getpid()) + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        try:
+            with open_tar(file, members, 'data.tar') as data:
+                if hasattr(tarfile, 'tar_filter'):
+                    data.extractall(tmp_dir, filter='tar')
+                else:
+                    data.extractall(tmp_dir)
+            try:
+                os.rename(tmp_dir, destination)
+            except OSError: # Another package of the same version was extracted in the meantime.
+                print("Chrome " + str(version) + " is already unpacked, skipping...")
+                return None
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    print("Chrome " + str(version) + " (" + control['Version'] + ") unpacked")
+    return version
+
+
+def extract(workers = WORKERS):
+    ''' Extract all the packages of ZIP_DIR, several at the same time.
+
+    Parameters:
+    workers(int): Number of packages extracted at the same time.
+    '''
     print("Extracting Chrome")
-    for file in os.listdir(ZIP_DIR):
-        subprocess.run("ar vx {} && mkdir {}chrome-{} && tar -C {}chrome-{} -xJf data.* && rm control.tar.?z "
-                   "data.tar.xz debian-binary "
-                   .format(ZIP_DIR + file, BROWSER_DIR, file[9:11], BROWSER_DIR, file[9:11]), shell=True, check=True)
+    packages = [ZIP_DIR + file for file in sorted(os.listdir(ZIP_DIR)) if file.endswith('.deb')]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = {executor.submit(extract_package, package): package for package in packages}
+        for job in as_completed(jobs):
+            try:
+                job.result()
+            except Exception as e:
+                print("Failed extracting " + jobs[job])
+                print(e)
 
 
-def chrome_downloader():
+def chrome_downloader(workers = WORKERS):
     if not os.path.exists(ZIP_DIR):
         os.mkdir(ZIP_DIR)
     if not os.path.exists(BROWSER_DIR):
         os.mkdir(BROWSER_DIR)
     #download_versions()
-    extract()
+    extract(workers)
 
 
 #                                   MAIN                                       #
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', '--workers', help="Number of packages extracted at the same time.", type=int, default=WORKERS)
+    args = parser.parse_args()
+    return args
+
+
 if __name__ == "__main__":
     if sys.version_info < (3, 0):
         sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
         sys.exit(1)
-    chrome_downloader()
+    args = parse_arguments()
+    chrome_downloader(args.workers)
@@ -1,43 +1,50 @@
 ''' This file downloads all the needed chromedrivers to run available versions.
 As chromedrivers often support 1 or 2 chrome versions, we need to download a lot.
+Each driver version is downloaded once, even if several Chrome versions use it,
+and drivers already downloaded are skipped (see drivers.py).
 '''
 
 
-import subprocess
 import sys
 import os
-import json
-import zipfile
-import stat
+import argparse
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import drivers
+import registry
 
 
-ALL_VERSIONS = [int(folder[-2:]) for folder in os.listdir("./browsers")]
+BROWSER_DIR = os.path.join(drivers.CHROME_DIR, 'browsers')
 
 
-def download_drivers():
-    if not os.path.exists('./chromedrivers'):
-        os.mkdir('./chromedrivers')
-    with open('./bindings.json','r') as json_file:
-        bindings = json.load(json_file)
-    for version in ALL_VERSIONS:
-        driver_version = bindings[str(version)]
-        url = 'https://chromedriver.storage.googleapis.com/' + driver_version + '/chromedriver_linux64.zip'
-        filename = './chromedrivers/chromedriver_' + driver_version + '.zip'
-        subprocess.run("wget --content-disposition -O " + filename + " " + url , shell=True, check=True)
-        try:
-            os.mkdir('./chromedrivers/chromedriver_' + driver_version)
-            with zipfile.ZipFile(filename,"r") as zip_ref:
-                zip_ref.extractall("./chromedrivers/chromedriver_" + driver_version)
-                os.chmod("./chromedrivers/chromedriver_" + driver_version + "/chromedriver",0o744)
+def download_drivers(versions = None, workers = drivers.WORKERS):
+    ''' Download the drivers of the given Chrome versions.
 
-        except Exception as e:
-            print(e)
-        os.remove(filename)
+    Parameters:
+    versions(list(int)): Chrome versions. Default is all versions in ./browsers.
+    workers(int): Number of drivers downloaded at the same time.
+
+    Returns:
+    list(str): The driver versions that could not be downloaded.
+    '''
+    if versions is None:
+        versions = registry.get_versions('chrome', BROWSER_DIR)
+    return drivers.fetch_all(versions, workers)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--version', help="Only download the driver of this Chrome version. Default is all versions in ./browsers.", type=str)
+    parser.add_argument('-w', '--workers', help="Number of drivers downloaded at the same time.", type=int, default=drivers.WORKERS)
+    args = parser.parse_args()
+    return args
 
 
 if __name__ == "__main__":
     if sys.version_info < (3, 0):
         sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
         sys.exit(1)
-    download_drivers()
+    args = parse_arguments()
+    failed = download_drivers([args.version] if args.version else None, args.workers)
+    if failed:
+        sys.exit(1)
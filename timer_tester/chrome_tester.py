@@ -14,20 +14,24 @@ It can run the following tests :
 import json
 from selenium import webdriver
 from selenium.common.exceptions import JavascriptException, WebDriverException
-from selenium.webdriver.chrome.options import Options
 import subprocess
 import os
 import statistics
 import sys
 import argparse
 # Locals:
+import checkpoint
 import config
+import profiles
+import registry
+import resume
+import session
 import utility
 
 
 def get_driver(version):
     ''' Return the path to the chromedriver associated with the version number.
-    You must first download browsers and drivers (see in ./chrome).
+    The driver is taken from the driver cache, and downloaded if missing (see registry.py and drivers.py).
 
     Parameters:
     version(int): Tested version.
@@ -35,8 +39,46 @@ def get_driver(version):
     Returns:
     String: The path to the driver.
     '''
-    driver_version = config.BINDINGS[str(version)]
-    return config.DRIVER_DIR['chrome'] + "chromedriver_" + driver_version + "/chromedriver"
+    return registry.get_driver('chrome', version)
+
+
+def launch_browser(version):
+    ''' Start a version of Chrome with its chromedriver and a copy of the quiet profile (see profiles.py).
+
+    Parameters:
+    version(int): Tested version.
+
+    Returns:
+    webdriver.Chrome: The browser. It must be closed by the caller.
+    '''
+    binary = registry.get_binary('chrome', version)
+    return profiles.launch('chrome', version, lambda: profiles.start_chrome(binary, get_driver(version)))
+
+
+def measure_sab(driver, coop = True):
+    ''' Check the availability of SABs in an open browser.
+
+    Parameters:
+    driver(WebDriver): The browser.
+    coop(bool): True to activate coop/coep, False otherwise.
+
+    Returns:
+    The availability of SABs, 'True' or 'False' (False if the check failed).
+    '''
+    driver.get(utility.get_url('hit_miss', coop))
+    try:
+        return (driver.execute_script("""if (SharedArrayBuffer=='undefined'){return 'False'} else{return 'True'}"""))
+    except Exception as e:
+        return False
+
+
+def write_sab(sab_available, version, coop):
+    stats = {'name': 'SAB availablity',
+             'sab_available': sab_available,
+             'coop': coop,
+             'version': version,
+            }
+    utility.write_results(stats, version, 'chrome')
 
 
 def test_sab(version, coop = True):
@@ -52,32 +94,32 @@ def test_sab(version, coop = True):
         print('COOP/COEP is on.')
     else:
         print('COOP/COEP is off.')
-    options = Options()
-    options.binary_location = config.BROWSER_DIR['chrome'] + "chrome-" +  str(version) + "/opt/google/chrome/google-chrome"
-    driver_address = get_driver(version)
-    with (webdriver.Chrome(driver_address, options = options)) as driver:
-        if coop:
-            driver.get(config.URLS['hit_miss'] + "?coop=True")
-        else:
-            driver.get(config.URLS['hit_miss'])
-        try:
-            sab_available = (driver.execute_script("""if (SharedArrayBuffer=='undefined'){return 'False'} else{return 'True'}"""))
-        except Exception as e:
-            sab_available = False
+    with launch_browser(version) as driver:
+        sab_available = measure_sab(driver, coop)
         driver.close();
 
-    stats = {'name': 'SAB availablity',
-             'sab_available': sab_available,
-             'coop': coop,
-             'version': version,
-            }
-    utility.write_results(stats, version, 'chrome')
+    write_sab(sab_available, version, coop)
     print('SABs available: ' + str(sab_available))
     print('Done')
     print()
 
 
-def test_interpolation_distribution(version, coop = True, repetitions = config.REPETITIONS):
+def measure_distribution(driver, coop = True, repetitions = config.REPETITIONS):
+    ''' Measure the number of incrementations in clock periods in an open browser.
+
+    Parameters:
+    driver(WebDriver): The browser.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements.
+
+    Returns:
+    list(int): The number of incrementations for each clock period.
+    '''
+    driver.get(utility.get_url('distribution', coop))
+    return driver.execute_script("return test_clock_edges(" + str(repetitions) + ")")
+
+
+def test_interpolation_distribution(version, coop = True, repetitions = config.REPETITIONS, batch_size = None):
     ''' Test repeatedly the number of maximum incrementations in a clock edge.
     This gives indication of both resolution (average number of incrementations)
     and jitter (variance of the number of ticks).
@@ -88,24 +130,27 @@ def test_interpolation_distribution(version, coop = True, repetitions = config.R
     version(int): Tested version
     coop(bool): True to activate coop/coep, False otherwise.
     repetitions(int): The number of measurements. Default is set in config file.
+    batch_size(int): If set, measure in batches saved as they come, and resume from the last saved batch after a crash (see checkpoint.py).
     '''
     print('Testing the number of ticks in a clock period on Chrome ' + str(version) + ", " + str(repetitions) + ' repetitions.')
     if coop:
         print('COOP/COEP is on.')
     else:
         print('COOP/COEP is off.')
-    options = Options()
-    options.binary_location = config.BROWSER_DIR['chrome'] + "chrome-" +  str(version) + "/opt/google/chrome/google-chrome"
-    driver_address = get_driver(version)
+    if batch_size:
+        try:
+            checkpoint.stream_distribution(lambda: launch_browser(version), 'chrome', version, coop, repetitions, batch_size)
+        except Exception as e:
+            print('Something went wrong, the measurements done are kept for the next run.')
+            print(e)
+        print('Done')
+        print()
+        return
     timings = {'Failed'}
     try:
-        with (webdriver.Chrome(driver_address, options = options)) as driver:
-            if coop:
-                driver.get(config.URLS['distribution'] + "?coop=True")
-            else:
-                driver.get(config.URLS['distribution'])
+        with launch_browser(version) as driver:
             try:
-                timings = driver.execute_script("return test_clock_edges(" + str(repetitions) + ")")
+                timings = measure_distribution(driver, coop, repetitions)
             except:
                 print('Failed executing script.')
             driver.close();
@@ -113,17 +158,32 @@ def test_interpolation_distribution(version, coop = True, repetitions = config.R
         print('Something went wrong when starting the browser.')
         print(e)
     if timings != {'Failed'}:
-        stats = utility.get_stats(timings)
-        stats['name'] = 'Tick distibution'
-        stats['version'] = version
-        stats['coop'] = coop
-        utility.write_results(stats, version, 'chrome')
+        utility.write_distribution(timings, version, coop, 'chrome')
     else:
         print('Something went wrong.')
     print('Done')
     print()
 
-def test_hits_misses(version, clock_method, coop = True, repetitions = config.REPETITIONS):
+
+def measure_hits_misses(driver, clock_method, coop = True, repetitions = config.REPETITIONS):
+    ''' Measure the access time of cache hits and misses in an open browser.
+    This raises an exception if the clock is unavailable.
+
+    Parameters:
+    driver(WebDriver): The browser.
+    clock_method(string): Which clock to use. Can be 'SharedArrayBuffer' or 'performance.now'.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements.
+
+    Returns:
+    dict: The hit timings and miss timings, under 'hits' and 'misses'.
+    '''
+    driver.get(utility.get_url('hit_miss', coop))
+    driver.set_script_timeout(10000000000)
+    return driver.execute_script("return getHitMiss('" + clock_method + "'," +  str(repetitions) + ")")
+
+
+def test_hits_misses(version, clock_method, coop = True, repetitions = config.REPETITIONS, batch_size = None):
     ''' Compute the access time of cache hits and misses for a specific clock.
     This method can take a while to run, especially with a lot of repetitions or
     a huge cache.
@@ -137,25 +197,27 @@ def test_hits_misses(version, clock_method, coop = True, repetitions = config.RE
     clock_method(string): Which clock to use. Can be 'SharedArrayBuffer' or 'performance.now'.
     coop(bool): True to activate coop/coep, False otherwise.
     repetitions(int): The number of measurements. Default is set in config file.
+    batch_size(int): If set, measure in batches saved as they come, and resume from the last saved batch after a crash (see checkpoint.py).
     '''
     print('Testing hits/misses on Chrome ' + str(version) + " with " + clock_method + ", " + str(repetitions) + ' repetitions.')
     if coop:
         print('COOP/COEP is on.')
     else:
         print('COOP/COEP is off.')
-    options = Options()
-    options.binary_location = config.BROWSER_DIR['chrome'] + "chrome-" +  str(version) + "/opt/google/chrome/google-chrome"
-    driver_address = get_driver(version)
-    timings = {'Failed'}
+    if batch_size:
+        try:
+            checkpoint.stream_hits_misses(lambda: launch_browser(version), 'chrome', version, clock_method, coop, repetitions, batch_size)
+        except Exception as e: # This exception occurs when we try to access to SABs without coop/coep on later versions.
+            print(e)
+            print('SABs are not available here, skipping')
+            return
+        print('Done')
+        print()
+        return
     results = {}
-    with (webdriver.Chrome(driver_address, options = options)) as driver:
-        if coop:
-            driver.get(config.URLS['hit_miss'] + "?coop=True")
-        else:
-            driver.get(config.URLS['hit_miss'])
+    with launch_browser(version) as driver:
         try:
-            driver.set_script_timeout(10000000000)
-            results = driver.execute_script("return getHitMiss('" + clock_method + "'," +  str(repetitions) + ")") #This might fail if SABs are unavailable so we set a try
+            results = measure_hits_misses(driver, clock_method, coop, repetitions) #This might fail if SABs are unavailable so we set a try
         except Exception as e: # This exception occurs when we try to access to SABs without coop/coep on later versions.
             print(e)
             print('SABs are not available here, skipping')
@@ -166,21 +228,7 @@ def test_hits_misses(version, clock_method, coop = True, repetitions = config.RE
         print('Something went wrong, skipping')
         return
 
-    stat_hits = utility.get_stats(results['hits'])
-    stat_hits['name'] = 'hit/miss'
-    stat_hits['clock_method'] = clock_method
-    stat_hits['hit/miss'] = 'hits'
-    stat_hits['version'] = version
-    stat_hits['coop'] = coop
-    utility.write_results(stat_hits, version, 'chrome')
-
-    stat_misses = utility.get_stats(results['misses'])
-    stat_misses['name'] = 'hit/miss'
-    stat_misses['clock_method'] = clock_method
-    stat_misses['hit/miss'] = 'misses'
-    stat_misses['version'] = version
-    stat_misses['coop'] = coop
-    utility.write_results(stat_misses, version, 'chrome')
+    utility.write_hits_misses(results, version, clock_method, coop, 'chrome')
     print('Done')
     print()
 
@@ -207,14 +255,12 @@ def test_rdtsc(coop = True, repetitions = config.REPETITIONS):
         print('Skipping...')
         return
     results = {}
-    options = Options()
-    options.binary_location = config.RDTSC_EXEC['chrome']
-    driver_address = get_driver('rdtsc')
-    with (webdriver.Chrome(driver_address, options = options)) as driver:
+    with profiles.launch('chrome', 'rdtsc', lambda: profiles.start_chrome(config.RDTSC_EXEC['chrome'], get_driver('rdtsc'))) as driver:
         if coop:
             driver.get(config.URLS['rdtsc'] + "?coop=True")
         else:
             driver.get(config.URLS['rdtsc'])
+        driver.set_script_timeout(10000000000)
         results = driver.execute_script("return getTimerMeasurements("+ str(repetitions) + ")")
         driver.close();
     results['name'] = 'rdtsc'
@@ -224,6 +270,90 @@ def test_rdtsc(coop = True, repetitions = config.REPETITIONS):
     print()
 
 
+#                                CAMPAIGN                                      #
+
+def select_versions(version = None):
+    ''' Select the versions to test.
+
+    Parameters:
+    version(int): A specific version, or None for all available versions.
+
+    Returns:
+    list(int): The versions to test. Exits if the requested version is not supported.
+    '''
+    if version:
+        if version in registry.get_versions('chrome') and version not in config.BUGGY['chrome']:
+            return [version]
+        print('Only support versions later than 57')
+        sys.exit(1)
+    return [version for version in registry.get_versions('chrome') if version not in config.BUGGY['chrome']]
+
+def run_session(version, tests, coop = True, repetitions = config.REPETITIONS, batch_size = None, todo = None):
+    ''' Run a set of tests on a version, sharing a single browser between tests.
+
+    Parameters:
+    version(int): Tested version
+    tests(list(str)): Tests to run, among utility.TESTS.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements. Default is set in config file.
+    batch_size(int): If set, measure in batches saved as they come (see checkpoint.py).
+    todo(dict): The measurements still to do by step, see resume.py. Default is every step of tests, with all repetitions.
+
+    Returns:
+    dict: For each test, its wall time in seconds and its error (None if it succeeded).
+    '''
+    if todo is None:
+        todo = resume.get_todo(tests, repetitions)
+    steps = []
+    if 'sab' in todo:
+        steps.append(('sab', lambda driver: write_sab(measure_sab(driver, coop), version, coop)))
+    if 'distribution' in todo:
+        if batch_size:
+            steps.append(('distribution', lambda driver, repetitions = todo['distribution']:
+                          checkpoint.stream_distribution(lambda: driver, 'chrome', version, coop, repetitions, batch_size, restarts = 0, close = False)))
+        else:
+            steps.append(('distribution', lambda driver, repetitions = todo['distribution']:
+                          utility.write_distribution(measure_distribution(driver, coop, repetitions), version, coop, 'chrome')))
+    for clock_method in resume.CLOCK_METHODS:
+        if 'hit_miss ' + clock_method not in todo:
+            continue
+        if batch_size:
+            steps.append(('hit_miss ' + clock_method, lambda driver, clock_method = clock_method, repetitions = todo['hit_miss ' + clock_method]:
+                          checkpoint.stream_hits_misses(lambda: driver, 'chrome', version, clock_method, coop, repetitions, batch_size, restarts = 0, close = False)))
+        else:
+            steps.append(('hit_miss ' + clock_method, lambda driver, clock_method = clock_method, repetitions = todo['hit_miss ' + clock_method]:
+                          utility.write_hits_misses(measure_hits_misses(driver, clock_method, coop, repetitions), version, clock_method, coop, 'chrome')))
+    print('Running ' + ', '.join(name for (name, _) in steps) + ' on Chrome ' + str(version) + ' in a single session.')
+    return session.run_session(lambda: launch_browser(version), steps)
+
+
+def run_tests(version, tests, coop = True, repetitions = config.REPETITIONS, single_session = False, batch_size = None, todo = None):
+    ''' Run a set of tests on a version.
+
+    Parameters:
+    version(int): Tested version
+    tests(list(str)): Tests to run, among utility.TESTS.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements. Default is set in config file.
+    single_session(bool): Share one browser between tests (see run_session).
+    batch_size(int): If set, measure in batches saved as they come (see checkpoint.py).
+    todo(dict): The measurements still to do by step, see resume.py. Default is every step of tests, with all repetitions.
+    '''
+    print("Evaluating version " + str(version))
+    if todo is None:
+        todo = resume.get_todo(tests, repetitions)
+    if single_session:
+        run_session(version, tests, coop, repetitions, batch_size, todo)
+        return
+    if 'sab' in todo:
+        test_sab(version, coop)
+    if 'distribution' in todo:
+        test_interpolation_distribution(version, coop, todo['distribution'], batch_size)
+    for clock_method in resume.CLOCK_METHODS:
+        if 'hit_miss ' + clock_method in todo:
+            test_hits_misses(version, clock_method, coop, todo['hit_miss ' + clock_method], batch_size)
+
+
 def parse_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument('-v', '--version', help='Use a specific version. By default, runs all versions available. Some of them do not run.', type=int)
@@ -233,6 +363,12 @@ def parse_arguments():
     parser.add_argument('--distribution', help='Evaluates the number of incrementation per clock period.', action='store_true',default=False)
     parser.add_argument('--hit_miss', help='Evalueate timings for cache hits and misses. This can take a while.', action='store_true',default=False)
     parser.add_argument('--rdtsc', help='Run performance.rdtsc tests. You need to set the path of you custom chrome in the config file.', action='store_true',default=False)
+    parser.add_argument('--npy', help='Store measurement values as binary .npy files instead of json.', action='store_true',default=False)
+    parser.add_argument('--sketch', help='Only store summaries (sketches) of tick distribution and rdtsc values, see sketch.py.', action='store_true',default=False)
+    parser.add_argument('--session', help='Run all tests of a version in a single browser session.', action='store_true',default=False)
+    parser.add_argument('--batch', help='Measure in batches of this size, saved as they come, to resume interrupted runs.', type=int)
+    parser.add_argument('--resume', help='Only run the tests and measurements missing from the stored results.', action='store_true',default=False)
+    parser.add_argument('--display', help='Show browsers in a window, run them headless, or on a virtual display (Xvfb).', choices=['window', 'headless', 'xvfb'], default=config.DISPLAY)
 
     #parser.add_argument('--clean', help='Delete former result files. Default is false')
     args = parser.parse_args()
@@ -246,19 +382,15 @@ def main(args):
         print('You have not specified a number of repetitions. Using config.')
         repetitions = config.REPETITIONS
     print('Number of measurements : '+str(repetitions))
-
-    if args.version:
-        if args.version in config.ALL_VERSIONS['chrome'] and args.version not in config.BUGGY['chrome']:
-            versions = [args.version]
-        else:
-            print('Only support versions later than 57')
-            sys.exit(1)
-    else:
+    if args.npy:
+        config.VALUES_FORMAT = 'npy'
+    if args.sketch:
+        config.VALUES_FORMAT = 'sketch'
+    config.DISPLAY = args.display
+
+    versions = select_versions(args.version)
+    if not args.version:
         print('Running tests on all available versions.')
-        versions = []
-        for version in config.ALL_VERSIONS['chrome']:
-            if version not in config.BUGGY['chrome']:
-                versions.append(version)
 
     if args.coop:
         print('Using coop for tests.')
@@ -271,27 +403,12 @@ def main(args):
         test_rdtsc(coop = coop, repetitions = repetitions) # Since rdtsc does not require a version, we treat it differently - you can't run rdtsc and the others in the same run.
         #TODO: Maybe improve the CLI.
     else:
-
-        if ( not (args.sab) or (args.hit_miss=='False') or (args.distribution=='False')):
-            print("You have not specified tests, running sab availability, distribution and hit_miss")
-            for version in versions:
-                print("Evaluating version " + str(version))
-                test_sab(version, coop)
-                test_interpolation_distribution(version, coop, repetitions)
-                test_hits_misses(version, 'SharedArrayBuffer', coop , repetitions)
-                test_hits_misses(version, 'performance.now', coop , repetitions)
-        else:
-            print(args)
-            if args.sab:
-                for version in versions:
-                    test_sab(version, coop)
-            if args.distribution:
-                for version in versions:
-                    test_interpolation_distribution(version, coop, repetitions)
-            if args.hit_miss:
-                for version in versions:
-                    test_hits_misses(version, 'SharedArrayBuffer', coop , repetitions)
-                    test_hits_misses(version, 'performance.now', coop , repetitions)
+        tests = utility.get_tests(args)
+        if args.resume:
+            remaining = resume.plan('chrome', versions, tests, coop, repetitions)
+            versions = [version for version in versions if remaining[version]]
+        for version in versions:
+            run_tests(version, tests, coop, repetitions, args.session, args.batch, remaining[version] if args.resume else None)
 
 if __name__ == '__main__':
     if sys.version_info < (3, 0):
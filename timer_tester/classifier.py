@@ -0,0 +1,240 @@
+#!usr/bin/python3
+''' Tools to compare a distribution-aware attacker with the averaging one of error_rate_repetitions.py.
+Instead of averaging repetitions and comparing the average to a threshold, the
+attacker learns the distributions of hit and miss timings (histograms of training
+measurements), and classifies a group of repetitions by the sum of the log-likelihood
+ratios of its timings: positive for a miss, negative for a hit.
+
+Both attackers are evaluated with cross-validation: measurements are split in
+folds of consecutive timings, each fold is classified by an attacker trained on the
+other folds (the likelihoods, or the best threshold of every repetition count),
+and the error rates of the folds are averaged. Folds are evaluated in parallel,
+and every repetition count is evaluated at once (see get_block_means).
+'''
+# Imports :
+import csv
+import os
+import sys
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Locals:
+import config
+import error_rate_repetitions
+import histogram
+import results_store
+
+
+FOLDS = 5
+MAX_BINS = 1000
+SMOOTHING = 1 # Added to the count of every bin, so that unseen timings do not give infinite ratios.
+
+
+''' Learns the log-likelihood ratio of a miss against a hit for every timing.
+Timings are binned by 1 if they span less than MAX_BINS values, otherwise in MAX_BINS bins.
+
+Parameters:
+hits(np.ndarray): Training hit timings.
+misses(np.ndarray): Training miss timings.
+
+Returns:
+(Histogram, np.ndarray) The histogram of the training timings, and the log-likelihood ratio of each of its bins.
+'''
+def get_likelihoods(hits, misses):
+    (low, high) = (min(np.min(hits), np.min(misses)), max(np.max(hits), np.max(misses)))
+    step = max(1, (high - low) / MAX_BINS)
+    hist = histogram.Histogram(low, high, step)
+    hist.add('hits', hits)
+    hist.add('misses', misses)
+    bins = len(hist.edges) - 1
+    hit_likelihoods = (hist.counts['hits'] + SMOOTHING) / (hist.totals['hits'] + SMOOTHING * bins)
+    miss_likelihoods = (hist.counts['misses'] + SMOOTHING) / (hist.totals['misses'] + SMOOTHING * bins)
+    return (hist, np.log(miss_likelihoods) - np.log(hit_likelihoods))
+
+
+''' Return the log-likelihood ratio of timings. Timings out of the training range take the ratio of the closest bin.
+
+Parameters:
+timings(np.ndarray): The timings.
+hist(Histogram): The histogram of the training timings (see get_likelihoods).
+ratios(np.ndarray): The log-likelihood ratio of each bin.
+
+Returns:
+(np.ndarray) The log-likelihood ratio of each timing.
+'''
+def get_scores(timings, hist, ratios):
+    bins = np.floor((np.asarray(timings, dtype=np.float64) - hist.min_value) / hist.step).astype(np.int64)
+    return ratios[np.clip(bins, 0, len(ratios) - 1)]
+
+
+''' Computes the error rate of every repetition count, for groups classified by a score.
+A group is a miss if its mean score is above the threshold of its repetition count, a hit otherwise.
+Unlike sweep_segments, groups equal to the threshold are not left out: an attacker has to decide,
+so with few repetitions of integer timings, averaging errors are higher than in error_rate_repetitions.py.
+
+Parameters:
+hit_scores(np.ndarray): Scores of the hits, averaged by groups (see get_block_means).
+hit_reps(np.ndarray): Repetition count of each hit group.
+miss_scores(np.ndarray): Scores of the misses, averaged by groups.
+miss_reps(np.ndarray): Repetition count of each miss group.
+thresholds(np.ndarray): Threshold of each repetition count.
+count(int): Number of repetition counts.
+
+Returns:
+(np.ndarray) The error rate of each repetition count.
+'''
+def get_group_errors(hit_scores, hit_reps, miss_scores, miss_reps, thresholds, count):
+    false_misses = np.bincount(hit_reps, weights=hit_scores > thresholds[hit_reps], minlength=count)
+    false_hits = np.bincount(miss_reps, weights=miss_scores <= thresholds[miss_reps], minlength=count)
+    return (false_hits / np.bincount(miss_reps, minlength=count) + false_misses / np.bincount(hit_reps, minlength=count)) / 2
+
+
+''' Trains both attackers on some folds and evaluates them on another one (run in a worker process).
+
+Parameters:
+train_hits(np.ndarray): Training hit timings.
+train_misses(np.ndarray): Training miss timings.
+test_hits(np.ndarray): Tested hit timings.
+test_misses(np.ndarray): Tested miss timings.
+clock_method(str): Used clock. We need it to take into account the difference for interpolated clocks.
+reps(np.ndarray): The numbers of repetitions.
+
+Returns:
+(np.ndarray, np.ndarray) For each repetition count, the error rate of the likelihood attacker and of the averaging one.
+'''
+def evaluate_fold(train_hits, train_misses, test_hits, test_misses, clock_method, reps):
+    count = len(reps)
+    # Likelihood ratio: the sum of the ratios of a group has the sign of their mean.
+    (hist, ratios) = get_likelihoods(train_hits, train_misses)
+    (hit_scores, hit_reps) = error_rate_repetitions.get_block_means(get_scores(test_hits, hist, ratios), reps)
+    (miss_scores, miss_reps) = error_rate_repetitions.get_block_means(get_scores(test_misses, hist, ratios), reps)
+    likelihood_errors = get_group_errors(hit_scores, hit_reps, miss_scores, miss_reps, np.zeros(count), count)
+
+    # Averaging: best threshold of every repetition count on the training folds.
+    (train_hit_avg, train_hit_reps) = error_rate_repetitions.get_block_means(train_hits, reps)
+    (train_miss_avg, train_miss_reps) = error_rate_repetitions.get_block_means(train_misses, reps)
+    (thresholds, _) = error_rate_repetitions.sweep_segments(np.concatenate((train_hit_avg, train_miss_avg)),
+                                                            np.concatenate((np.zeros(len(train_hit_avg), dtype=bool), np.ones(len(train_miss_avg), dtype=bool))),
+                                                            np.concatenate((train_hit_reps, train_miss_reps)), clock_method)
+    (hit_avg, hit_reps) = error_rate_repetitions.get_block_means(test_hits, reps)
+    (miss_avg, miss_reps) = error_rate_repetitions.get_block_means(test_misses, reps)
+    if clock_method == 'performance.now': # Interpolation makes everything backward: misses count less.
+        (hit_avg, miss_avg, thresholds) = (-hit_avg, -miss_avg, -thresholds)
+    averaging_errors = get_group_errors(hit_avg, hit_reps, miss_avg, miss_reps, thresholds, count)
+    return (likelihood_errors, averaging_errors)
+
+
+''' Computes the cross-validated error rate of both attackers for every number of repetitions up to max_rep.
+
+Parameters:
+hits(list[int]): Hit timings.
+misses(list[int]): Miss timings.
+clock_method(str): Used clock. We need it to take into account the difference for interpolated clocks.
+max_rep(int): Repetition counts go from 1 to max_rep - 1.
+folds(int): Number of folds.
+workers(int): Number of folds evaluated at the same time. Default is the number of cores, 1 evaluates them in this process.
+
+Returns:
+(dict): For each number of repetitions, the error rate of the likelihood attacker and of the averaging one.
+'''
+def compare(hits, misses, clock_method, max_rep = error_rate_repetitions.MAX_REP, folds = FOLDS, workers = None):
+    hits = np.asarray(hits, dtype=np.float64)
+    misses = np.asarray(misses, dtype=np.float64)
+    reps = np.arange(1, min(min(len(hits), len(misses)) // folds, max_rep))
+    if len(reps) == 0:
+        return {}
+    hit_folds = np.array_split(hits, folds)
+    miss_folds = np.array_split(misses, folds)
+    arguments = ([np.concatenate(hit_folds[:fold] + hit_folds[fold + 1:]) for fold in range(folds)],
+                 [np.concatenate(miss_folds[:fold] + miss_folds[fold + 1:]) for fold in range(folds)],
+                 hit_folds, miss_folds, [clock_method] * folds, [reps] * folds)
+    if workers == 1:
+        errors = list(map(evaluate_fold, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            errors = list(executor.map(evaluate_fold, *arguments))
+    likelihood_errors = np.mean([fold_errors[0] for fold_errors in errors], axis=0)
+    averaging_errors = np.mean([fold_errors[1] for fold_errors in errors], axis=0)
+    return {int(rep): (float(likelihood), float(averaging)) for (rep, likelihood, averaging) in zip(reps, likelihood_errors, averaging_errors)}
+
+
+''' Return the smallest number of repetitions reaching an error rate for each attacker.
+
+Parameters:
+comparison(dict): The error rates of both attackers, see compare.
+target_error(float): The error rate to reach.
+
+Returns:
+(int, int) The repetitions needed by the likelihood attacker and by the averaging one, None if not reached.
+'''
+def get_min_reps(comparison, target_error):
+    needed = []
+    for attacker in (0, 1):
+        reached = [rep for rep in comparison if comparison[rep][attacker] <= target_error]
+        needed.append(min(reached) if reached else None)
+    return tuple(needed)
+
+
+#                                   DISPLAY                                    #
+def get_csv_path(browser, version, clock_method, coop):
+    ''' Return the path of the csv file of a version and clock. '''
+    return config.CSV_DIR[browser] + 'classifier-' + browser + '-' + str(version) + '-' + clock_method + '-coop-' + str(coop) + '.csv'
+
+def comparison_csv(comparison, output):
+    ''' Write the error rates of both attackers in percent, one line per number of repetitions. '''
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output,'w') as file:
+        writer = csv.writer(file,delimiter=' ')
+        writer.writerow( ('repetition','likelihood','average') )
+        for rep in comparison:
+            writer.writerow( (rep, comparison[rep][0]*100, comparison[rep][1]*100) )
+
+def plot_comparison(comparison):
+    import plotly.graph_objects as go
+    reps = list(comparison.keys())
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=reps, y=[comparison[rep][0] for rep in reps], name='log-likelihood ratio'))
+    fig.add_trace(go.Scatter(x=reps, y=[comparison[rep][1] for rep in reps], name='average and threshold'))
+    fig.show()
+
+
+#                                     MAIN                                     #
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--browser', help='Use a specific browser.', type=str, default='firefox')
+    parser.add_argument('-v', '--version', help='Use a specific version.', type=int, default=81)
+    parser.add_argument('--clock', help='Use a specific clock method', type=str, default='performance.now')
+    parser.add_argument('-c', '--coop', help = 'Use results with COOP and COEP. Default is off.', action='store_true',default=False)
+    parser.add_argument('-p', '--plot', help = 'Plot the error rates of both attackers', action='store_true',default=False)
+    parser.add_argument('--csv', help = 'Create csv file (for latex)', action='store_true',default=False)
+    parser.add_argument('--max_rep', help = 'Maximal number of repetitions', type=int, default=error_rate_repetitions.MAX_REP)
+    parser.add_argument('-k', '--folds', help = 'Number of cross-validation folds', type=int, default=FOLDS)
+    parser.add_argument('-t', '--target', help = 'Target error rate, in percent.', type=float, default=5)
+    parser.add_argument('-w', '--workers', help = 'Number of folds evaluated at the same time. Default is the number of cores.', type=int, default=None)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
+        sys.exit(1)
+    args = parse_arguments()
+    (hits, misses) = results_store.load_hits_misses(args.browser, args.version, args.clock, args.coop)
+    comparison = compare(hits, misses, args.clock, args.max_rep, args.folds, args.workers)
+    if comparison == {}:
+        print('Not enough results found for ' + args.browser + ' ' + str(args.version) + ' ' + args.clock + ' and COOP/COEP:' +str(args.coop))
+        sys.exit(1)
+    (likelihood_reps, averaging_reps) = get_min_reps(comparison, args.target / 100)
+    print('Repetitions to reach ' + str(args.target) + '% of errors: ' + str(likelihood_reps) + ' with log-likelihood ratios, '
+          + str(averaging_reps) + ' with averages and a threshold.')
+    if likelihood_reps is not None and averaging_reps is not None:
+        # Every measurement takes the same time (see throughput.py), so the attack time scales with the repetitions.
+        print('Attack time per guess: ' + str(round(100 * likelihood_reps / averaging_reps, 1)) + '% of the averaging attacker.')
+    if args.csv:
+        comparison_csv(comparison, get_csv_path(args.browser, args.version, args.clock, args.coop))
+    if args.plot:
+        plot_comparison(comparison)
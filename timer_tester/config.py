@@ -1,17 +1,19 @@
 #!usr/bin/python3
 
 
-from os import listdir
-
-
 REPETITIONS = 1000
 
 BASE_URL = 'http://localhost:8000'
 
-URLS = {'hit_miss': BASE_URL + '/hit_miss',
-        'distribution': BASE_URL + '/distribution',
-        'rdtsc': BASE_URL + '/rdtsc',
-        }
+def get_urls(base_url):
+    return {'hit_miss': base_url + '/hit_miss',
+            'distribution': base_url + '/distribution',
+            'rdtsc': base_url + '/rdtsc',
+            }
+
+URLS = get_urls(BASE_URL)
+
+SERVER_DIR = '../server/'
 
 BROWSER_DIR = {'firefox' : './firefox/browsers/',
                'chrome' : './chrome/browsers/',
@@ -27,7 +29,31 @@ CSV_DIR = {'firefox' : './firefox/csv/',
               }
 
 
-DRIVER_DIR = {'chrome': './chrome/chromedrivers/'}
+# How measurement values (hits, misses, ticks, rdtsc cycles) are stored:
+# 'json' keeps them in the result files, 'npy' writes them as binary .npy files
+# next to the result files, which are memory-mapped when read.
+# 'sketch' only keeps a mergeable summary (see sketch.py) of the results listed
+# in SKETCH_RESULTS, other values are kept in json. Hit/miss values are never
+# sketched, as error rates need the measurements themselves.
+VALUES_FORMAT = 'json'
+
+SKETCH_RESULTS = ['Tick distibution', 'rdtsc']
+
+# Arrays gathered by the analysis scripts are cached there (see cache.py), up to CACHE_SIZE bytes.
+# Set CACHE_SIZE to 0 to disable the cache.
+CACHE_DIR = './cache/'
+CACHE_SIZE = 4 * 2**30
+
+
+# Templates of the quiet browser profiles, cloned for every launch (see profiles.py).
+PROFILE_DIR = {'firefox' : './firefox/profiles/',
+               'chrome' : './chrome/profiles/',
+              }
+
+# How browsers are displayed: 'window' on the current display, 'headless',
+# or 'xvfb' for a window on a virtual display started by the testers.
+DISPLAY = 'window'
+
 
 FIREFOX_DRIVER = './firefox/driver/'
 
@@ -36,9 +62,5 @@ SUPPORTED_BROWSERS = ['firefox','chrome','tor']
 RDTSC_EXEC = {'firefox': '',
               'chrome': ''}
 
-ALL_VERSIONS = {'firefox': [int(folder[-2:]) for folder in listdir(BROWSER_DIR['firefox'])],
-                'chrome': [int(folder[-2:]) for folder in listdir(BROWSER_DIR['chrome'])]}
-
-BINDINGS = {'48': '2.24', '49': '2.24', '50': '2.24', '51': '2.24', '52': '2.24', '53': '2.26', '54': '2.27', '55': '2.28', '56': '2.29', '57': '2.29', '58': '2.31', '59': '2.32', '60': '2.33', '61': '2.34', '62': '2.35', '63': '2.36', '64': '2.37', '65': '2.38', '66': '2.40', '67': '2.41', '68': '2.42', '69': '2.44', '70': '2.45', '71': '2.46', '72': '2.46', '73': '73.0.3683.68', '74': '74.0.3729.6', '75': '75.0.3770.140', '76': '76.0.3809.126', '77': '77.0.3865.40', '78': '78.0.3904.105', '79': '79.0.3945.36', '80': '80.0.3987.106', '81': '81.0.4044.138', '83': '83.0.4103.39', '84': '84.0.4147.30', '85': '85.0.4183.87', '86': '86.0.4240.22', 'rdtsc':'84.0.4147.30'}
 
 BUGGY = {'chrome' : [61,65,66,67,68,72,73,77]}
@@ -0,0 +1,158 @@
+#!usr/bin/python3
+''' Cache of the ChromeDrivers, by driver version.
+A ChromeDriver only supports one or two Chrome versions, and chrome/bindings.json
+gives the driver of each Chrome version. Several Chrome versions share the same
+driver (e.g. 2.24 for 48 to 52), so drivers are stored once per driver version,
+in chrome/chromedrivers/chromedriver_<driver version>/.
+A driver is downloaded only if it is missing, and checked after unpacking by
+running it with --version.
+
+Paths are relative to this file, so the cache is the same whatever the working directory.
+'''
+# Imports :
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.request import urlopen
+
+
+CHROME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chrome')
+BINDINGS_PATH = os.path.join(CHROME_DIR, 'bindings.json')
+DRIVER_DIR = os.path.join(CHROME_DIR, 'chromedrivers')
+URL = 'https://chromedriver.storage.googleapis.com/{}/chromedriver_linux64.zip'
+WORKERS = 8
+
+bindings = None
+
+
+def get_bindings():
+    ''' Return the driver version of each Chrome version (read once from bindings.json).
+
+    Returns:
+    dict: The driver version by Chrome version, as strings ('rdtsc' for the custom Chromium).
+    '''
+    global bindings
+    if bindings is None:
+        with open(BINDINGS_PATH, 'r') as json_file:
+            bindings = json.load(json_file)
+    return bindings
+
+
+def get_driver_version(version):
+    ''' Return the version of the driver of a Chrome version.
+
+    Parameters:
+    version(int or str): Chrome version, or 'rdtsc'.
+
+    Returns:
+    String: The driver version.
+    '''
+    driver_version = get_bindings().get(str(version))
+    if driver_version is None:
+        raise Exception('No ChromeDriver known for Chrome ' + str(version) + ', add it to ' + BINDINGS_PATH)
+    return driver_version
+
+
+def get_driver_path(driver_version):
+    ''' Return the path of the executable of a driver version in the cache. '''
+    return os.path.join(DRIVER_DIR, 'chromedriver_' + driver_version, 'chromedriver')
+
+
+def is_valid(path, driver_version):
+    ''' Check that a driver runs and has the expected version.
+
+    Parameters:
+    path(str): Path of the driver executable.
+    driver_version(str): Expected version.
+
+    Returns:
+    bool: True if the driver answers to --version with driver_version.
+    '''
+    if not os.access(path, os.X_OK):
+        return False
+    try:
+        output = subprocess.run([path, '--version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30).stdout
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return ('ChromeDriver ' + driver_version).encode() in output
+
+
+def fetch(driver_version):
+    ''' Download and unpack a driver, unless it is already in the cache.
+    The driver is unpacked in a temporary folder, which replaces the cached
+    folder only once the archive and the driver are checked.
+
+    Parameters:
+    driver_version(str): The driver version.
+
+    Returns:
+    bool: True if the driver was downloaded, False if it was already there.
+    '''
+    path = get_driver_path(driver_version)
+    if is_valid(path, driver_version):
+        return False
+    os.makedirs(DRIVER_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=DRIVER_DIR)
+    try:
+        archive_path = os.path.join(tmp_dir, 'chromedriver_linux64.zip')
+        with urlopen(URL.format(driver_version)) as response, open(archive_path, 'wb') as archive:
+            shutil.copyfileobj(response, archive)
+        with zipfile.ZipFile(archive_path, 'r') as archive:
+            if archive.testzip() is not None:
+                raise Exception('Corrupted archive for ChromeDriver ' + driver_version)
+            archive.extract('chromedriver', tmp_dir)
+        os.remove(archive_path)
+        os.chmod(os.path.join(tmp_dir, 'chromedriver'), 0o755)
+        if not is_valid(os.path.join(tmp_dir, 'chromedriver'), driver_version):
+            raise Exception('ChromeDriver ' + driver_version + ' does not run')
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        os.rename(tmp_dir, os.path.dirname(path))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return True
+
+
+def fetch_all(versions, workers = WORKERS):
+    ''' Get the drivers of several Chrome versions, each driver version once, several at the same time.
+
+    Parameters:
+    versions(list): Chrome versions.
+    workers(int): Number of drivers downloaded at the same time.
+
+    Returns:
+    list(str): The driver versions that could not be fetched.
+    '''
+    driver_versions = sorted({get_driver_version(version) for version in versions})
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        jobs = {executor.submit(fetch, driver_version): driver_version for driver_version in driver_versions}
+        for job in as_completed(jobs):
+            driver_version = jobs[job]
+            try:
+                if job.result():
+                    print('ChromeDriver ' + driver_version + ' downloaded')
+                else:
+                    print('ChromeDriver ' + driver_version + ' is already there, skipping...')
+            except Exception as e:
+                print('Failed fetching ChromeDriver ' + driver_version)
+                print(e)
+                failed.append(driver_version)
+    return failed
+
+
+def get_driver(version):
+    ''' Return the path to the driver of a Chrome version, downloading it if it is not in the cache.
+
+    Parameters:
+    version(int or str): Chrome version, or 'rdtsc'.
+
+    Returns:
+    String: The path to the driver.
+    '''
+    driver_version = get_driver_version(version)
+    fetch(driver_version)
+    return get_driver_path(driver_version)
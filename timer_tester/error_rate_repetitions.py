@@ -10,13 +10,18 @@ import plotly.graph_objects as go
 import sys
 import argparse
 import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 # Locals:
 import config
+import results_store
 import utility
 
 
 MAX_REP = 50
+RESAMPLES = 1000
+CHUNK_SIZE = 2**22 # Averaged timings swept at once by a bootstrap chunk (a few hundred MB of memory).
 
 
 ''' Computes the false hit rate.
@@ -36,14 +41,13 @@ Returns:
 (int) The false hit rate as a proportion of total misses
 '''
 def get_false_hit_rate(misses,threshold, clock_method):
-    false_hit_rate = 0
-    for miss in misses:
-        if clock_method == 'performance.now': # Interpolation makes everything backward :(
-            if miss > threshold:
-                false_hit_rate+=1
-        elif clock_method == 'SharedArrayBuffer':
-            if miss < threshold:
-                false_hit_rate+=1
+    misses = np.asarray(misses)
+    if clock_method == 'performance.now': # Interpolation makes everything backward :(
+        false_hit_rate = np.count_nonzero(misses > threshold)
+    elif clock_method == 'SharedArrayBuffer':
+        false_hit_rate = np.count_nonzero(misses < threshold)
+    else:
+        false_hit_rate = 0
     return false_hit_rate/len(misses)
 
 ''' Computes the false miss rate.
@@ -63,14 +67,13 @@ Returns:
 (int) The false miss rate as a proportion of total hits
 '''
 def get_false_miss_rate(hits,threshold, clock_method):
-    false_miss_rate = 0
-    for hit in hits:
-        if clock_method == 'performance.now': # Interpolation makes everything backward :(
-            if hit < threshold:
-                false_miss_rate+=1
-        elif clock_method == 'SharedArrayBuffer':
-            if hit > threshold:
-                false_miss_rate+=1
+    hits = np.asarray(hits)
+    if clock_method == 'performance.now': # Interpolation makes everything backward :(
+        false_miss_rate = np.count_nonzero(hits < threshold)
+    elif clock_method == 'SharedArrayBuffer':
+        false_miss_rate = np.count_nonzero(hits > threshold)
+    else:
+        false_miss_rate = 0
     return false_miss_rate / len(hits)
 
 
@@ -91,6 +94,59 @@ def get_error_rate(hits,misses, threshold,clock_method):
     return (get_false_hit_rate(misses, threshold, clock_method) + get_false_miss_rate(hits, threshold, clock_method))/2
 
 
+''' Computes the error rate for every useful threshold at once.
+Both samples are sorted once, and the number of timings below and above each
+candidate threshold is read with a binary search, so the cost is O(N log N)
+instead of one pass over the data per threshold.
+As both the false hit and false miss conditions are strict inequalities, the
+error rate between two consecutive timings is never lower than the error rate
+on one of them: the distinct timings are therefore the only candidates needed.
+Timings can be floats (averaged repetitions for instance).
+
+Parameters:
+hits(list[int]): Hit timings.
+misses(list[int]): Miss timings.
+clock_method(str): Used clock. We need it to take into account the difference for interpolated clocks.
+
+Returns:
+(np.ndarray, np.ndarray): The candidate thresholds, sorted, and the associated error rates.
+'''
+def sweep_thresholds(hits, misses, clock_method):
+    hits = np.sort(np.asarray(hits, dtype=np.float64))
+    misses = np.sort(np.asarray(misses, dtype=np.float64))
+    thresholds = np.unique(np.concatenate((hits, misses)))
+
+    hits_below = np.searchsorted(hits, thresholds, side='left')
+    hits_above = len(hits) - np.searchsorted(hits, thresholds, side='right')
+    misses_below = np.searchsorted(misses, thresholds, side='left')
+    misses_above = len(misses) - np.searchsorted(misses, thresholds, side='right')
+
+    if clock_method == 'performance.now': # Interpolation makes everything backward :(
+        false_hits, false_misses = misses_above, hits_below
+    elif clock_method == 'SharedArrayBuffer':
+        false_hits, false_misses = misses_below, hits_above
+    else:
+        raise Exception('Unknown clock method: ' + str(clock_method))
+    error_rates = (false_hits/len(misses) + false_misses/len(hits))/2
+    return (thresholds, error_rates)
+
+
+''' Computes the best (lowest) error rate and the threshold reaching it.
+
+Parameters:
+hits(list[int]): Hit timings.
+misses(list[int]): Miss timings.
+clock_method(str): Used clock. We need it to take into account the difference for interpolated clocks.
+
+Returns:
+(float, float): The optimal threshold and the lowest error rate as a proportion of total measurements.
+'''
+def get_best_threshold(hits, misses, clock_method):
+    (thresholds, error_rates) = sweep_thresholds(hits, misses, clock_method)
+    best = np.argmin(error_rates)
+    return (float(thresholds[best]), float(error_rates[best]))
+
+
 ''' Computes the best (lowest) error rate by testing different thresholds
 
 Parameters:
@@ -102,12 +158,7 @@ Returns:
 (int): The lowest error rate as a proportion of total measurements.
 '''
 def get_best_error_rate(hits, misses, clock_method):
-    error_rate = []
-
-    for threshold in range(0, math.floor(max(max(hits),max(misses)))):
-        error_rate.append(get_error_rate(hits, misses, threshold, clock_method))
-
-    return min(error_rate)
+    return get_best_threshold(hits, misses, clock_method)[1]
 
 
 ''' Get hit/miss timings with a certain number of repetitions
@@ -122,16 +173,196 @@ misses(list[int]): Miss timings.
 measurement_reps(int): number of repetitions.
 
 Returns:
-(list,list): Lists of averaged hits/misses.
+(np.ndarray,np.ndarray): Arrays of averaged hits/misses.
 '''
 def get_mean_rep(hits, misses, measurement_reps):
-    hit_average = []
-    miss_average = []
-    for rep in range (0,len(hits),measurement_reps):
-        hit_average.append(statistics.mean(hits[rep:rep+measurement_reps]))
-        miss_average.append(statistics.mean(misses[rep:rep+measurement_reps]))
+    (hit_average, _) = get_block_means(hits, [measurement_reps])
+    (miss_average, _) = get_block_means(misses, [measurement_reps])
     return (hit_average,miss_average)
 
+''' Averages consecutive blocks of timings for several numbers of repetitions at once.
+A single prefix sum over the timings gives the sum of any block in O(1), so the
+averages for every repetition count are computed without any Python loop.
+As in get_mean_rep, the last block of a repetition count can be shorter.
+
+Parameters:
+timings(list[int]): Hit or miss timings. A 2D array averages each row (e.g. bootstrap resamples) the same way.
+measurement_reps(list[int]): The numbers of repetitions to average over.
+
+Returns:
+(np.ndarray, np.ndarray): The block averages for all repetition counts, one after the other (on the last axis),
+and for each average the index in measurement_reps of its repetition count.
+'''
+def get_block_means(timings, measurement_reps):
+    timings = np.asarray(timings, dtype=np.float64)
+    measurement_reps = np.asarray(measurement_reps, dtype=np.int64)
+    length = timings.shape[-1]
+    prefix = np.concatenate((np.zeros(timings.shape[:-1] + (1,)), np.cumsum(timings, axis=-1)), axis=-1)
+    counts = -(-length // measurement_reps) # Number of blocks, the last one can be partial
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rep_index = np.repeat(np.arange(len(measurement_reps)), counts)
+    sizes = measurement_reps[rep_index]
+    starts = (np.arange(len(rep_index)) - offsets[rep_index]) * sizes
+    ends = np.minimum(starts + sizes, length)
+    return ((prefix[..., ends] - prefix[..., starts]) / (ends - starts), rep_index)
+
+''' Computes the best threshold and error rate for many independent hit/miss samples at once.
+Every timing belongs to a segment (a repetition count for instance), and the
+threshold sweep of sweep_thresholds is done for all segments with a single sort.
+Each segment must contain both hits and misses.
+
+Parameters:
+timings(np.ndarray): Hit and miss timings of all segments.
+is_miss(np.ndarray): Boolean array, True for misses and False for hits.
+segments(np.ndarray): Segment of each timing, from 0 to the number of segments - 1.
+clock_method(str): Used clock. We need it to take into account the difference for interpolated clocks.
+presorted(bool): The timings are already sorted by segment, then by timing.
+
+Returns:
+(np.ndarray, np.ndarray): For each segment, the optimal threshold and the lowest error rate.
+'''
+def sweep_segments(timings, is_miss, segments, clock_method, presorted = False):
+    if not presorted:
+        order = np.lexsort((timings, segments))
+        timings = timings[order]
+        is_miss = is_miss[order]
+        segments = segments[order]
+    segment_count = segments[-1] + 1
+
+    # Running number of misses/hits before each position.
+    misses = np.concatenate(([0], np.cumsum(is_miss)))
+    hits = np.concatenate(([0], np.cumsum(~is_miss)))
+
+    # Groups of equal timings inside a segment, they are the candidate thresholds.
+    new_group = np.ones(len(timings), dtype=bool)
+    new_group[1:] = (timings[1:] != timings[:-1]) | (segments[1:] != segments[:-1])
+    group_starts = np.flatnonzero(new_group)
+    group_ends = np.append(group_starts[1:], len(timings))
+    group_segments = segments[group_starts]
+    segment_starts = np.searchsorted(segments, np.arange(segment_count), side='left')[group_segments]
+    segment_ends = np.searchsorted(segments, np.arange(segment_count), side='right')[group_segments]
+
+    misses_below = misses[group_starts] - misses[segment_starts]
+    misses_above = misses[segment_ends] - misses[group_ends]
+    hits_below = hits[group_starts] - hits[segment_starts]
+    hits_above = hits[segment_ends] - hits[group_ends]
+    total_misses = misses[segment_ends] - misses[segment_starts]
+    total_hits = hits[segment_ends] - hits[segment_starts]
+
+    if clock_method == 'performance.now': # Interpolation makes everything backward :(
+        false_hits, false_misses = misses_above, hits_below
+    elif clock_method == 'SharedArrayBuffer':
+        false_hits, false_misses = misses_below, hits_above
+    else:
+        raise Exception('Unknown clock method: ' + str(clock_method))
+    error_rates = (false_hits/total_misses + false_misses/total_hits)/2
+
+    # Groups are already sorted by segment: keep the first group with the lowest error rate of each segment.
+    first_groups = np.searchsorted(group_segments, np.arange(segment_count), side='left')
+    lowest = np.minimum.reduceat(error_rates, first_groups)
+    candidates = np.flatnonzero(error_rates == lowest[group_segments])
+    best = candidates[np.searchsorted(group_segments[candidates], np.arange(segment_count), side='left')]
+    return (timings[group_starts[best]], error_rates[best])
+
+''' Computes the lowest error rate for every number of repetitions up to max_rep.
+The averaged hits and misses of all repetition counts are built from one prefix
+sum, and their threshold sweeps are done in one vectorized step.
+
+Parameters:
+hits(list[int]): Hit timings.
+misses(list[int]): Miss timings.
+clock_method(str): Used clock. We need it to take into account the difference for interpolated clocks.
+max_rep(int): Repetition counts go from 1 to max_rep - 1.
+
+Returns:
+(dict): The lowest error rate, indexed by the number of repetitions.
+'''
+def get_best_error_rates(hits, misses, clock_method, max_rep = MAX_REP):
+    reps = np.arange(1, min(min(len(hits),len(misses)), max_rep))
+    if len(reps) == 0:
+        return {}
+    (hit_avg, hit_reps) = get_block_means(hits, reps)
+    (miss_avg, miss_reps) = get_block_means(misses, reps)
+    timings = np.concatenate((hit_avg, miss_avg))
+    is_miss = np.concatenate((np.zeros(len(hit_avg), dtype=bool), np.ones(len(miss_avg), dtype=bool)))
+    segments = np.concatenate((hit_reps, miss_reps))
+    (_, error_rates) = sweep_segments(timings, is_miss, segments, clock_method)
+    return {int(rep): float(error_rate) for (rep, error_rate) in zip(reps, error_rates)}
+
+''' Computes the lowest error rate of every number of repetitions for bootstrap resamples.
+Each resample draws as many hits and misses as measured, with replacement. All
+resamples are averaged at once (one prefix sum per row), and the threshold sweeps
+of every resample and repetition count are done in a single sweep_segments call,
+on timings sorted row by row for each repetition count.
+
+Parameters:
+hits(np.ndarray): Hit timings.
+misses(np.ndarray): Miss timings.
+clock_method(str): Used clock. We need it to take into account the difference for interpolated clocks.
+reps(np.ndarray): The numbers of repetitions.
+resamples(int): Number of resamples.
+seed(np.random.SeedSequence): Seed of the resamples.
+
+Returns:
+(np.ndarray): The lowest error rates, one row by resample and one column by number of repetitions.
+'''
+def bootstrap_error_rates(hits, misses, clock_method, reps, resamples, seed):
+    rng = np.random.default_rng(seed)
+    hits = np.asarray(hits, dtype=np.float64)
+    misses = np.asarray(misses, dtype=np.float64)
+    (hit_avg, hit_reps) = get_block_means(hits[rng.integers(0, len(hits), (resamples, len(hits)))], reps)
+    (miss_avg, miss_reps) = get_block_means(misses[rng.integers(0, len(misses), (resamples, len(misses)))], reps)
+    hit_bounds = np.searchsorted(hit_reps, np.arange(len(reps) + 1))
+    miss_bounds = np.searchsorted(miss_reps, np.arange(len(reps) + 1))
+    # Sort each (resample, repetition count) segment row-wise, so that sweep_segments does not sort them again.
+    (blocks, flags) = ([], [])
+    for rep in range(len(reps)):
+        block = np.concatenate((hit_avg[:, hit_bounds[rep]:hit_bounds[rep + 1]], miss_avg[:, miss_bounds[rep]:miss_bounds[rep + 1]]), axis=1)
+        order = np.argsort(block, axis=1, kind='stable')
+        blocks.append(np.take_along_axis(block, order, axis=1))
+        flags.append((order >= hit_bounds[rep + 1] - hit_bounds[rep]))
+    sizes = [block.shape[1] for block in blocks]
+    timings = np.concatenate(blocks, axis=1).ravel()
+    is_miss = np.concatenate(flags, axis=1).ravel()
+    segments = np.repeat(np.arange(resamples * len(reps)), np.tile(sizes, resamples))
+    (_, error_rates) = sweep_segments(timings, is_miss, segments, clock_method, presorted = True)
+    return error_rates.reshape(resamples, len(reps))
+
+''' Computes bootstrap confidence intervals of the lowest error rate for every number of repetitions up to max_rep.
+Resamples are computed in chunks of about CHUNK_SIZE averaged timings, spread over worker processes.
+
+Parameters:
+hits(list[int]): Hit timings.
+misses(list[int]): Miss timings.
+clock_method(str): Used clock. We need it to take into account the difference for interpolated clocks.
+max_rep(int): Repetition counts go from 1 to max_rep - 1.
+resamples(int): Number of bootstrap resamples.
+confidence(float): Confidence level of the intervals.
+workers(int): Number of worker processes. Default is the number of cores, 1 computes in this process.
+seed(int): Seed of the resamples, for reproducible intervals.
+
+Returns:
+(dict): The lower and upper bounds of the lowest error rate (percentile interval), indexed by the number of repetitions.
+'''
+def get_error_rate_intervals(hits, misses, clock_method, max_rep = MAX_REP, resamples = RESAMPLES, confidence = 0.95, workers = None, seed = None):
+    hits = np.asarray(hits, dtype=np.float64)
+    misses = np.asarray(misses, dtype=np.float64)
+    reps = np.arange(1, min(min(len(hits),len(misses)), max_rep))
+    if len(reps) == 0 or resamples <= 0:
+        return {}
+    averages = np.sum(-(-len(hits) // reps)) + np.sum(-(-len(misses) // reps)) # Averaged timings of a resample.
+    chunk = max(1, CHUNK_SIZE // int(averages))
+    sizes = [min(chunk, resamples - start) for start in range(0, resamples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    arguments = ([hits] * len(sizes), [misses] * len(sizes), [clock_method] * len(sizes), [reps] * len(sizes), sizes, seeds)
+    if workers == 1:
+        chunks = list(map(bootstrap_error_rates, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(bootstrap_error_rates, *arguments))
+    (lower, upper) = np.quantile(np.concatenate(chunks), [(1 - confidence) / 2, (1 + confidence) / 2], axis=0)
+    return {int(rep): (float(low), float(high)) for (rep, low, high) in zip(reps, lower, upper)}
+
 ''' Computes the evolution of the hit/miss error rate for a specific situation.
 For each repetition, we compute the lowest error rate.
 This function reads data stored in the result folder.
@@ -144,46 +375,54 @@ clock_method(str): What clock is used. Either SharedArrayBuffer or performance.n
 coop(bool): True if coop/coep enabled.
 csv(bool): Set to true if you wish to output the csv file.
 plot(bool): Set to true if you wish to plot the evolution of error rate using plotly.
+max_rep(int): Repetition counts go from 1 to max_rep - 1.
+resamples(int): If set, also compute bootstrap confidence intervals with this number of resamples (see get_error_rate_intervals).
+confidence(float): Confidence level of the intervals.
+workers(int): Number of worker processes for the bootstrap. Default is the number of cores.
+
+Returns:
+(dict): The lowest error rate, indexed by the number of repetitions.
 '''
-def get_error_repetition(browser, version, clock_method, coop = False, csv = False, plot=False):
-    results = utility.read_json(config.RESULTS_DIR[browser] + browser + '-' + str(version) + '.json')
-    hits = []
-    misses = []
-    for result in results:
-        if (result['name']=='hit/miss' and result['clock_method'] == clock_method and result['coop'] == coop):
-            if result['hit/miss']=='hits':
-                for value in result['values']:
-                    hits.append(value)
-            elif result['hit/miss']=='misses':
-                for value in result['values']:
-                    misses.append(value)
-    if hits == [] or misses == []:
+def get_error_repetition(browser, version, clock_method, coop = False, csv = False, plot=False, max_rep = MAX_REP, resamples = 0, confidence = 0.95, workers = None):
+    (hits, misses) = results_store.load_hits_misses(browser, version, clock_method, coop)
+    if len(hits) == 0 or len(misses) == 0:
         print('No results found for ' + browser + ' ' + str(version) + ' ' + clock_method + ' and COOP/COEP:' +str(coop))
-    error_rep = {}
-    for rep in range(1, min(min(len(hits),len(misses)), MAX_REP)):
-        (hit_avg, miss_avg) = get_mean_rep(hits,misses,rep)
-        error_rep[rep] = get_best_error_rate(hit_avg,miss_avg, clock_method)
+    error_rep = get_best_error_rates(hits, misses, clock_method, max_rep)
+    intervals = get_error_rate_intervals(hits, misses, clock_method, max_rep, resamples, confidence, workers) if resamples else None
     if csv:
-        output_path = config.CSV_DIR[browser] + 'error_rep-' + browser + '-' + str(version) + '-' + clock_method + '-coop-' + str(coop) + '.csv'
-        json_to_csv(error_rep, output_path)
+        json_to_csv(error_rep, get_csv_path(browser, version, clock_method, coop), intervals)
     if plot:
-        plot_error_rep(error_rep)
+        plot_error_rep(error_rep, intervals)
     return(error_rep)
 
 #                                   DISPLAY                                    #
-def json_to_csv(error_rep, output):
-    x = list(error_rep.keys())
-    y = [error_rep[key] for key in x]
+def get_csv_path(browser, version, clock_method, coop):
+    ''' Return the path of the csv file of a version and clock. '''
+    return config.CSV_DIR[browser] + 'error_rep-' + browser + '-' + str(version) + '-' + clock_method + '-coop-' + str(coop) + '.csv'
+
+def json_to_csv(error_rep, output, intervals = None):
+    ''' Write the error rates in percent, with the lower and upper bounds of their confidence intervals if given. '''
+    os.makedirs(os.path.dirname(output), exist_ok=True)
     with open(output,'w') as file:
         writer = csv.writer(file,delimiter=' ')
-        writer.writerow( ('repetition','error_rate') )
-        for key in error_rep.keys():
-            writer.writerow( (key, error_rep[key]*100) )
-
-def plot_error_rep(error_rep):
+        if intervals is None:
+            writer.writerow( ('repetition','error_rate') )
+            for key in error_rep.keys():
+                writer.writerow( (key, error_rep[key]*100) )
+        else:
+            writer.writerow( ('repetition','error_rate','lower','upper') )
+            for key in error_rep.keys():
+                writer.writerow( (key, error_rep[key]*100, intervals[key][0]*100, intervals[key][1]*100) )
+
+def plot_error_rep(error_rep, intervals = None):
     x = list(error_rep.keys())
     y = [error_rep[key] for key in x]
-    fig = go.Figure(data=go.Scatter(x=x, y=y))
+    error_y = None
+    if intervals is not None:
+        error_y = dict(type='data', symmetric=False,
+                       array=[intervals[key][1] - error_rep[key] for key in x],
+                       arrayminus=[error_rep[key] - intervals[key][0] for key in x])
+    fig = go.Figure(data=go.Scatter(x=x, y=y, error_y=error_y))
     fig.show()
 
 
@@ -198,6 +437,10 @@ def parse_arguments():
     parser.add_argument('-c', '--coop', help = 'Enables COOP and COEP. Default is off.', action='store_true',default=False)
     parser.add_argument('-p', '--plot', help = 'Plot error rate repetitions graph', action='store_true',default=False)
     parser.add_argument('--csv', help = 'Create csv file (for latex)', action='store_true',default=False)
+    parser.add_argument('--max_rep', help = 'Maximal number of repetitions', type=int, default=MAX_REP)
+    parser.add_argument('--bootstrap', help = 'Also compute confidence intervals with this number of bootstrap resamples', type=int, default=0)
+    parser.add_argument('--confidence', help = 'Confidence level of the bootstrap intervals', type=float, default=0.95)
+    parser.add_argument('-w', '--workers', help = 'Number of processes computing the bootstrap. Default is the number of cores.', type=int, default=None)
 
     #parser.add_argument('--clean', help='Delete former result files. Default is false')
     args = parser.parse_args()
@@ -209,4 +452,5 @@ if __name__ == '__main__':
         sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
         sys.exit(1)
     args = parse_arguments()
-    get_error_repetition(args.browser, args.version, args.clock, coop = args.coop, csv = args.csv, plot = args.plot)
+    get_error_repetition(args.browser, args.version, args.clock, coop = args.coop, csv = args.csv, plot = args.plot, max_rep = args.max_rep,
+                         resamples = args.bootstrap, confidence = args.confidence, workers = args.workers)
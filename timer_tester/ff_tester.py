@@ -15,15 +15,20 @@ It can run the following tests :
 import json
 from selenium import webdriver
 from selenium.common.exceptions import JavascriptException, WebDriverException
-from selenium.webdriver.firefox.firefox_binary import FirefoxBinary
 import subprocess
 import os
 import statistics
 import plotly.graph_objects as go
 import sys
 import argparse
+import time
 # Locals:
+import checkpoint
 import config
+import profiles
+import registry
+import resume
+import session
 import utility
 
 #                                  SAB availablity                             #
@@ -40,12 +45,11 @@ def test_sab_flag(version, flags, coop = True):
     Returns:
     bool: the availablity of SABs with a specific set of flags
     '''
-    fp = webdriver.FirefoxProfile()
-    binary = FirefoxBinary(config.BROWSER_DIR['firefox'] + "firefox-" + str(version) + "/firefox")
+    fp = profiles.firefox_profile()
     for (flag,value) in flags:
         fp.set_preference(flag, value)
     sab_available = False
-    with (webdriver.Firefox(firefox_binary=binary, firefox_profile = fp)) as driver:
+    with profiles.launch('firefox', version, lambda: profiles.start_firefox(get_binary(version), fp)) as driver:
         if coop:
             url = config.URLS['hit_miss'] + "?coop=True"
         else:
@@ -116,9 +120,42 @@ def test_sab(version, coop = True):
 
 
 
+#                                  BROWSER                                     #
+
+def get_binary(version):
+    return registry.get_binary('firefox', version)
+
+
+def launch_browser(version):
+    ''' Start a version of Firefox with a copy of the quiet profile (see profiles.py).
+
+    Parameters:
+    version(int): Tested version.
+
+    Returns:
+    webdriver.Firefox: The browser. It must be closed by the caller.
+    '''
+    return profiles.launch('firefox', version, lambda: profiles.start_firefox(get_binary(version)))
+
+
 #                              TICK DISTRIBUTION                               #
 
-def test_interpolation_distribution(version, coop = True, repetitions = config.REPETITIONS):
+def measure_distribution(driver, coop = True, repetitions = config.REPETITIONS):
+    ''' Measure the number of incrementations in clock periods in an open browser.
+
+    Parameters:
+    driver(WebDriver): The browser.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements.
+
+    Returns:
+    list(int): The number of incrementations for each clock period.
+    '''
+    driver.get(utility.get_url('distribution', coop))
+    return driver.execute_script("return test_clock_edges(" + str(repetitions) + ")")
+
+
+def test_interpolation_distribution(version, coop = True, repetitions = config.REPETITIONS, batch_size = None):
     ''' Test repeatedly the number of maximum incrementations in a clock edge.
     This gives indication of both resolution (average number of incrementations)
     and jitter (variance of the number of ticks).
@@ -129,6 +166,7 @@ def test_interpolation_distribution(version, coop = True, repetitions = config.R
     version(int): Tested version
     coop(bool): True to activate coop/coep, False otherwise.
     repetitions(int): The number of measurements. Default is set in config file.
+    batch_size(int): If set, measure in batches saved as they come, and resume from the last saved batch after a crash (see checkpoint.py).
     '''
 
     print('Testing the number of ticks in a clock period on Firefox ' + str(version) + ", " + str(repetitions) + ' repetitions.')
@@ -136,25 +174,37 @@ def test_interpolation_distribution(version, coop = True, repetitions = config.R
         print('COOP/COEP is on.')
     else:
         print('COOP/COEP is off.')
-    fp = webdriver.FirefoxProfile()
-    binary = FirefoxBinary(config.BROWSER_DIR['firefox'] + "firefox-" + str(version) + "/firefox")
-    with(webdriver.Firefox(firefox_binary=binary, firefox_profile = fp)) as driver:
-        if coop:
-            driver.get(config.URLS['distribution'] + "?coop=True")
-        else:
-            driver.get(config.URLS['distribution'])
-        timings = driver.execute_script("return test_clock_edges(" + str(repetitions) + ")")
-        driver.close();
-    stats = utility.get_stats(timings)
-    stats['name'] = 'Tick distibution'
-    stats['version'] = version
-    stats['coop'] = coop
-    utility.write_results(stats, version, 'firefox')
+    if batch_size:
+        checkpoint.stream_distribution(lambda: launch_browser(version), 'firefox', version, coop, repetitions, batch_size)
+    else:
+        with launch_browser(version) as driver:
+            timings = measure_distribution(driver, coop, repetitions)
+            driver.close();
+        utility.write_distribution(timings, version, coop, 'firefox')
     print('Done')
     print()
 
 #                            CACHE HITS/MISSES                                 #
-def test_hits_misses(version, clock_method, coop = True, repetitions = config.REPETITIONS):
+
+def measure_hits_misses(driver, clock_method, coop = True, repetitions = config.REPETITIONS):
+    ''' Measure the access time of cache hits and misses in an open browser.
+    This raises a JavascriptException or a WebDriverException if the clock is unavailable.
+
+    Parameters:
+    driver(WebDriver): The browser.
+    clock_method(string): Which clock to use. Can be 'SharedArrayBuffer' or 'performance.now'.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements.
+
+    Returns:
+    dict: The hit timings and miss timings, under 'hits' and 'misses'.
+    '''
+    driver.get(utility.get_url('hit_miss', coop))
+    driver.set_script_timeout(10000000000)
+    return driver.execute_script("return getHitMiss('" + clock_method + "'," +  str(repetitions) + ")")
+
+
+def test_hits_misses(version, clock_method, coop = True, repetitions = config.REPETITIONS, batch_size = None):
     ''' Compute the access time of cache hits and misses for a specific clock.
     This method can take a while to run, especially with a lot of repetitions or
     a huge cache.
@@ -168,6 +218,7 @@ def test_hits_misses(version, clock_method, coop = True, repetitions = config.RE
     clock_method(string): Which clock to use. Can be 'SharedArrayBuffer' or 'performance.now'.
     coop(bool): True to activate coop/coep, False otherwise.
     repetitions(int): The number of measurements. Default is set in config file.
+    batch_size(int): If set, measure in batches saved as they come, and resume from the last saved batch after a crash (see checkpoint.py).
     '''
 
     print('Testing hits/misses on Firefox ' + str(version) + " with " + clock_method + ", " + str(repetitions) + ' repetitions.')
@@ -175,16 +226,21 @@ def test_hits_misses(version, clock_method, coop = True, repetitions = config.RE
         print('COOP/COEP is on.')
     else:
         print('COOP/COEP is off.')
-    fp = webdriver.FirefoxProfile()
-    binary = FirefoxBinary(config.BROWSER_DIR['firefox'] + "firefox-" + str(version) + "/firefox")
-    with(webdriver.Firefox(firefox_binary=binary, firefox_profile = fp)) as driver:
-        if coop:
-            driver.get(config.URLS['hit_miss'] + "?coop=True")
-        else:
-            driver.get(config.URLS['hit_miss'])
+    if batch_size:
+        try:
+            checkpoint.stream_hits_misses(lambda: launch_browser(version), 'firefox', version, clock_method, coop, repetitions, batch_size)
+        except JavascriptException as e: # SABs are unavailable without coop/coep, see below.
+            print('SABs are not available without coop here, skipping')
+            return
+        except WebDriverException:
+            print('SABs are not available here, skipping')
+            return
+        print('Done')
+        print()
+        return
+    with launch_browser(version) as driver:
         try:
-            driver.set_script_timeout(10000000000)
-            results = driver.execute_script("return getHitMiss('" + clock_method + "'," +  str(repetitions) + ")") #This might fail if SABs are unavailable so we set a try
+            results = measure_hits_misses(driver, clock_method, coop, repetitions) #This might fail if SABs are unavailable so we set a try
         except JavascriptException as e: # This exception occurs when we try to access to SABs without coop/coep on later versions.
             print('SABs are not available without coop here, skipping')
             return
@@ -193,21 +249,7 @@ def test_hits_misses(version, clock_method, coop = True, repetitions = config.RE
             return
         driver.close();
 
-    stat_hits = utility.get_stats(results['hits'])
-    stat_hits['name'] = 'hit/miss'
-    stat_hits['clock_method'] = clock_method
-    stat_hits['hit/miss'] = 'hits'
-    stat_hits['version'] = version
-    stat_hits['coop'] = coop
-    utility.write_results(stat_hits, version, 'firefox')
-
-    stat_misses = utility.get_stats(results['misses'])
-    stat_misses['name'] = 'hit/miss'
-    stat_misses['clock_method'] = clock_method
-    stat_misses['hit/miss'] = 'misses'
-    stat_misses['version'] = version
-    stat_misses['coop'] = coop
-    utility.write_results(stat_misses, version, 'firefox')
+    utility.write_hits_misses(results, version, clock_method, coop, 'firefox')
     print('Done')
     print()
 
@@ -229,13 +271,13 @@ def test_rdtsc(coop = True, repetitions = config.REPETITIONS):
         print('Skipping...')
         return
     results = {}
-    fp = webdriver.FirefoxProfile()
-    binary = FirefoxBinary(config.RDTSC_EXEC['firefox'])
-    with(webdriver.Firefox(firefox_binary=binary, firefox_profile = fp)) as driver:
+    with profiles.launch('firefox', 'rdtsc', lambda: profiles.start_firefox(config.RDTSC_EXEC['firefox'])) as driver:
         if coop:
             driver.get(config.URLS['rdtsc'] + "?coop=True")
         else:
             driver.get(config.URLS['rdtsc'])
+        driver.set_script_timeout(10000000000)
+        results = driver.execute_script("return getTimerMeasurements("+ str(repetitions) + ")")
         driver.close();
     results['name'] = 'rdtsc'
     results['coop'] = coop
@@ -243,6 +285,96 @@ def test_rdtsc(coop = True, repetitions = config.REPETITIONS):
     print('Done')
     print()
 
+#                                CAMPAIGN                                      #
+
+def select_versions(version = None):
+    ''' Select the versions to test.
+
+    Parameters:
+    version(int): A specific version, or None for all available versions.
+
+    Returns:
+    list(int): The versions to test. Exits if the requested version is not supported.
+    '''
+    if version:
+        if version in registry.get_versions('firefox') and version >= 57:
+            return [version]
+        print('Only support versions later than 57')
+        sys.exit(1)
+    return registry.get_versions('firefox')
+
+def run_session(version, tests, coop = True, repetitions = config.REPETITIONS, batch_size = None, todo = None):
+    ''' Run a set of tests on a version, sharing a single browser between tests.
+    The SharedArrayBuffer availability test needs browsers started with different
+    preferences, so it still starts its own browsers.
+
+    Parameters:
+    version(int): Tested version
+    tests(list(str)): Tests to run, among utility.TESTS.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements. Default is set in config file.
+    batch_size(int): If set, measure in batches saved as they come (see checkpoint.py).
+    todo(dict): The measurements still to do by step, see resume.py. Default is every step of tests, with all repetitions.
+
+    Returns:
+    dict: For each test, its wall time in seconds and its error (None if it succeeded).
+    '''
+    if todo is None:
+        todo = resume.get_todo(tests, repetitions)
+    report = {}
+    if 'sab' in todo:
+        start = time.time()
+        test_sab(version, coop)
+        report['sab'] = (time.time() - start, None)
+    steps = []
+    if 'distribution' in todo:
+        if batch_size:
+            steps.append(('distribution', lambda driver, repetitions = todo['distribution']:
+                          checkpoint.stream_distribution(lambda: driver, 'firefox', version, coop, repetitions, batch_size, restarts = 0, close = False)))
+        else:
+            steps.append(('distribution', lambda driver, repetitions = todo['distribution']:
+                          utility.write_distribution(measure_distribution(driver, coop, repetitions), version, coop, 'firefox')))
+    for clock_method in resume.CLOCK_METHODS:
+        if 'hit_miss ' + clock_method not in todo:
+            continue
+        if batch_size:
+            steps.append(('hit_miss ' + clock_method, lambda driver, clock_method = clock_method, repetitions = todo['hit_miss ' + clock_method]:
+                          checkpoint.stream_hits_misses(lambda: driver, 'firefox', version, clock_method, coop, repetitions, batch_size, restarts = 0, close = False)))
+        else:
+            steps.append(('hit_miss ' + clock_method, lambda driver, clock_method = clock_method, repetitions = todo['hit_miss ' + clock_method]:
+                          utility.write_hits_misses(measure_hits_misses(driver, clock_method, coop, repetitions), version, clock_method, coop, 'firefox')))
+    print('Running ' + ', '.join(name for (name, _) in steps) + ' on Firefox ' + str(version) + ' in a single session.')
+    report.update(session.run_session(lambda: launch_browser(version), steps))
+    return report
+
+
+def run_tests(version, tests, coop = True, repetitions = config.REPETITIONS, single_session = False, batch_size = None, todo = None):
+    ''' Run a set of tests on a version.
+
+    Parameters:
+    version(int): Tested version
+    tests(list(str)): Tests to run, among utility.TESTS.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements. Default is set in config file.
+    single_session(bool): Share one browser between tests (see run_session).
+    batch_size(int): If set, measure in batches saved as they come (see checkpoint.py).
+    todo(dict): The measurements still to do by step, see resume.py. Default is every step of tests, with all repetitions.
+    '''
+    print("Evaluating version " + str(version))
+    if todo is None:
+        todo = resume.get_todo(tests, repetitions)
+    if single_session:
+        run_session(version, tests, coop, repetitions, batch_size, todo)
+        return
+    if 'sab' in todo:
+        test_sab(version, coop)
+    if 'distribution' in todo:
+        test_interpolation_distribution(version, coop, todo['distribution'], batch_size)
+    for clock_method in resume.CLOCK_METHODS:
+        if 'hit_miss ' + clock_method in todo:
+            test_hits_misses(version, clock_method, coop, todo['hit_miss ' + clock_method], batch_size)
+
+
 #                                  MAIN                                        #
 
 def parse_arguments():
@@ -254,6 +386,12 @@ def parse_arguments():
     parser.add_argument('--distribution', help='Evaluates the number of incrementation per clock period.', action='store_true',default=False)
     parser.add_argument('--hit_miss', help='Evaluates timings for cache hits and misses. This can take a while.', action='store_true',default=False)
     parser.add_argument('--rdtsc', help='Run performance.rdtsc tests. You need to set the path of you custom firefox in the config file.', action='store_true',default=False)
+    parser.add_argument('--npy', help='Store measurement values as binary .npy files instead of json.', action='store_true',default=False)
+    parser.add_argument('--sketch', help='Only store summaries (sketches) of tick distribution and rdtsc values, see sketch.py.', action='store_true',default=False)
+    parser.add_argument('--session', help='Run all tests of a version in a single browser session.', action='store_true',default=False)
+    parser.add_argument('--batch', help='Measure in batches of this size, saved as they come, to resume interrupted runs.', type=int)
+    parser.add_argument('--resume', help='Only run the tests and measurements missing from the stored results.', action='store_true',default=False)
+    parser.add_argument('--display', help='Show browsers in a window, run them headless, or on a virtual display (Xvfb).', choices=['window', 'headless', 'xvfb'], default=config.DISPLAY)
 
     #parser.add_argument('--clean', help='Delete former result files. Default is false')
     args = parser.parse_args()
@@ -268,17 +406,16 @@ def main(args):
         print('You have not specified a number of repetitions. Using config.')
         repetitions = config.REPETITIONS
     print('Number of measurements : '+str(repetitions))
-
-    if args.version:
-        if args.version in config.ALL_VERSIONS['firefox'] and args.version >= 57:
-            versions = [args.version]
-        else:
-            print('Only support versions later than 57')
-            sys.exit(1)
-    else:
+    if args.npy:
+        config.VALUES_FORMAT = 'npy'
+    if args.sketch:
+        config.VALUES_FORMAT = 'sketch'
+    config.DISPLAY = args.display
+
+    versions = select_versions(args.version)
+    if not args.version:
         print('Running tests on all available versions.')
-        print(config.ALL_VERSIONS['firefox'])
-        versions = config.ALL_VERSIONS['firefox']
+        print(versions)
 
     if args.coop:
         print('Using coop for tests.')
@@ -292,28 +429,12 @@ def main(args):
         test_rdtsc(coop = True, repetitions = config.REPETITIONS) # Since rdtsc does not require a version, we treat it differently - you can't run rdtsc and the others in the same run.
         #TODO: Maybe improve the CLI.
     else:
-        print(args)
-        if not ((args.sab) or (not args.hit_miss) or (args.distribution)):
-            print("You have not specified tests, running sab availability, distribution and hit_miss")
-            for version in versions:
-                print("Evaluating version " + str(version))
-                test_sab(version, coop)
-                test_interpolation_distribution(version, coop, repetitions)
-                test_hits_misses(version, 'SharedArrayBuffer', coop , repetitions)
-                test_hits_misses(version, 'performance.now', coop , repetitions)
-        else:
-            print(args)
-            if args.sab:
-                for version in versions:
-                    test_sab(version, coop)
-            if args.distribution:
-                for version in versions:
-                    test_interpolation_distribution(version, coop, repetitions)
-            if args.hit_miss:
-                for version in versions:
-                    test_hits_misses(version, 'SharedArrayBuffer', coop , repetitions)
-                    test_hits_misses(version, 'performance.now', coop , repetitions)
-
+        tests = utility.get_tests(args)
+        if args.resume:
+            remaining = resume.plan('firefox', versions, tests, coop, repetitions)
+            versions = [version for version in versions if remaining[version]]
+        for version in versions:
+            run_tests(version, tests, coop, repetitions, args.session, args.batch, remaining[version] if args.resume else None)
 
 
 
@@ -1,119 +1,244 @@
 #!usr/bin/python3
-
-import subprocess
+''' Download and extract Firefox releases for linux 64 bits.
+Several versions are downloaded at the same time. Each archive is decompressed
+and extracted while it is downloaded, and checked against the SHA512SUMS of the
+release before the browser is put in BROWSER_DIR.
+The downloaded bytes are also kept in a .part file, so that an interrupted
+download resumes where it stopped instead of starting over.
+Releases are fetched from ftp.mozilla.org, or from any server with the same
+layout given with --mirror (e.g. a local copy served with python3 -m http.server).
+'''
 import sys
 import os
 import argparse
+import hashlib
+import re
+import shutil
+import tarfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
 
 #                                     VARIABLES                                #
 ZIP_DIR = './zips/'
 BROWSER_DIR = './browsers/'
 MIN_VERSION = 57
+BASE_URL = 'https://ftp.mozilla.org/pub/firefox/releases/'
+WORKERS = 4
+CHUNK_SIZE = 1 << 20
+DEBUG = False
 
 
 #                                     FUNCTIONS                                #
 
-def get_url(version):
+def get_url(version, base_url = BASE_URL):
     ''' Creates the url of a specific version on Mozzila ftp for linux 64 bits.
 
     Parameters:
     version(int): The selected version
+    base_url(str): The releases folder of the ftp, or of a mirror.
 
     Returns:
     String: the url of the version.
     '''
     version_string = str(version) + ".0"
-    url = "https://ftp.mozilla.org/pub/firefox/releases/" + version_string + "/linux-x86_64/en-US/firefox-" + version_string + ".tar.bz2"
+    url = base_url + version_string + "/linux-x86_64/en-US/firefox-" + version_string + ".tar.bz2"
     return url
 
 
-def get_latest_version():
-    ''' Retrieve the latest release version number of Firefox.
-    It will download the zip for the latest.
+def get_latest_version(base_url = BASE_URL):
+    ''' Retrieve the latest release version number of Firefox, from the list of releases.
+
+    Parameters:
+    base_url(str): The releases folder of the ftp, or of a mirror.
 
     Returns:
     int: the latest version available.
     '''
-    subprocess.run("wget --content-disposition -P " + ZIP_DIR +
-                   " 'https://download.mozilla.org/?product=firefox-latest&os=linux64&lang=en-US'",
-                   shell=True, check=True)
-    ffLatestVersion = ""
-    for file in os.listdir(ZIP_DIR):
-        if file.endswith(".tar.bz2"):
-            ffLatestVersion = file
-
-    if ffLatestVersion == "":
-        print("Error downloading Firefox")
+    with urlopen(base_url) as response:
+        listing = response.read().decode('utf-8', 'replace')
+    versions = [int(version) for version in re.findall(r'href="[^"]*?(\d+)\.0/"', listing)]
+    if versions == []:
+        print("Error retrieving the list of Firefox releases")
         sys.exit(1)
-    latest = int(ffLatestVersion.replace("firefox-", "")[:2])
-    return latest
+    return max(versions)
 
-def download_version(version):
-    ''' Download a specific version of Firefox for linux 64 bits.
+
+def get_checksum(version, base_url = BASE_URL):
+    ''' Retrieve the SHA512 checksum of the archive of a version.
 
     Parameters:
-    version(int) The selected version.
+    version(int): The selected version.
+    base_url(str): The releases folder of the ftp, or of a mirror.
+
+    Returns:
+    String: the checksum in hexadecimal, None if the release has none.
     '''
-    url = get_url(version)
-    if not os.path.exists("./zips/firefox-" + str(version) + ".0.tar.bz2"):
-        try:
-            subprocess.run("wget --content-disposition -P " + ZIP_DIR + " " + url, shell=True, check=True)
-        except Exception as e:
-            print("Failed downloading version " + str(version))
-            if DEBUG:
-                print(e)
-                print("url : " + str(url))
-    else:
-        print("Firefox " + str(version) + " is already downloaded, skipping...")
+    version_string = str(version) + ".0"
+    archive = "linux-x86_64/en-US/firefox-" + version_string + ".tar.bz2"
+    try:
+        with urlopen(base_url + version_string + "/SHA512SUMS") as response:
+            sums = response.read().decode('utf-8', 'replace')
+    except HTTPError:
+        return None
+    for line in sums.splitlines():
+        fields = line.split()
+        if len(fields) == 2 and fields[1] == archive:
+            return fields[0]
+    return None
+
+
+class ArchiveReader:
+    ''' File-like object giving the bytes of an archive as they are downloaded.
+    Bytes of a previous partial download are read first, then the remaining
+    bytes from the server, which are appended to the partial download file.
+    All bytes go through a SHA512 hash, to check the archive at the end.
+    '''
+    def __init__(self, part_path, response):
+        self.part = open(part_path, 'r+b' if response is None else 'a+b')
+        self.part.seek(0)
+        self.response = response
+        self.sha512 = hashlib.sha512()
+        self.size = 0
+
+    def read(self, size = CHUNK_SIZE):
+        data = self.part.read(size)
+        if not data and self.response is not None:
+            data = self.response.read(size)
+            self.part.write(data)
+        self.sha512.update(data)
+        self.size += len(data)
+        return data
+
+    def drain(self):
+        ''' Read the end of the archive, after the end of the tar content. '''
+        while self.read(CHUNK_SIZE):
+            pass
+
+    def close(self):
+        self.part.flush()
+        os.fsync(self.part.fileno())
+        self.part.close()
+        if self.response is not None:
+            self.response.close()
+
+
+def open_download(url, part_path):
+    ''' Request an archive, resuming a partial download if there is one.
 
-def extract(version):
-    ''' Exctract the tarball of a specific firefox version. The tarball must be situated in the ZIP_DIR folder.
+    Parameters:
+    url(str): The url of the archive.
+    part_path(str): The file keeping the downloaded bytes.
+
+    Returns:
+    The response of the server, None if the partial download is already complete.
+    '''
+    downloaded = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    request = Request(url)
+    if downloaded > 0:
+        request.add_header('Range', 'bytes=' + str(downloaded) + '-')
+    try:
+        response = urlopen(request)
+    except HTTPError as e:
+        if e.code == 416: # Nothing left to download.
+            return None
+        raise
+    if downloaded > 0 and response.status != 206: # The server sends the whole archive again.
+        open(part_path, 'wb').close()
+    return response
+
+
+def download_version(version, base_url = BASE_URL, clean = True):
+    ''' Download and extract a specific version of Firefox for linux 64 bits.
+    The archive is extracted while it is downloaded, in a temporary folder which
+    is renamed to firefox-version once the checksum is verified.
 
     Parameters:
     version(int): The selected version.
+    base_url(str): The releases folder of the ftp, or of a mirror.
+    clean(bool): Remove the archive after extraction, otherwise keep it in ZIP_DIR.
     '''
-    filename = ZIP_DIR + "firefox-" + str(version) + ".0.tar.bz2"
-    if not os.path.exists(BROWSER_DIR +"firefox-" + str(version)):
-        print("Unpacking firefox-"+str(version))
-        try:
-            subprocess.run("tar -jxf " + filename + " -C " + BROWSER_DIR, shell=True, check=True)
-            subprocess.run("rm "+ BROWSER_DIR + "firefox/updater", shell=True, check=True)
-            subprocess.run("mv " + BROWSER_DIR + "firefox "+ BROWSER_DIR + "firefox-" + str(version),shell=True, check=True)
-        except Exception as e:
-            print("Failed extracting " + filename)
-            if DEBUG:
-                print(e)
-    else:
+    destination = BROWSER_DIR + "firefox-" + str(version)
+    if os.path.exists(destination):
         print("Firefox " + str(version) + " is already unpacked, skipping...")
+        return
+    url = get_url(version, base_url)
+    zip_path = ZIP_DIR + "firefox-" + str(version) + ".0.tar.bz2"
+    part_path = zip_path + ".part"
+    if os.path.exists(zip_path):
+        os.replace(zip_path, part_path)
+        response = None
+    else:
+        response = open_download(url, part_path)
+    checksum = get_checksum(version, base_url)
+    if checksum is None:
+        print("No checksum found for Firefox " + str(version) + ", the archive will not be verified.")
+    tmp_dir = BROWSER_DIR + ".firefox-" + str(version) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    reader = ArchiveReader(part_path, response)
+    try:
+        with tarfile.open(fileobj=reader, mode='r|bz2') as archive:
+            if hasattr(tarfile, 'data_filter'):
+                archive.extractall(tmp_dir, filter='data')
+            else:
+                archive.extractall(tmp_dir)
+        reader.drain()
+    finally:
+        reader.close()
+    if checksum is not None and reader.sha512.hexdigest() != checksum:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.remove(part_path)
+        raise Exception("Wrong checksum for Firefox " + str(version))
+
+    updater = os.path.join(tmp_dir, "firefox", "updater")
+    if os.path.exists(updater):
+        os.remove(updater)
+    os.rename(os.path.join(tmp_dir, "firefox"), destination)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    if clean:
+        os.remove(part_path)
+    else:
+        os.replace(part_path, zip_path)
+    print("Firefox " + str(version) + " unpacked (" + str(reader.size >> 20) + " MB)")
 
 
-
-def firefox_downloader(versions = 'all', clean = True):
-    ''' Download and extract selected versions of Firefox.
+def firefox_downloader(versions = 'all', clean = True, workers = WORKERS, base_url = BASE_URL):
+    ''' Download and extract selected versions of Firefox, several at the same time.
 
     Parameters:
-    versions(list(int) or String): A list containing that the user wish to download, or the string 'all' for versions from 33 to latest - optional, default is 'all' string
+    versions(list(int) or String): A list containing that the user wish to download, or the string 'all' for versions from 57 to latest - optional, default is 'all' string
     clean(bool): Flag indicating to remove tarballs after extraction.
+    workers(int): Number of versions downloaded at the same time.
+    base_url(str): The releases folder of the ftp, or of a mirror.
+
+    Returns:
+    list(int): The versions that could not be downloaded.
     '''
-    if not os.path.exists(ZIP_DIR):
-        os.mkdir(ZIP_DIR)
-    if not os.path.exists(BROWSER_DIR):
-        os.mkdir(BROWSER_DIR)
+    os.makedirs(ZIP_DIR, exist_ok=True)
+    os.makedirs(BROWSER_DIR, exist_ok=True)
 
     if versions == 'all':
-        latest = get_latest_version()
+        latest = get_latest_version(base_url)
         versions = [k for k in range(MIN_VERSION, latest+1)]
 
-    for version in versions:
-        download_version(version)
-        extract(version)
-        if clean:
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        jobs = {executor.submit(download_version, version, base_url, clean): version for version in versions}
+        for job in as_completed(jobs):
+            version = jobs[job]
             try:
-                subprocess.run("rm "+ ZIP_DIR + "firefox-" + str(version) + ".0.tar.bz2", shell=True, check=True)
+                job.result()
             except Exception as e:
+                print("Failed downloading version " + str(version))
+                failed.append(version)
                 if DEBUG:
                     print(e)
+                    print("url : " + get_url(version, base_url))
+    if failed:
+        print("Failed versions: " + str(sorted(failed)) + ". Run again to resume them.")
+    return sorted(failed)
 
 
 def delete(version):
@@ -122,8 +247,10 @@ def delete(version):
     Parameters:
     version(int): Selected version.
     '''
-    subprocess.run("rm ./zips/firefox-" + str(version) + ".0.tar.bz2", shell=True, check=True)
-    subprocess.run("rm -rf ./browsers/firefox-" + str(version), shell=True, check=True)
+    for path in (ZIP_DIR + "firefox-" + str(version) + ".0.tar.bz2", ZIP_DIR + "firefox-" + str(version) + ".0.tar.bz2.part"):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(BROWSER_DIR + "firefox-" + str(version), ignore_errors=True)
 
 
 
@@ -132,19 +259,25 @@ def delete(version):
 
 def parse_arguments():
     parser = argparse.ArgumentParser()
-    parser.add_argument('-d','--debug', help='Activate debug prints', action='store_true',default='False')
+    parser.add_argument('-d','--debug', help='Activate debug prints', action='store_true',default=False)
     parser.add_argument('-v', '--version', help="Set this if you need a single version. Default is all version from 57 to latest.", type=int)
-    parser.add_argument('-z', '--zips', help="Keep compressed browser files. Default is delete.", action='store_true', default='False')
+    parser.add_argument('-z', '--zips', help="Keep compressed browser files. Default is delete.", action='store_true', default=False)
+    parser.add_argument('-w', '--workers', help="Number of versions downloaded at the same time.", type=int, default=WORKERS)
+    parser.add_argument('--mirror', help="Url of the releases folder of a mirror of ftp.mozilla.org.", type=str, default=BASE_URL)
     args = parser.parse_args()
     return args
 
 def main(args):
+    global DEBUG
     if args.debug:
         DEBUG = True
+    base_url = args.mirror if args.mirror.endswith('/') else args.mirror + '/'
     if args.version:
-        firefox_downloader(versions = [args.version], clean = not (args.zips))
+        failed = firefox_downloader(versions = [args.version], clean = not (args.zips), workers = args.workers, base_url = base_url)
     else:
-        firefox_downloader(clean = not (args.zips))
+        failed = firefox_downloader(clean = not (args.zips), workers = args.workers, base_url = base_url)
+    if failed:
+        sys.exit(1)
 
 
 
@@ -0,0 +1,106 @@
+#!usr/bin/python3
+''' Histograms of measurements, accumulated over several results.
+Values are binned with numpy (no loop over the values), either in bins of a
+fixed step, or in logarithmic bins for measurements spanning several orders of
+magnitude. Counts are added result by result, so a histogram over many results
+or files never needs all the measurements in memory at once.
+'''
+# Imports :
+import numpy as np
+
+
+class Histogram:
+    ''' Counts of several kinds of measurements (e.g. hits and misses) in the same bins.
+
+    Parameters:
+    min_value(float): Start of the first bin.
+    max_value(float): Largest value counted, it falls in the last bin.
+    step(float): Size of the bins, for linear bins.
+    log(bool): Use logarithmic bins instead, min_value must then be positive.
+    bins(int): Number of logarithmic bins.
+    kinds(list(str)): Kinds of measurements counted.
+    '''
+    def __init__(self, min_value, max_value, step = 1, log = False, bins = 100, kinds = ('hits', 'misses')):
+        if max_value < min_value:
+            raise Exception('The maximum of the histogram is lower than its minimum')
+        self.min_value = min_value
+        self.step = step
+        self.log = log
+        if log:
+            if min_value <= 0:
+                raise Exception('Logarithmic bins need a positive minimum')
+            self.edges = np.geomspace(min_value, max_value, bins + 1)
+        else:
+            self.edges = min_value + step * np.arange(int((max_value - min_value) // step) + 2)
+        self.counts = {kind: np.zeros(len(self.edges) - 1, dtype=np.int64) for kind in kinds}
+        self.totals = {kind: 0 for kind in kinds}
+
+    def get_bins(self, values):
+        ''' Return the bin of each value, -1 for values out of the histogram. '''
+        values = np.asarray(values)
+        if self.log:
+            bins = np.searchsorted(self.edges, values, side='right') - 1
+            bins[values == self.edges[-1]] = len(self.edges) - 2 # The maximum is in the last bin.
+        else:
+            bins = np.floor((values - self.min_value) / self.step).astype(np.int64)
+        bins[(bins < 0) | (bins >= len(self.edges) - 1)] = -1
+        return bins
+
+    def add(self, kind, values, weights = None):
+        ''' Count measurements.
+        Every measurement counts in the total of its kind, even out of the histogram,
+        so that percentages are relative to all measurements.
+
+        Parameters:
+        kind(str): The kind of the measurements, e.g. 'hits'.
+        values(array-like): The measurements.
+        weights(array-like): Number of measurements of each value, e.g. the counts of a sketch. Default is 1 each.
+        '''
+        bins = self.get_bins(values)
+        inside = bins >= 0
+        if weights is None:
+            self.counts[kind] += np.bincount(bins[inside], minlength=len(self.counts[kind]))
+            self.totals[kind] += len(bins)
+        else:
+            weights = np.asarray(weights, dtype=np.int64)
+            self.counts[kind] += np.bincount(bins[inside], weights=weights[inside], minlength=len(self.counts[kind])).astype(np.int64)
+            self.totals[kind] += int(weights.sum())
+
+    def add_sketch(self, kind, sketch):
+        ''' Count the measurements summarized by a sketch (see sketch.py), each at the lower end of its bucket. '''
+        (values, counts) = sketch.get_buckets()
+        self.add(kind, values, counts)
+
+    def merge(self, other):
+        ''' Add the counts of a histogram with the same bins. '''
+        if not np.array_equal(self.edges, other.edges):
+            raise Exception('Histograms with different bins can not be merged')
+        for kind in self.counts:
+            self.counts[kind] += other.counts[kind]
+            self.totals[kind] += other.totals[kind]
+
+    def get_percents(self, kind):
+        ''' Return the share of the measurements of a kind in each bin, in percent. '''
+        if self.totals[kind] == 0:
+            return np.zeros(len(self.counts[kind]))
+        return self.counts[kind] * 100 / self.totals[kind]
+
+    def get_rows(self, percent = True, sparse = False):
+        ''' Return the histogram as rows (start of the bin, value of each kind).
+
+        Parameters:
+        percent(bool): Give percentages of each kind instead of counts.
+        sparse(bool): Leave out empty bins.
+
+        Returns:
+        list(tuple): One row by bin, in the order of the bins.
+        '''
+        columns = [(self.get_percents(kind) if percent else self.counts[kind]).tolist() for kind in self.counts]
+        starts = self.edges[:-1]
+        if not self.log and float(self.min_value).is_integer() and float(self.step).is_integer():
+            starts = starts.astype(np.int64)
+        keep = np.ones(len(starts), dtype=bool)
+        if sparse:
+            keep = np.any([self.counts[kind] > 0 for kind in self.counts], axis=0)
+        return [(start,) + tuple(column[index] for column in columns)
+                for (index, start) in enumerate(starts.tolist()) if keep[index]]
@@ -10,50 +10,72 @@ import plotly.graph_objects as go
 import sys
 import argparse
 import math
+import numpy as np
 
 # Locals:
+import cache
 import config
+import histogram
+import results_store
+import sketch
 import utility
 
 
 
-''' Write the csv file used to plot histogram in latex.
+''' Write the csv file used to plot histogram in latex, in the layout of data/hitmiss_*_percent.csv.
 
 Parameters:
-results(dict): Dictionnary indexed by timings, containing number of hits and misses for a certain timing.
+histogram(Histogram): Histogram of hits and misses.
 output(string): Path of the output file.
+sparse(bool): Leave out bins without hits nor misses.
 '''
-def hit_miss_csv(results,output):
+def hit_miss_csv(histogram, output, sparse = False):
+    os.makedirs(os.path.dirname(output), exist_ok=True)
     with open(output,'w') as file:
         writer = csv.writer(file,delimiter=' ')
         writer.writerow( ('timing', 'hit','miss') )
-        for timing in results:
-            writer.writerow( (timing, results[timing]['hits'],results[timing]['misses']) )
+        writer.writerows(histogram.get_rows(percent = True, sparse = sparse))
 
-''' Computes the normalized histogram dict given a hit/miss distribution.
+''' Find the largest hit or miss timing of hit/miss results.
 
 Parameters:
-data(dict): Hit and Miss timings.
-min_value(int): Minimal value in the computed histogram.
-max_value(int): Maximal value in the computed histogram.
-step(int): Bin size in the histogram.
+results(iterable(dict)): Hit/miss results, with values or sketches.
+
+Returns:
+(float) The largest timing, None if there are no timings.
+'''
+def get_max(results):
+    maxima = []
+    for result in results:
+        if 'values' in result.get('sketches', {}):
+            if result['sketches']['values']['count'] > 0:
+                maxima.append(result['sketches']['values']['max'])
+        elif len(result['values']) > 0:
+            maxima.append(np.max(result['values']))
+    return max(maxima) if maxima else None
+
+''' Computes the normalized histogram of hit/miss results, result by result.
+Hits and misses are each normalized by their own number of measurements.
+
+Parameters:
+results(iterable(dict)): Hit/miss results, e.g. from results_store.query. Sketched values are counted at the lower end of their buckets.
+min_value(float): Minimal value in the computed histogram.
+max_value(float): Maximal value in the computed histogram.
+step(float): Bin size in the histogram.
+log(bool): Use logarithmic bins.
+bins(int): Number of logarithmic bins.
 
 Returns:
-(dict) The histogram under the form of a dict indexed by timings.
+(Histogram) The histogram of hits and misses.
 '''
-def get_histogram(data, min_value, max_value, step):
-    results = {k: {'hits' : 0, 'misses' : 0} for k in range(min_value,max_value+step,step)}
-    for hit in data['hits']:
-        if hit<max_value and hit>min_value:
-            results[hit//step*step]['hits'] += 1
-    for miss in data['misses']:
-        if miss<max_value and miss>min_value::
-            results[miss//step*step]['misses'] += 1
-    total = len(data['hits'])
-    for key in results:
-        results[key]['hits'] /= (total/100)
-        results[key]['misses'] /= (total/100)
-    return results
+def get_histogram(results, min_value, max_value, step = 1, log = False, bins = 100):
+    hist = histogram.Histogram(min_value, max_value, step, log, bins)
+    for result in results:
+        if 'values' in result.get('sketches', {}):
+            hist.add_sketch(result['hit/miss'], sketch.Sketch.from_dict(result['sketches']['values']))
+        else:
+            hist.add(result['hit/miss'], result['values'])
+    return hist
 
 
 ''' Plot the hit miss histogram.
@@ -97,44 +119,72 @@ def parse_arguments():
     parser.add_argument('-c', '--coop', help = 'Use results with COOP and COEP. Default is off.', action='store_true',default=False)
     parser.add_argument('-p', '--plot', help = 'Plot hit/miss histogram', action='store_true',default=False)
     parser.add_argument('--csv', help = 'Create csv file (for latex)', action='store_true',default=False)
-    parser.add_argument('--step', help = 'Step of the histogram', type=int, default = 1)
-    parser.add_argument('--min', help = 'Min value of the histogram', type=int, default = 0)
-    parser.add_argument('--max', help = 'Max value of the histogram', type=int, default = -1)
+    parser.add_argument('--step', help = 'Step of the histogram', type=float, default = 1)
+    parser.add_argument('--min', help = 'Min value of the histogram', type=float, default = 0)
+    parser.add_argument('--max', help = 'Max value of the histogram', type=float, default = -1)
+    parser.add_argument('--log', help = 'Use logarithmic bins (--min must be positive)', action='store_true',default=False)
+    parser.add_argument('--bins', help = 'Number of logarithmic bins', type=int, default = 100)
+    parser.add_argument('--sparse', help = 'Leave empty bins out of the csv file', action='store_true',default=False)
 
     #parser.add_argument('--clean', help='Delete former result files. Default is false')
     args = parser.parse_args()
     return args
 
+''' Return the hit/miss results of a version and clock, as cached hit and miss arrays (see cache.py).
+Timings stored as sketches are not cached: their results are read from the result files.
+
+Parameters:
+browser(str): Either 'chrome' or 'firefox'.
+version(int): Tested version.
+clock_method(str): Either 'SharedArrayBuffer' or 'performance.now'.
+coop(bool): True if COOP/COEP was enabled.
+
+Returns:
+(iterable(dict)) The results, for get_max and get_histogram.
+'''
+def get_results(browser, version, clock_method, coop):
+    arrays = cache.load(browser, version, lambda: results_store.read_hits_misses(browser, version, clock_method, coop),
+                        name='hit/miss', clock_method=clock_method, coop=coop)
+    if arrays is None:
+        return results_store.query(browser, version, name='hit/miss', clock_method=clock_method, coop=coop)
+    return [{'hit/miss': kind, 'values': arrays[kind]} for kind in ('hits', 'misses')]
+
+''' Return the path of the csv file of a version and clock. '''
+def get_csv_path(browser, version, clock_method, coop):
+    return config.CSV_DIR[browser] + 'hit_miss-' + browser + '-' + str(version) + '-' + clock_method + '-coop-' + str(coop) + '.csv'
+
+''' Write the csv file of the hit/miss histogram of a version and clock.
+
+Parameters:
+browser(str): Either 'chrome' or 'firefox'.
+version(int): Tested version.
+clock_method(str): Either 'SharedArrayBuffer' or 'performance.now'.
+coop(bool): True if COOP/COEP was enabled.
+min_value(float): Minimal value in the histogram.
+max_value(float): Maximal value in the histogram, -1 for the largest timing.
+step, log, bins, sparse: See get_histogram and hit_miss_csv.
+
+Returns:
+(str) The path of the csv file.
+'''
+def export_csv(browser, version, clock_method, coop, min_value = 0, max_value = -1, step = 1, log = False, bins = 100, sparse = False):
+    if max_value == -1:
+        max_value = get_max(get_results(browser, version, clock_method, coop))
+    hist = get_histogram(get_results(browser, version, clock_method, coop), min_value, max_value, step, log, bins)
+    output_path = get_csv_path(browser, version, clock_method, coop)
+    hit_miss_csv(hist, output_path, sparse)
+    return output_path
+
 def main(args):
-    data = utility.read_json(config.RESULTS_DIR[args.browser] + args.browser + '-' + str(args.version) + '.json')
-    (hits,misses) = ([],[])
-    for result in data:
-        if (result['name']=='hit/miss' and result['clock_method'] == args.clock and result['coop'] == args.coop):
-            if result['hit/miss']=='hits':
-                for value in result['values']:
-                    hits.append(value)
-            elif result['hit/miss']=='misses':
-                for value in result['values']:
-                    misses.append(value)
-    if hits == [] or misses == []:
+    if not results_store.list_results(args.browser, [args.version], name='hit/miss', clock_method=args.clock, coop=args.coop):
         print('No results found for ' + args.browser + ' ' + str(args.version) + ' ' + args.clock + ' and COOP/COEP:' +str(args.coop))
         sys.exit(1)
-    results = {'hits':hits,'misses':misses}
-    print(results)
+    max_value = get_max(get_results(args.browser, args.version, args.clock, args.coop)) if args.max==-1 else args.max
     if args.csv:
-        if args.max==-1:
-            max_value= max(max(hits),max(misses))
-        else:
-            max_value = args.max
-        hist = get_histogram(results, args.min, max_value, args.step)
-        output_path = config.CSV_DIR[args.browser] + 'hit_miss-' + args.browser + '-' + str(args.version) + '-' + args.clock + '-coop-' + str(args.coop) + '.csv'
-        hit_miss_csv(hist, output_path)
+        export_csv(args.browser, args.version, args.clock, args.coop, args.min, max_value, args.step, args.log, args.bins, args.sparse)
     if args.plot:
-        if args.max==-1:
-            max_value= max(max(hits),max(misses))
-        else:
-            max_value = args.max
-        plot_hit_miss(results, args.min, max_value, args.step)
+        (hits,misses) = results_store.load_hits_misses(args.browser, args.version, args.clock, args.coop)
+        plot_hit_miss({'hits':hits,'misses':misses}, args.min, max_value, args.step)
 
 
 
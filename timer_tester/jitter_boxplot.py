@@ -5,58 +5,190 @@ The higher the average, the lower the resolution.
 The larger the boxes, the higher the jitter.
 '''
 # Imports :
-import json
 import csv
 import os
-import statistics
+import plotly
 import plotly.graph_objects as go
 import sys
 import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 # Locals:
 import config
-import utility
+import histogram
+import results_store
+import sketch
 
 
-''' Reads data from all tested versions and return them in a buffer
-You must first run client-side tests.
+MAX_OUTLIERS = 200 # Outliers drawn by box, evenly taken among the distinct outlier values.
+
+
+''' Combine the tick distribution runs of a version.
+Runs are concatenated, or if some of them were stored as sketches (see sketch.py),
+all are merged in a sketch.
+
+Parameters:
+results(list(dict)): The tick distribution results of a version.
+
+Returns:
+(np.ndarray or Sketch) The values of all runs, or their sketch.
+'''
+def combine(results):
+    if any('sketches' in result for result in results):
+        summary = sketch.Sketch()
+        for result in results:
+            summary.merge(sketch.from_result(result))
+        return summary
+    return np.concatenate([np.asarray(result['values']) for result in results])
+
+
+''' Compute the box of a version: quartiles, whiskers at the furthest values within
+1.5 interquartile range of the box, and the outliers beyond them.
+
+Parameters:
+data(np.ndarray or Sketch): The values of the version, or their sketch.
+
+Returns:
+(dict) The statistics of the box.
+'''
+def get_box(data):
+    if isinstance(data, sketch.Sketch):
+        (q1, median, q3) = data.get_quantiles([0.25, 0.5, 0.75]).tolist()
+        (values, counts) = data.get_buckets()
+        (mean, sd, count) = (data.mean, data.get_stdev(), data.count)
+    else:
+        (q1, median, q3) = np.percentile(data, [25, 50, 75]).tolist()
+        values = np.unique(data)
+        (mean, sd, count) = (float(np.mean(data)), float(np.std(data, ddof=1)) if len(data) > 1 else 0.0, len(data))
+    inside = (values >= q1 - 1.5 * (q3 - q1)) & (values <= q3 + 1.5 * (q3 - q1))
+    outliers = values[~inside]
+    if len(outliers) > MAX_OUTLIERS:
+        outliers = outliers[np.linspace(0, len(outliers) - 1, MAX_OUTLIERS).astype(np.int64)]
+    return {'q1': q1, 'median': median, 'q3': q3,
+            'lowerfence': float(values[inside].min()), 'upperfence': float(values[inside].max()),
+            'mean': mean, 'sd': sd, 'count': count, 'outliers': outliers.tolist()}
+
+
+''' Load the tick distribution values of a version.
+Values are read through the cache (see cache.py), unless some runs were stored as sketches.
 
 Parameters:
 browser(str): Either 'chrome' or 'firefox'
-coop(bool): Whether COOP/COEP is enabled (change values mainly for firefox)
+version(int): The version.
+coop(bool): Whether COOP/COEP is enabled
 
 Returns:
-data(dict): The values of tick distribution for each version.
+(np.ndarray or Sketch) The values of all runs, or their sketch (see combine).
 '''
+def load_data(browser, version, coop):
+    values = results_store.load_values(browser, version, name='Tick distibution', coop=coop)
+    if values is not None:
+        return values
+    return combine(list(results_store.query(browser, version, name='Tick distibution', coop=coop)))
 
-def get_data(browser, coop):
-    data = {}
-    for file in os.listdir(config.RESULTS_DIR[browser]):
-        path = config.RESULTS_DIR[browser] + file
-        results = utility.read_json(path)
-        for result in results:
-            if result['name'] == 'Tick distibution' and result['coop'] == coop:
-                print(result)
 
-                data[result['version']] = result['values']
-    return data
+''' Load the tick distribution results of a version and compute its box (run in a worker process).
+
+Parameters:
+browser(str): Either 'chrome' or 'firefox'
+version(int): The version.
+coop(bool): Whether COOP/COEP is enabled
 
+Returns:
+(dict) The statistics of the box, None if the version has no results.
+'''
+def load_box(browser, version, coop):
+    data = load_data(browser, version, coop)
+    if isinstance(data, np.ndarray) and len(data) == 0:
+        return None
+    return get_box(data)
 
 
-''' Plot the box graph of the number of ticks in a clock period.
+''' Compute the boxes of all tested versions, loading the result files in parallel.
+You must first run client-side tests.
 
 Parameters:
 browser(str): Either 'chrome' or 'firefox'
 coop(bool): Whether COOP/COEP is enabled (change values mainly for firefox)
+workers(int): Number of versions loaded at the same time.
+
+Returns:
+boxes(dict): The statistics of the box of each version.
+'''
+def get_boxes(browser, coop, workers = None):
+    versions = sorted({version for (version, metadata, length) in results_store.list_results(browser, name='Tick distibution', coop=coop)}, key=str)
+    arguments = ([browser] * len(versions), versions, [coop] * len(versions))
+    if workers == 1: # No pool, e.g. when already running in a worker (see batch_csv.py).
+        loaded = list(map(load_box, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(load_box, *arguments))
+    return {version: box for (version, box) in zip(versions, loaded) if box is not None}
+
+
+''' Write the statistics of the boxes, one line per version (outliers are left out).
+
+Parameters:
+boxes(dict): The statistics of the box of each version.
+output(string): Path of the output file.
 '''
-def box_plot(browser, coop):
-    data = get_data(browser,coop)
-    if data == {}:
-        print('No results found for ' + browser + ' with COOP/COEP: ' + str(coop))
-    print(data)
+def boxes_csv(boxes, output):
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    columns = ('q1', 'median', 'q3', 'lowerfence', 'upperfence', 'mean', 'sd', 'count')
+    with open(output,'w') as file:
+        writer = csv.writer(file,delimiter=' ')
+        writer.writerow(('version',) + columns)
+        for version in sorted(boxes, key=str):
+            writer.writerow((version,) + tuple(boxes[version][column] for column in columns))
+
+
+''' Return the path of the csv file of the boxes. '''
+def get_csv_path(browser, coop):
+    return config.CSV_DIR[browser] + 'jitter-' + browser + '-coop-' + str(coop) + '.csv'
+
+
+''' Write the distribution of the number of ticks in a clock period of a version,
+in the layout of data/distribution_*.csv: number of ticks, count and percentage.
+
+Parameters:
+data(np.ndarray or Sketch): The values of the version, or their sketch.
+output(string): Path of the output file.
+step(int): Width of the bins, in ticks.
+'''
+def distribution_csv(data, output, step = 1):
+    if isinstance(data, sketch.Sketch):
+        hist = histogram.Histogram(0, max(data.max, 0), step, kinds=('values',))
+        hist.add_sketch('values', data)
+    else:
+        hist = histogram.Histogram(0, max(np.max(data), 0) if len(data) > 0 else 0, step, kinds=('values',))
+        hist.add('values', data)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output,'w') as file:
+        writer = csv.writer(file,delimiter=' ')
+        writer.writerow(('value', 'standard', 'normalized'))
+        for ((start, count), (_, percent)) in zip(hist.get_rows(percent=False, sparse=True), hist.get_rows(sparse=True)):
+            writer.writerow((start, count, percent))
+
+
+''' Plot the box graph of the number of ticks in a clock period, from precomputed boxes.
+Only the statistics of each box and a sample of its outliers are sent to plotly.
+
+Parameters:
+boxes(dict): The statistics of the box of each version.
+'''
+def box_plot(boxes):
     fig = go.Figure()
-    for key in sorted(data.keys()):
-        fig.add_trace(go.Box(y=data[key],name = key))
+    colors = plotly.colors.DEFAULT_PLOTLY_COLORS
+    for (index, version) in enumerate(sorted(boxes, key=str)):
+        box = boxes[version]
+        color = colors[index % len(colors)]
+        fig.add_trace(go.Box(x=[str(version)], q1=[box['q1']], median=[box['median']], q3=[box['q3']],
+                             lowerfence=[box['lowerfence']], upperfence=[box['upperfence']],
+                             mean=[box['mean']], sd=[box['sd']], name=str(version), marker_color=color))
+        if box['outliers']:
+            fig.add_trace(go.Scatter(x=[str(version)] * len(box['outliers']), y=box['outliers'], mode='markers',
+                                     marker=dict(size=4, color=color), name=str(version), showlegend=False))
     fig.update_layout(
         paper_bgcolor='rgb(233,233,233)',
         plot_bgcolor='rgb(233,233,233)',
@@ -67,6 +199,9 @@ def parse_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument('-b', '--browser', help='Use a specific browser.', type=str, default='firefox')
     parser.add_argument('-c', '--coop', help = 'Use results with COOP and COEP. Default is off.', action='store_true',default=False)
+    parser.add_argument('-p', '--plot', help = 'Plot the boxes. Default if --csv is not set.', action='store_true',default=False)
+    parser.add_argument('--csv', help = 'Create csv file of the boxes (for latex)', action='store_true',default=False)
+    parser.add_argument('-w', '--workers', help = 'Number of versions loaded at the same time. Default is the number of cores.', type=int, default=None)
 
     #parser.add_argument('--clean', help='Delete former result files. Default is false')
     args = parser.parse_args()
@@ -77,4 +212,11 @@ if __name__ == '__main__':
         sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
         sys.exit(1)
     args = parse_arguments()
-    box_plot(args.browser,args.coop)
+    boxes = get_boxes(args.browser, args.coop, args.workers)
+    if boxes == {}:
+        print('No results found for ' + args.browser + ' with COOP/COEP: ' + str(args.coop))
+        sys.exit(1)
+    if args.csv:
+        boxes_csv(boxes, get_csv_path(args.browser, args.coop))
+    if args.plot or not args.csv:
+        box_plot(boxes)
@@ -0,0 +1,242 @@
+#!usr/bin/python3
+''' Quiet browser profiles, built once and cloned for every launch.
+Background activity of the browsers (telemetry, update checks, safe browsing
+lists, extension and component updates) runs during the measurements and adds
+noise to the cache timings. A template profile disabling these services is built
+once per browser in the profiles folder, and every launch starts from a copy.
+The template is built again when the settings below change.
+
+Browsers can also be started headless, or on a virtual display (Xvfb), see
+DISPLAY in the config file. Headless mode needs Firefox 56 or Chrome 59 at least.
+
+Every launch is timed, from the start of the launch until the webdriver session
+is ready, and the latency is stored as a 'Launch latency' result of the version.
+'''
+# Imports :
+import atexit
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.firefox.firefox_binary import FirefoxBinary
+
+# Locals:
+import config
+import utility
+
+
+FIREFOX_PREFERENCES = {'app.update.enabled': False,
+                       'app.update.auto': False,
+                       'app.update.checkInstallTime': False,
+                       'app.normandy.enabled': False,
+                       'app.shield.optoutstudies.enabled': False,
+                       'toolkit.telemetry.enabled': False,
+                       'toolkit.telemetry.unified': False,
+                       'toolkit.telemetry.archive.enabled': False,
+                       'datareporting.healthreport.uploadEnabled': False,
+                       'datareporting.policy.dataSubmissionEnabled': False,
+                       'browser.ping-centre.telemetry': False,
+                       'browser.newtabpage.activity-stream.feeds.telemetry': False,
+                       'browser.newtabpage.activity-stream.feeds.snippets': False,
+                       'browser.safebrowsing.malware.enabled': False,
+                       'browser.safebrowsing.phishing.enabled': False,
+                       'browser.safebrowsing.downloads.enabled': False,
+                       'browser.safebrowsing.blockedURIs.enabled': False,
+                       'extensions.update.enabled': False,
+                       'extensions.blocklist.enabled': False,
+                       'extensions.getAddons.cache.enabled': False,
+                       'browser.search.update': False,
+                       'media.gmp-manager.updateEnabled': False,
+                       'network.captive-portal-service.enabled': False,
+                       'network.prefetch-next': False,
+                       'network.dns.disablePrefetch': True,
+                       'network.http.speculative-parallel-limit': 0,
+                       'browser.shell.checkDefaultBrowser': False,
+                       'browser.startup.page': 0,
+                       'browser.startup.homepage_override.mstone': 'ignore',
+                       }
+
+CHROME_ARGUMENTS = ['--disable-background-networking',
+                    '--disable-component-update',
+                    '--disable-client-side-phishing-detection',
+                    '--disable-domain-reliability',
+                    '--disable-default-apps',
+                    '--disable-extensions',
+                    '--disable-sync',
+                    '--disable-translate',
+                    '--metrics-recording-only',
+                    '--safebrowsing-disable-auto-update',
+                    '--no-default-browser-check',
+                    '--no-first-run',
+                    ]
+
+CHROME_PREFERENCES = {'safebrowsing': {'enabled': False},
+                      'translate': {'enabled': False},
+                      'browser': {'check_default_browser': False},
+                      'search': {'suggest_enabled': False},
+                      'alternate_error_pages': {'enabled': False},
+                      'net': {'network_prediction_options': 2},
+                      }
+
+STAMP = 'template.json'
+
+virtual_display = None
+
+
+def get_settings(browser):
+    ''' Return the settings a template is built from, to detect outdated templates. '''
+    if browser == 'firefox':
+        return {'preferences': FIREFOX_PREFERENCES}
+    return {'preferences': CHROME_PREFERENCES}
+
+
+def build_template(browser, path):
+    ''' Write a quiet profile in a folder.
+    Firefox reads the preferences from user.js, Chrome from Default/Preferences.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    path(str): The folder of the profile.
+    '''
+    if browser == 'firefox':
+        with open(os.path.join(path, 'user.js'), 'w') as file:
+            for (name, value) in FIREFOX_PREFERENCES.items():
+                file.write('user_pref(' + json.dumps(name) + ', ' + json.dumps(value) + ');\n')
+    else:
+        os.makedirs(os.path.join(path, 'Default'))
+        with open(os.path.join(path, 'Default', 'Preferences'), 'w') as file:
+            json.dump(CHROME_PREFERENCES, file)
+        open(os.path.join(path, 'First Run'), 'w').close()
+    with open(os.path.join(path, STAMP), 'w') as file:
+        json.dump(get_settings(browser), file)
+
+
+def get_template(browser):
+    ''' Return the template profile of a browser, building it if needed.
+    It is built in a temporary folder and then renamed, so that processes
+    launching browsers at the same time never see a partial template.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+
+    Returns:
+    String: The path to the template.
+    '''
+    path = config.PROFILE_DIR[browser] + 'template'
+    stamp = os.path.join(path, STAMP)
+    if os.path.exists(stamp) and utility.read_json(stamp) == get_settings(browser):
+        return path
+    os.makedirs(config.PROFILE_DIR[browser], exist_ok=True)
+    new_path = tempfile.mkdtemp(dir=config.PROFILE_DIR[browser])
+    build_template(browser, new_path)
+    if os.path.exists(path):
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(new_path, path)
+    except OSError: # Built by another process in the meantime.
+        shutil.rmtree(new_path, ignore_errors=True)
+    return path
+
+
+def start_virtual_display():
+    ''' Start Xvfb once for this process, and make browsers use it. '''
+    global virtual_display
+    if virtual_display is not None:
+        return
+    (read_end, write_end) = os.pipe()
+    virtual_display = subprocess.Popen(['Xvfb', '-displayfd', str(write_end), '-screen', '0', '1280x1024x24', '-nolisten', 'tcp'],
+                                       pass_fds=(write_end,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(write_end)
+    with os.fdopen(read_end) as file:
+        display = file.readline().strip()
+    if not display:
+        raise Exception('Xvfb could not be started')
+    os.environ['DISPLAY'] = ':' + display
+    atexit.register(virtual_display.terminate)
+
+
+def firefox_profile():
+    ''' Return a copy of the quiet Firefox profile, to be customized with more preferences. '''
+    return webdriver.FirefoxProfile(get_template('firefox'))
+
+
+def start_firefox(binary_path, profile = None):
+    ''' Start Firefox with a copy of the quiet profile.
+
+    Parameters:
+    binary_path(str): Path of the Firefox executable.
+    profile(webdriver.FirefoxProfile): A profile from firefox_profile(). Default is the quiet profile.
+
+    Returns:
+    webdriver.Firefox: The browser. It must be closed by the caller.
+    '''
+    if profile is None:
+        profile = firefox_profile()
+    options = webdriver.FirefoxOptions()
+    if config.DISPLAY == 'headless':
+        options.add_argument('-headless')
+    return webdriver.Firefox(firefox_binary=FirefoxBinary(binary_path), firefox_profile=profile, options=options)
+
+
+def start_chrome(binary_path, driver_path):
+    ''' Start Chrome with a copy of the quiet profile.
+    The copy is removed when the browser is closed.
+
+    Parameters:
+    binary_path(str): Path of the Chrome executable.
+    driver_path(str): Path of the chromedriver.
+
+    Returns:
+    webdriver.Chrome: The browser. It must be closed by the caller.
+    '''
+    user_data_dir = tempfile.mkdtemp(prefix='chrome-profile-')
+    shutil.copytree(get_template('chrome'), user_data_dir, dirs_exist_ok=True)
+    options = Options()
+    options.binary_location = binary_path
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    options.add_argument('--user-data-dir=' + user_data_dir)
+    if config.DISPLAY == 'headless':
+        options.add_argument('--headless')
+    try:
+        driver = webdriver.Chrome(driver_path, options = options)
+    except:
+        shutil.rmtree(user_data_dir, ignore_errors=True)
+        raise
+    close = driver.quit
+    def quit():
+        try:
+            close()
+        finally:
+            shutil.rmtree(user_data_dir, ignore_errors=True)
+    driver.quit = quit
+    return driver
+
+
+def launch(browser, version, start):
+    ''' Start a browser, and store how long it took to be ready.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+    start(function): Starts the browser (e.g. with start_firefox) and returns its webdriver.
+
+    Returns:
+    WebDriver: The browser. It must be closed by the caller.
+    '''
+    if config.DISPLAY == 'xvfb':
+        start_virtual_display()
+    begin = time.perf_counter()
+    driver = start()
+    latency = time.perf_counter() - begin
+    print('Browser ready in ' + str(round(latency, 2)) + 's')
+    utility.write_results({'name': 'Launch latency',
+                           'version': version,
+                           'latency': latency,
+                           'display': config.DISPLAY,
+                           }, version, browser)
+    return driver
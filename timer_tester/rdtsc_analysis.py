@@ -0,0 +1,223 @@
+#!usr/bin/python3
+''' Tools to analyze the rdtsc results, the cost of our timers measured with performance.rdtsc.
+rdtsc runs (see test_rdtsc in the testers) store, in cycles of the time stamp counter:
+- overhead: two performance.rdtsc calls in a row,
+- perf: a performance.now clock period (from one edge to the next), its resolution,
+- perf_call: a call to performance.now,
+- sab_read: a read of a SharedArrayBuffer clock,
+- sab_incr: an increment of a SharedArrayBuffer clock, its resolution.
+
+The overhead of performance.rdtsc is removed from each measurement: the median
+overhead of its run, robust to the interrupts and migrations which make some
+overheads very long. Cycles are converted to nanoseconds with the frequency of the
+time stamp counter, calibrated in the page against performance.now over a second
+(stored as tsc_ghz), or read from the host (/sys or /proc/cpuinfo), or given with --tsc_ghz.
+'''
+# Imports :
+import csv
+import os
+import re
+import sys
+import argparse
+import numpy as np
+
+# Locals:
+import config
+import results_store
+import sketch
+import utility
+
+
+MEASURES = {'perf': 'performance.now resolution',
+            'perf_call': 'performance.now call',
+            'sab_read': 'SAB read',
+            'sab_incr': 'SAB increment (resolution)',
+            }
+TSC_FREQ_PATH = '/sys/devices/system/cpu/cpu0/tsc_freq_khz'
+CPUINFO_PATH = '/proc/cpuinfo'
+
+
+''' Return the frequency of the time stamp counter.
+Calibrations stored in the results come first: they were measured on the host which ran the tests.
+Otherwise, the frequency is read from this host, which must then be the one which ran the tests.
+
+Parameters:
+results(list(dict)): rdtsc results, some with a tsc_ghz calibration.
+
+Returns:
+(float, str) The frequency in GHz and where it comes from, (None, None) if it is unknown.
+'''
+def get_tsc_ghz(results = ()):
+    calibrations = [result['tsc_ghz'] for result in results if result.get('tsc_ghz')]
+    if calibrations:
+        return (float(np.median(calibrations)), 'calibrated in ' + str(len(calibrations)) + ' run(s)')
+    try:
+        with open(TSC_FREQ_PATH, 'r') as file:
+            return (int(file.read()) / 1e6, TSC_FREQ_PATH)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(CPUINFO_PATH, 'r') as file:
+            nominal = re.search(r'^model name\s*:.*@\s*([0-9.]+)\s*GHz', file.read(), re.MULTILINE)
+        if nominal: # The time stamp counter runs at the nominal frequency of the CPU.
+            return (float(nominal.group(1)), CPUINFO_PATH)
+    except OSError:
+        pass
+    return (None, None)
+
+
+''' Return the measurements of a result, stored either as values or as a sketch.
+Sketched measurements are expanded to the lower end of their buckets.
+
+Parameters:
+result(dict): An rdtsc result.
+key(str): The measurement, e.g. 'perf'.
+
+Returns:
+(np.ndarray) The measurements in cycles, None if the result does not have them.
+'''
+def get_values(result, key):
+    if key in result:
+        return np.asarray(result[key], dtype=np.float64)
+    if key in result.get('sketches', {}):
+        (values, counts) = sketch.Sketch.from_dict(result['sketches'][key]).get_buckets()
+        return np.repeat(values, counts)
+    return None
+
+
+''' Gather the measurements of the rdtsc results, without the overhead of performance.rdtsc.
+
+Parameters:
+results(list(dict)): rdtsc results.
+
+Returns:
+(dict, dict) For each measurement of MEASURES, all its values in cycles (clamped at 0), and the median overhead of all runs.
+'''
+def get_cycles(results):
+    cycles = {key: [] for key in MEASURES}
+    overheads = {key: [] for key in MEASURES}
+    for result in results:
+        overhead = get_values(result, 'overhead')
+        overhead = 0.0 if overhead is None or len(overhead) == 0 else float(np.median(overhead))
+        for key in MEASURES:
+            values = get_values(result, key)
+            if values is not None and len(values) > 0:
+                cycles[key].append(np.maximum(values - overhead, 0))
+                overheads[key].append(overhead)
+    return ({key: results_store.concatenate(cycles[key]) for key in MEASURES},
+            {key: float(np.median(overheads[key])) if overheads[key] else None for key in MEASURES})
+
+
+''' Return the stored rdtsc results of a browser.
+
+Parameters:
+browser(str): Either 'chrome' or 'firefox'.
+coop(bool): Only keep results with (True) or without (False) COOP/COEP. Default is all results.
+
+Returns:
+(list(dict)) The results.
+'''
+def load_results(browser, coop = None):
+    filters = {'name': 'rdtsc'} if coop is None else {'name': 'rdtsc', 'coop': coop}
+    if 'rdtsc' not in results_store.list_versions(browser):
+        return []
+    return list(results_store.query(browser, 'rdtsc', **filters))
+
+
+''' Computes the resolution and per-call cost of the timers of a browser, in nanoseconds.
+
+Parameters:
+browser(str): Either 'chrome' or 'firefox'.
+coop(bool): Only use results with (True) or without (False) COOP/COEP. Default is all results.
+tsc_ghz(float): Frequency of the time stamp counter. Default is get_tsc_ghz.
+
+Returns:
+(list(dict), float, str) For each measurement with values: its name, description, count, median overhead (cycles)
+and statistics in nanoseconds (see utility.get_stats_batch). Then the frequency used and where it comes from.
+'''
+def analyze(browser, coop = None, tsc_ghz = None):
+    results = load_results(browser, coop)
+    if results == []:
+        return ([], tsc_ghz, None)
+    (ghz, source) = (tsc_ghz, '--tsc_ghz') if tsc_ghz else get_tsc_ghz(results)
+    if ghz is None:
+        raise Exception('Unknown frequency of the time stamp counter: set --tsc_ghz')
+    (cycles, overheads) = get_cycles(results)
+    keys = [key for key in MEASURES if len(cycles[key]) > 0]
+    stats = utility.get_stats_batch([cycles[key] / ghz for key in keys])
+    rows = [dict(measure=key, description=MEASURES[key], count=len(cycles[key]), overhead=overheads[key], **key_stats)
+            for (key, key_stats) in zip(keys, stats)]
+    return (rows, ghz, source)
+
+
+#                                   DISPLAY                                    #
+COLUMNS = ['measure', 'count', 'overhead', 'median', 'average', 'standard_deviation', 'min', 'p5', 'p25', 'p75', 'p95', 'max']
+
+def get_csv_path(browser, coop):
+    ''' Return the path of the csv file of a browser. '''
+    return config.CSV_DIR[browser] + 'rdtsc-' + browser + '-coop-' + str(coop) + '.csv'
+
+def get_row(row):
+    ''' Flatten the percentiles of a row, as p5, p25... '''
+    flat = dict(row)
+    for (percentile, value) in row['percentiles'].items():
+        flat['p' + percentile] = value
+    return flat
+
+def rdtsc_csv(rows, output):
+    ''' Write the statistics of each measurement, in nanoseconds (overhead in cycles). '''
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output,'w') as file:
+        writer = csv.writer(file,delimiter=' ')
+        writer.writerow(COLUMNS)
+        for row in rows:
+            flat = get_row(row)
+            writer.writerow([flat[column] for column in COLUMNS])
+
+def print_rdtsc(rows, ghz, source):
+    print('TSC frequency: ' + str(round(ghz, 3)) + ' GHz (' + source + ')')
+    print('measure count overhead(cycles) median(ns) average(ns) p5(ns) p95(ns)')
+    for row in rows:
+        flat = get_row(row)
+        print(row['description'] + ' ' + str(row['count']) + ' ' + str(round(row['overhead'], 1)) + ' '
+              + ' '.join(str(round(flat[column], 1)) for column in ('median', 'average', 'p5', 'p95')))
+
+def plot_rdtsc(rows):
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    for row in rows:
+        flat = get_row(row)
+        fig.add_trace(go.Box(x=[row['description']], q1=[flat['p25']], median=[flat['median']], q3=[flat['p75']],
+                             lowerfence=[flat['p5']], upperfence=[flat['p95']], mean=[flat['average']], name=row['description']))
+    fig.update_yaxes(type='log', title='ns')
+    fig.show()
+
+
+#                                     MAIN                                     #
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--browser', help='Use a specific browser.', type=str, default='firefox')
+    parser.add_argument('-c', '--coop', help = 'Use results with COOP and COEP. Default is off.', action='store_true',default=False)
+    parser.add_argument('--tsc_ghz', help='Frequency of the time stamp counter, in GHz. Default is the calibration stored in the results, or this host frequency.', type=float)
+    parser.add_argument('-p', '--plot', help = 'Plot the timers costs', action='store_true',default=False)
+    parser.add_argument('--csv', help = 'Create csv file (for latex)', action='store_true',default=False)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
+        sys.exit(1)
+    args = parse_arguments()
+    (rows, ghz, source) = analyze(args.browser, args.coop, args.tsc_ghz)
+    if rows == []:
+        print('No rdtsc results found for ' + args.browser + ' and COOP/COEP:' + str(args.coop))
+        sys.exit(1)
+    print_rdtsc(rows, ghz, source)
+    if args.csv:
+        rdtsc_csv(rows, get_csv_path(args.browser, args.coop))
+    if args.plot:
+        plot_rdtsc(rows)
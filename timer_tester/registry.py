@@ -0,0 +1,143 @@
+#!usr/bin/python3
+''' Installed browser versions, and the paths of their executables and drivers.
+Browsers are found in the browsers folder of each browser (see BROWSER_DIR in
+the config file), extracted by the downloaders as <browser>-<version>, where the
+version is a major version (e.g. firefox-86) or a full one (e.g. firefox-102.0.1).
+
+The folders are only listed when a version is first needed, and listed again
+only if the folder changed since (its modification time), so that scripts which
+do not launch browsers never look at them.
+'''
+# Imports :
+import os
+import re
+import shutil
+
+# Locals:
+import config
+
+
+FOLDER_PATTERN = re.compile(r'^(?P<browser>[a-z]+)-(?P<version>\d+(?:\.\d+)*)$')
+
+# Executable of each browser, in the folder of a version.
+EXECUTABLES = {'firefox': 'firefox',
+               'chrome': 'opt/google/chrome/google-chrome',
+               }
+
+# For each browser folder: (modification time, {major version: full version}).
+cache = {}
+
+
+def parse_folder(browser, folder):
+    ''' Read the version of a browser folder.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    folder(str): Name of the folder, e.g. 'firefox-102.0.1'.
+
+    Returns:
+    String: The full version, e.g. '102.0.1', None if the folder is not a version of the browser.
+    '''
+    found = FOLDER_PATTERN.match(folder)
+    if found is None or found.group('browser') != browser:
+        return None
+    return found.group('version')
+
+
+def get_major(version):
+    ''' Return the major version of a full version, e.g. 102 for '102.0.1'. '''
+    return int(str(version).split('.')[0])
+
+
+def get_installed(browser, browser_dir = None):
+    ''' Find the installed versions of a browser.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    browser_dir(str): The browsers folder. Default is set in config file.
+
+    Returns:
+    dict: The full version of each installed major version, empty if the folder does not exist.
+    '''
+    browser_dir = browser_dir or config.BROWSER_DIR[browser]
+    try:
+        mtime = os.stat(browser_dir).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if browser_dir in cache and cache[browser_dir][0] == mtime:
+        return cache[browser_dir][1]
+    installed = {}
+    for folder in os.listdir(browser_dir):
+        version = parse_folder(browser, folder)
+        if version is not None and os.path.isdir(os.path.join(browser_dir, folder)):
+            major = get_major(version)
+            if major not in installed or len(version) > len(installed[major]):
+                installed[major] = version
+    cache[browser_dir] = (mtime, installed)
+    return installed
+
+
+def get_versions(browser, browser_dir = None):
+    ''' Return the installed major versions of a browser, sorted.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    browser_dir(str): The browsers folder. Default is set in config file.
+
+    Returns:
+    list(int): The versions.
+    '''
+    return sorted(get_installed(browser, browser_dir))
+
+
+def get_folder(browser, version, browser_dir = None):
+    ''' Return the folder of an installed version.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int): The major version.
+    browser_dir(str): The browsers folder. Default is set in config file.
+
+    Returns:
+    String: The path to the folder of the version.
+    '''
+    browser_dir = browser_dir or config.BROWSER_DIR[browser]
+    installed = get_installed(browser, browser_dir)
+    if version not in installed:
+        raise Exception(browser + ' ' + str(version) + ' is not installed in ' + browser_dir)
+    return os.path.join(browser_dir, browser + '-' + installed[version])
+
+
+def get_binary(browser, version):
+    ''' Return the path of the executable of an installed version.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int): The major version.
+
+    Returns:
+    String: The path to the executable.
+    '''
+    return os.path.join(get_folder(browser, version), EXECUTABLES[browser])
+
+
+def get_driver(browser, version):
+    ''' Return the path of the webdriver of an installed version.
+    ChromeDrivers come from the driver cache (see drivers.py). The GeckoDriver
+    works for all tested Firefox versions: it is taken from the Firefox driver
+    folder if it is there, otherwise from the PATH.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): The major version, or 'rdtsc'.
+
+    Returns:
+    String: The path to the driver, None if no GeckoDriver is found.
+    '''
+    if browser == 'chrome':
+        import drivers # Only needed for Chrome.
+        return drivers.get_driver(version)
+    local_driver = os.path.join(config.FIREFOX_DRIVER, 'geckodriver')
+    if os.access(local_driver, os.X_OK):
+        return local_driver
+    return shutil.which('geckodriver')
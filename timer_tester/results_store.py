@@ -0,0 +1,553 @@
+#!usr/bin/python3
+''' Append-only storage for experiment results.
+Results of a browser version are stored in the results folder of the browser,
+in a JSON Lines file named <browser>-<version>.jsonl: one result per line.
+Adding a result only appends a line to the file, and each append is flushed to
+the disk before returning, so a crash can at most lose the result being written.
+
+Measurement values can also be stored as binary .npy files (see VALUES_FORMAT in
+the config file). They are written in a <browser>-<version> folder next to the
+result file, and the result only keeps their file names under 'arrays'. When
+reading, they are memory-mapped and put back in the result as numpy arrays.
+With the 'sketch' format, the values of long distribution and rdtsc runs are
+only kept as mergeable summaries (see sketch.py), under 'sketches'.
+
+Each browser also has an index of its results (see catalog.py), updated on every
+append, so that query() only reads the results matching its filters.
+
+Result files written by previous versions of the testers (<browser>-<version>.json,
+a single JSON array) are still read, and can be converted with:
+    python3 results_store.py --migrate
+'''
+# Imports :
+import json
+import os
+import sys
+import argparse
+import fcntl
+import uuid
+import sqlite3
+import numpy as np
+
+# Locals:
+import cache
+import catalog
+import config
+import sketch
+
+
+EXTENSION = '.jsonl'
+LEGACY_EXTENSION = '.json'
+
+
+def get_path(browser, version, extension = EXTENSION):
+    ''' Return the path of the result file of a version.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+    extension(str): EXTENSION for the current format, LEGACY_EXTENSION for the old one.
+
+    Returns:
+    String: The path to the result file.
+    '''
+    if browser not in config.SUPPORTED_BROWSERS:
+        raise Exception('Select a valid browser')
+    return config.RESULTS_DIR[browser] + browser + '-' + str(version) + extension
+
+
+def get_array_dir(browser, version):
+    ''' Return the folder containing the binary value arrays of a version.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+
+    Returns:
+    String: The path to the folder.
+    '''
+    return config.RESULTS_DIR[browser] + browser + '-' + str(version) + '/'
+
+
+def is_value_array(value):
+    ''' Check if a result field is an array of measurements.
+
+    Parameters:
+    value: A field of a result.
+
+    Returns:
+    bool: True for non empty lists of numbers and numeric numpy arrays.
+    '''
+    if isinstance(value, np.ndarray):
+        return value.dtype.kind in 'iuf' and value.size > 0
+    if not isinstance(value, list) or value == []:
+        return False
+    return all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in value)
+
+
+def get_dtype(values):
+    ''' Select the most compact type able to store measurements exactly.
+
+    Parameters:
+    values(np.ndarray): The measurements.
+
+    Returns:
+    np.dtype: uint32 for small non-negative integers, int64 for other integers, float64 otherwise.
+    '''
+    if values.dtype.kind in 'iu' or np.array_equal(values, np.floor(values)):
+        if values.min() >= 0 and values.max() < 2**32:
+            return np.dtype(np.uint32)
+        if np.abs(values).max() < 2**63:
+            return np.dtype(np.int64)
+    return np.dtype(np.float64)
+
+
+def write_array(values, path):
+    ''' Write an array as a .npy file.
+    The file is written under a temporary name and renamed once synced, so a
+    result never references a partially written file.
+
+    Parameters:
+    values(np.ndarray): The measurements.
+    path(str): Path of the .npy file.
+    '''
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.save(file, values.astype(get_dtype(values)))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def store_arrays(results, version, browser):
+    ''' Move the measurement arrays of a result to .npy files.
+
+    Parameters:
+    results(dict): The result to store.
+    version(int or str): Tested version, or 'rdtsc'.
+    browser(str): Either 'chrome' or 'firefox'.
+
+    Returns:
+    dict: A copy of the result, where arrays are replaced by their file names under 'arrays'.
+    '''
+    results = dict(results)
+    arrays = dict(results.get('arrays', {}))
+    directory = get_array_dir(browser, version)
+    for key in [key for key in results if is_value_array(results[key])]:
+        os.makedirs(directory, exist_ok=True)
+        filename = uuid.uuid4().hex + '-' + key + '.npy'
+        write_array(np.asarray(results.pop(key)), directory + filename)
+        arrays[key] = filename
+    if arrays:
+        results['arrays'] = arrays
+    return results
+
+
+def store_sketches(results):
+    ''' Replace the measurement arrays of a result by their sketches (see sketch.py).
+
+    Parameters:
+    results(dict): The result to store.
+
+    Returns:
+    dict: A copy of the result, where arrays are replaced by their sketches under 'sketches'.
+    '''
+    results = dict(results)
+    sketches = dict(results.get('sketches', {}))
+    for key in [key for key in results if is_value_array(results[key])]:
+        summary = sketch.Sketch()
+        summary.add(results.pop(key))
+        sketches[key] = summary.to_dict()
+    if sketches:
+        results['sketches'] = sketches
+    return results
+
+
+def to_json(value):
+    ''' Serialize numpy values in results, used as default in json.dumps. '''
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Object of type ' + type(value).__name__ + ' is not JSON serializable')
+
+
+def append_result(results, version, browser, values_format = None):
+    ''' Append a result to the result file of a version.
+    The line is written with a single write call and synced to the disk, while
+    holding an exclusive lock on the file, so appends from several processes
+    never interleave. If a previous crash left an unfinished line, it is terminated first so that
+    it cannot corrupt the new result.
+
+    Parameters:
+    results(dict): The result to store.
+    version(int or str): Tested version, or 'rdtsc'.
+    browser(str): Either 'chrome' or 'firefox'.
+    values_format(str): 'json', 'npy' or 'sketch'. Default is set in config file.
+    '''
+    path = get_path(browser, version)
+    os.makedirs(config.RESULTS_DIR[browser], exist_ok=True)
+    values_format = values_format or config.VALUES_FORMAT
+    if values_format == 'npy':
+        results = store_arrays(results, version, browser)
+    elif values_format == 'sketch' and results.get('name') in config.SKETCH_RESULTS:
+        results = store_sketches(results)
+    line = (json.dumps(results, default=to_json) + '\n').encode()
+    with open(path, 'ab+') as file:
+        fcntl.flock(file, fcntl.LOCK_EX) # Several processes can write results of the same version.
+        if file.seek(0, os.SEEK_END) > 0:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b'\n':
+                line = b'\n' + line
+        file.write(line)
+        file.flush()
+        os.fsync(file.fileno())
+    cache.invalidate(browser, version)
+    try:
+        update_index(browser, [version])
+    except sqlite3.Error as e: # The result is safe, the index will catch up on the next query.
+        print('Could not update the index of ' + browser + ' results: ' + str(e))
+
+
+def load_arrays(result, browser, version, mmap = True):
+    ''' Put the arrays stored as .npy files back in a result.
+
+    Parameters:
+    result(dict): A stored result, modified in place.
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+    mmap(bool): Memory-map the files instead of reading them.
+
+    Returns:
+    dict: The result.
+    '''
+    directory = get_array_dir(browser, version)
+    for (key, filename) in result.pop('arrays', {}).items():
+        result[key] = np.load(directory + filename, mmap_mode = 'r' if mmap else None)
+    return result
+
+
+def iter_results(browser, version, arrays = True):
+    ''' Iterate over the results of a version, oldest first.
+    Results from a legacy file come before the ones of the JSON Lines file.
+    Lines that cannot be parsed (interrupted write) are skipped with a warning.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+    arrays(bool): Memory-map arrays stored as .npy files. If False, results keep their file names under 'arrays'.
+
+    Yields:
+    dict: A stored result.
+    '''
+    legacy_path = get_path(browser, version, LEGACY_EXTENSION)
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'r') as file:
+            for result in json.load(file):
+                yield result
+    path = get_path(browser, version)
+    if not os.path.exists(path):
+        return
+    with open(path, 'r') as file:
+        for (number, line) in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                result = json.loads(line)
+            except json.decoder.JSONDecodeError:
+                print('Skipping corrupted line ' + str(number) + ' of ' + path)
+                continue
+            if arrays:
+                load_arrays(result, browser, version)
+            yield result
+
+
+def read_results(browser, version):
+    ''' Read all the results of a version.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+
+    Returns:
+    list(dict): The stored results, oldest first.
+    '''
+    return list(iter_results(browser, version))
+
+
+def list_versions(browser):
+    ''' List the versions having results for a browser.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+
+    Returns:
+    list: The versions, as int when numeric (e.g. 'rdtsc' stays a string).
+    '''
+    if not os.path.exists(config.RESULTS_DIR[browser]):
+        return []
+    versions = set()
+    for file in os.listdir(config.RESULTS_DIR[browser]):
+        for extension in (EXTENSION, LEGACY_EXTENSION):
+            if file.startswith(browser + '-') and file.endswith(extension):
+                version = file[len(browser) + 1:-len(extension)]
+                versions.add(int(version) if version.isdigit() else version)
+    return sorted(versions, key=str)
+
+
+def update_index(browser, versions):
+    ''' Index the results added to the result files of some versions.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    versions(list): The versions to update.
+    '''
+    connection = catalog.connect(browser)
+    try:
+        for version in versions:
+            catalog.update_file(connection, version, get_path(browser, version), get_array_dir(browser, version))
+    finally:
+        connection.close()
+
+
+def match(result, filters):
+    ''' Check if a result has the field values given in filters (see query). '''
+    return all(result.get(key.replace('hit_miss', 'hit/miss')) == value for (key, value) in filters.items())
+
+
+def query(browser, version = None, arrays = True, **filters):
+    ''' Iterate over the results matching some metadata, using the index.
+    Only the lines of the matching results are read from the result files.
+    Legacy json files are not indexed: they are read entirely and filtered.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Only look at a version. Default is all versions.
+    arrays(bool): Memory-map arrays stored as .npy files.
+    filters: Required values of result fields among name, clock_method, coop and hit_miss,
+    e.g. query('firefox', name='Tick distibution', coop=True).
+
+    Yields:
+    dict: A matching result, in file order.
+    '''
+    versions = list_versions(browser) if version is None else [version]
+    update_index(browser, versions)
+    connection = catalog.connect(browser)
+    try:
+        found = catalog.find(connection, None if version is None else [version], **filters)
+    finally:
+        connection.close()
+
+    for legacy_version in versions:
+        legacy_path = get_path(browser, legacy_version, LEGACY_EXTENSION)
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r') as file:
+                for result in json.load(file):
+                    if match(result, filters):
+                        yield result
+
+    file = None
+    try:
+        for (found_version, path, offset, size, _, _) in found:
+            if file is None or file.name != path:
+                if file is not None:
+                    file.close()
+                file = open(path, 'rb')
+            file.seek(offset)
+            result = json.loads(file.read(size))
+            if arrays:
+                load_arrays(result, browser, int(found_version) if found_version.isdigit() else found_version)
+            yield result
+    finally:
+        if file is not None:
+            file.close()
+
+
+def list_results(browser, versions = None, **filters):
+    ''' List the stored results matching some metadata, without reading their measurements.
+    Legacy json files are not indexed: they are read entirely and filtered.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    versions(list): Only look at these versions. Default is all versions.
+    filters: Required values of result fields, as in query.
+
+    Returns:
+    list((version, dict, int)): For each result, its version, its metadata (measurement arrays excluded)
+    and its number of values (None if it has no values).
+    '''
+    versions = list_versions(browser) if versions is None else versions
+    update_index(browser, versions)
+    listed = []
+    for version in versions:
+        legacy_path = get_path(browser, version, LEGACY_EXTENSION)
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r') as file:
+                for result in json.load(file):
+                    if match(result, filters):
+                        listed.append((version, catalog.get_metadata(result), len(result['values']) if 'values' in result else None))
+    connection = catalog.connect(browser)
+    try:
+        found = catalog.find(connection, versions, **filters)
+    finally:
+        connection.close()
+    for (version, _, _, _, length, metadata) in found:
+        listed.append((int(version) if version.isdigit() else version, metadata, length))
+    return listed
+
+
+def read_hits_misses(browser, version, clock_method, coop):
+    ''' Gather all hit and miss timings of a version for a clock from the result files (see load_hits_misses).
+
+    Returns:
+    dict: Hit timings and miss timings, under 'hits' and 'misses'. None if some were stored as sketches.
+    '''
+    (hits, misses) = ([], [])
+    for result in query(browser, version, name='hit/miss', clock_method=clock_method, coop=coop):
+        if 'values' not in result:
+            return None
+        if result['hit/miss']=='hits':
+            hits.append(np.asarray(result['values']))
+        elif result['hit/miss']=='misses':
+            misses.append(np.asarray(result['values']))
+    return {'hits': concatenate(hits), 'misses': concatenate(misses)}
+
+
+def load_hits_misses(browser, version, clock_method, coop):
+    ''' Gather all hit and miss timings of a version for a clock.
+    Timings of different runs of the same experiment are merged.
+    They are cached (see cache.py), so they are only read from the result files once.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int): Tested version.
+    clock_method(str): Either 'SharedArrayBuffer' or 'performance.now'.
+    coop(bool): True if COOP/COEP was enabled.
+
+    Returns:
+    (np.ndarray, np.ndarray): Hit timings and miss timings.
+    '''
+    arrays = cache.load(browser, version, lambda: read_hits_misses(browser, version, clock_method, coop),
+                        name='hit/miss', clock_method=clock_method, coop=coop)
+    if arrays is None:
+        raise Exception('Hit/miss timings of ' + browser + ' ' + str(version) + ' are stored as sketches')
+    return (arrays['hits'], arrays['misses'])
+
+
+def read_values(browser, version, **filters):
+    ''' Gather the values of the results matching some metadata from the result files (see load_values).
+
+    Returns:
+    dict: The values, under 'values'. None if some were stored as sketches.
+    '''
+    values = []
+    for result in query(browser, version, **filters):
+        if 'values' not in result:
+            return None
+        values.append(np.asarray(result['values']))
+    return {'values': concatenate(values)}
+
+
+def load_values(browser, version, **filters):
+    ''' Gather the values of the results of a version matching some metadata, e.g. tick distributions.
+    Values of different runs are merged, and cached (see cache.py).
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+    filters: Required values of result fields, as in query.
+
+    Returns:
+    np.ndarray: The values, None if some results only have sketches of their values.
+    '''
+    arrays = cache.load(browser, version, lambda: read_values(browser, version, **filters), **filters)
+    return None if arrays is None else arrays['values']
+
+
+def concatenate(arrays):
+    ''' Concatenate measurement arrays, an empty list giving an empty array. '''
+    if arrays == []:
+        return np.array([])
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.concatenate(arrays)
+
+
+def migrate(browser, version, values_format = None):
+    ''' Convert a legacy result file to the JSON Lines format.
+    Legacy results are put before the results already in the JSON Lines file.
+    With the 'npy' format, measurement arrays still stored in json are also moved to .npy files.
+    The new file is written next to the old one and renamed, so an interrupted
+    migration leaves the results untouched. The legacy file is kept with a .bak suffix.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    version(int or str): Tested version, or 'rdtsc'.
+    values_format(str): 'json' or 'npy'. Default is set in config file.
+    '''
+    values_format = values_format or config.VALUES_FORMAT
+    legacy_path = get_path(browser, version, LEGACY_EXTENSION)
+    if not os.path.exists(legacy_path) and values_format != 'npy':
+        return
+    path = get_path(browser, version)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        for result in iter_results(browser, version, arrays = False):
+            if values_format == 'npy':
+                result = store_arrays(result, version, browser)
+            file.write(json.dumps(result, default=to_json) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    if os.path.exists(legacy_path):
+        os.replace(legacy_path, legacy_path + '.bak')
+    cache.invalidate(browser, version)
+    print('Migrated results of ' + browser + ' ' + str(version) + ' to ' + path)
+
+
+#                                     MAIN                                     #
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--browser', help='Use a specific browser. Default is all browsers.', type=str)
+    parser.add_argument('--migrate', help='Convert legacy json result files to the JSON Lines format. Without this flag, a summary of the results is printed.', action='store_true', default=False)
+    parser.add_argument('--npy', help='With --migrate, also move measurement values to binary .npy files.', action='store_true', default=False)
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    if args.browser:
+        browsers = [args.browser]
+    else:
+        browsers = list(config.RESULTS_DIR.keys())
+    if args.migrate:
+        for browser in browsers:
+            for version in list_versions(browser):
+                migrate(browser, version, 'npy' if args.npy else None)
+    else:
+        for browser in browsers:
+            update_index(browser, list_versions(browser))
+            connection = catalog.connect(browser)
+            summary = connection.execute('''SELECT version, name, clock_method, coop, hit_miss, COUNT(*), SUM(length)
+                                            FROM results GROUP BY version, name, clock_method, coop, hit_miss
+                                            ORDER BY version''').fetchall()
+            connection.close()
+            for (version, name, clock_method, coop, hit_miss, count, length) in summary:
+                description = [browser, version, str(name)]
+                if clock_method is not None:
+                    description.append(clock_method)
+                if hit_miss is not None:
+                    description.append(hit_miss)
+                description.append('COOP/COEP: ' + str(bool(coop)))
+                line = ' '.join(description) + ': ' + str(count) + ' results'
+                if length is not None:
+                    line += ', ' + str(length) + ' values'
+                print(line)
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
+        sys.exit(1)
+    args = parse_arguments()
+    main(args)
@@ -0,0 +1,157 @@
+#!usr/bin/python3
+''' Resume interrupted test campaigns.
+A campaign is split in steps: for each version, the SharedArrayBuffer availability
+test ('sab'), the distribution test ('distribution'), and the hit/miss test for
+each clock ('hit_miss SharedArrayBuffer', 'hit_miss performance.now').
+Before launching anything, the stored results are checked (see results_store.py)
+to find the steps already done and how many measurements they already have.
+Only the missing measurements are scheduled, so that results are not duplicated.
+
+The hit/miss test with SharedArrayBuffer is skipped on versions where the stored
+availability test found SABs unavailable, since it can not succeed there.
+'''
+# Imports :
+import sys
+import argparse
+
+# Locals:
+import config
+import results_store
+import utility
+
+
+CLOCK_METHODS = ['SharedArrayBuffer', 'performance.now']
+
+
+def get_todo(tests, repetitions):
+    ''' Return the steps of a set of tests, all of them with every repetition to do.
+
+    Parameters:
+    tests(list(str)): Tests, among utility.TESTS.
+    repetitions(int): The number of measurements.
+
+    Returns:
+    dict: The number of measurements to do for each step (None for 'sab', which has no repetitions).
+    '''
+    todo = {}
+    for test in tests:
+        if test == 'sab':
+            todo['sab'] = None
+        elif test == 'hit_miss':
+            for clock_method in CLOCK_METHODS:
+                todo['hit_miss ' + clock_method] = repetitions
+        else:
+            todo[test] = repetitions
+    return todo
+
+
+def get_done(browser, versions, coop):
+    ''' Count the measurements already stored for each step of each version.
+    Measurements of several runs of a step add up, as they are merged when reading.
+    For hit/miss tests, the count is the smallest of the hit and miss counts.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    versions(list(int)): Tested versions.
+    coop(bool): True if COOP/COEP is enabled.
+
+    Returns:
+    (dict, dict): For each version, the number of measurements of each step (1 for 'sab' when done),
+    and the stored SharedArrayBuffer availability of each version (None if not tested).
+    '''
+    counts = {version: {} for version in versions}
+    hits_misses = {}
+    sab_available = {version: None for version in versions}
+    for (version, result, length) in results_store.list_results(browser, versions, coop=coop):
+        if version not in counts:
+            continue
+        name = result.get('name')
+        if name == 'SAB availablity':
+            counts[version]['sab'] = 1
+            available = result.get('sab_available') in (True, 'True')
+            sab_available[version] = available or bool(sab_available[version])
+        elif name == 'Tick distibution':
+            counts[version]['distribution'] = counts[version].get('distribution', 0) + (length or 0)
+        elif name == 'hit/miss':
+            key = (version, 'hit_miss ' + str(result.get('clock_method')), result.get('hit/miss'))
+            hits_misses[key] = hits_misses.get(key, 0) + (length or 0)
+    for version in versions:
+        for clock_method in CLOCK_METHODS:
+            step = 'hit_miss ' + clock_method
+            counts[version][step] = min(hits_misses.get((version, step, 'hits'), 0), hits_misses.get((version, step, 'misses'), 0))
+    return (counts, sab_available)
+
+
+def plan(browser, versions, tests, coop, repetitions):
+    ''' Find what remains to be done for a set of tests, and print the plan.
+
+    Parameters:
+    browser(str): Either 'chrome' or 'firefox'.
+    versions(list(int)): Tested versions.
+    tests(list(str)): Tests to run, among utility.TESTS.
+    coop(bool): True to activate coop/coep, False otherwise.
+    repetitions(int): The number of measurements wanted for each step.
+
+    Returns:
+    dict: For each version, the number of measurements still to do for each of its pending steps
+    (see get_todo). Versions with nothing left to do have an empty dict.
+    '''
+    (counts, sab_available) = get_done(browser, versions, coop)
+    remaining = {}
+    (skipped, pending) = (0, 0)
+    print('Plan for ' + browser + ' (COOP/COEP: ' + str(coop) + ', ' + str(repetitions) + ' measurements):')
+    print('version step done status')
+    for version in versions:
+        remaining[version] = {}
+        for (step, wanted) in get_todo(tests, repetitions).items():
+            done = counts[version].get(step, 0)
+            if step == 'sab':
+                status = 'skipped (done)' if done else 'pending'
+                if not done:
+                    remaining[version][step] = None
+            elif step == 'hit_miss SharedArrayBuffer' and sab_available[version] is False:
+                status = 'skipped (SABs unavailable)'
+            elif done >= wanted:
+                status = 'skipped (done)'
+            else:
+                status = 'pending (' + str(wanted - done) + ' to do)'
+                remaining[version][step] = wanted - done
+            if status.startswith('pending'):
+                pending += 1
+            else:
+                skipped += 1
+            print(str(version) + ' ' + step + ' ' + str(done) + ' ' + status)
+    print(str(skipped) + ' steps skipped, ' + str(pending) + ' pending.')
+    print()
+    return remaining
+
+
+#                                  MAIN                                        #
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--browser', help='Use a specific browser.', type=str, default='firefox')
+    parser.add_argument('-v', '--version', help='Use a specific version. By default, all versions with results.', type=int)
+    parser.add_argument('-r', '--repetitions', help='Number of measurements wanted for hit/miss and distribution.', type=int, default=config.REPETITIONS)
+    parser.add_argument('-c', '--coop', help = 'Look at results with COOP and COEP. Default is off.', action='store_true',default=False)
+    parser.add_argument('--sab', help='Look at the availablity tests for SharedArrayBuffer.', action='store_true',default=False)
+    parser.add_argument('--distribution', help='Look at the distribution tests.', action='store_true',default=False)
+    parser.add_argument('--hit_miss', help='Look at the hit/miss tests.', action='store_true',default=False)
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    if args.version:
+        versions = [args.version]
+    else:
+        versions = [version for version in results_store.list_versions(args.browser) if isinstance(version, int)]
+    plan(args.browser, versions, utility.get_tests(args), args.coop, args.repetitions)
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
+        sys.exit(1)
+    args = parse_arguments()
+    main(args)
@@ -0,0 +1,71 @@
+#!usr/bin/python3
+''' Run several tests in a single browser session.
+Starting and closing a browser is a large part of short runs, so the tests of a
+version can share one browser, navigating between the pages of the local server.
+Every test is timed on its own. A test failing (e.g. a JavaScript exception) does
+not stop the following ones: the browser is only restarted if it stopped answering.
+'''
+# Imports :
+import time
+
+
+def is_alive(driver):
+    ''' Check that a browser still answers to the webdriver.
+
+    Parameters:
+    driver(WebDriver): The browser.
+
+    Returns:
+    bool: False if the browser crashed or the session is lost.
+    '''
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+def quit(driver):
+    ''' Close a browser, ignoring errors of browsers that already crashed. '''
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+def run_session(launch, steps):
+    ''' Run tests one after the other in the same browser.
+
+    Parameters:
+    launch(function): Starts the browser and returns its webdriver.
+    steps(list((str, function))): Name of each test and the function running it, taking the webdriver as parameter.
+
+    Returns:
+    dict: For each test, its wall time in seconds and its error (None if it succeeded).
+    '''
+    report = {}
+    driver = None
+    try:
+        for (name, step) in steps:
+            start = time.time()
+            error = None
+            try:
+                if driver is None:
+                    driver = launch()
+                step(driver)
+            except Exception as e:
+                error = type(e).__name__ + ': ' + str(e).strip()
+                print(name + ' failed: ' + error)
+                if driver is not None and not is_alive(driver):
+                    print('The browser stopped answering, restarting it for the next tests.')
+                    quit(driver)
+                    driver = None
+            report[name] = (time.time() - start, error)
+    finally:
+        if driver is not None:
+            quit(driver)
+
+    print('test wall_time(s) status')
+    for (name, (wall_time, error)) in report.items():
+        print(name + ' ' + str(round(wall_time, 1)) + ' ' + ('ok' if error is None else 'failed'))
+    return report
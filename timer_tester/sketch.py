@@ -0,0 +1,173 @@
+#!usr/bin/python3
+''' Compact summaries of measurements, which can be merged.
+A sketch keeps the number of measurements in buckets whose width grows with the
+value (as in HDR histograms): each power of two is split in 2**precision buckets,
+so any value is known with a relative error below 2**-precision, and integers
+below 2**(precision+1) are kept exactly. The count, mean and variance are also
+kept exactly (up to float rounding), as running moments.
+
+Sketches of several runs merge into the sketch of all their measurements: bucket
+counts add up, and the moments combine with the parallel variance formula.
+A sketch takes a few kB whatever the number of measurements, see VALUES_FORMAT
+in the config file to store sketches instead of the measurements.
+'''
+# Imports :
+import numpy as np
+
+
+PRECISION = 7
+ZERO_KEY = -(1 << 62)
+
+
+class Sketch:
+    ''' Mergeable summary of measurements.
+
+    Parameters:
+    precision(int): Number of bits of the buckets in each power of two.
+    '''
+    def __init__(self, precision = PRECISION):
+        self.precision = precision
+        self.buckets = {} # Bucket key: count. Negative values have their own keys, see get_keys.
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # Sum of squared differences to the mean.
+        self.min = None
+        self.max = None
+
+    def get_keys(self, values):
+        ''' Return the bucket of each value.
+        Keys are encoded in a single integer: 2 * magnitude key for positive values,
+        2 * magnitude key + 1 for negative ones, where the magnitude key of
+        m * 2**e (0.5 <= m < 1) is e * 2**precision + the sub-bucket of m. Zero has its own key.
+        '''
+        (mantissas, exponents) = np.frexp(np.abs(values))
+        sub_buckets = np.floor((mantissas * 2 - 1) * (1 << self.precision)).astype(np.int64)
+        keys = exponents.astype(np.int64) * (1 << self.precision) + sub_buckets
+        keys = 2 * keys + (values < 0)
+        keys[values == 0] = ZERO_KEY
+        return keys
+
+    def get_lower_bounds(self, keys):
+        ''' Return the value at the lower end (closest to zero) of buckets. '''
+        keys = np.asarray(keys, dtype=np.int64)
+        signs = np.where(keys % 2 == 1, -1.0, 1.0)
+        magnitudes = keys // 2
+        (exponents, sub_buckets) = np.divmod(magnitudes, 1 << self.precision)
+        bounds = signs * np.ldexp(1 + sub_buckets / (1 << self.precision), exponents - 1)
+        bounds[keys == ZERO_KEY] = 0
+        return bounds
+
+    def add(self, values):
+        ''' Add measurements to the sketch.
+
+        Parameters:
+        values(array-like): The measurements.
+        '''
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return
+        (keys, counts) = np.unique(self.get_keys(values), return_counts=True)
+        for (key, count) in zip(keys.tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        other = Sketch(self.precision)
+        other.count = values.size
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self.merge_moments(other)
+
+    def merge_moments(self, other):
+        ''' Add the count, moments and extrema of another sketch. '''
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def merge(self, other):
+        ''' Add the measurements summarized by another sketch. '''
+        if other.precision != self.precision:
+            raise Exception('Sketches with different precisions can not be merged')
+        for (key, count) in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.merge_moments(other)
+
+    def get_buckets(self):
+        ''' Return the buckets in increasing order of values.
+
+        Returns:
+        (np.ndarray, np.ndarray): The lower end of each bucket (clamped to min and max), and its count.
+        '''
+        keys = np.array(list(self.buckets.keys()), dtype=np.int64)
+        counts = np.array(list(self.buckets.values()), dtype=np.int64)
+        values = np.clip(self.get_lower_bounds(keys), self.min, self.max) if keys.size else np.array([])
+        order = np.argsort(values, kind='stable')
+        return (values[order], counts[order])
+
+    def get_stdev(self):
+        ''' Return the sample standard deviation (0 for less than two measurements). '''
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+    def get_quantiles(self, quantiles):
+        ''' Return quantiles of the measurements, within the precision of the sketch.
+
+        Parameters:
+        quantiles(array-like): Quantiles between 0 and 1, e.g. [0.25, 0.5, 0.75].
+
+        Returns:
+        np.ndarray: The value of each quantile.
+        '''
+        (values, counts) = self.get_buckets()
+        if self.count == 0:
+            return np.full(len(quantiles), np.nan)
+        ranks = np.asarray(quantiles, dtype=np.float64) * (self.count - 1)
+        return values[np.searchsorted(np.cumsum(counts), ranks, side='right')]
+
+    def to_dict(self):
+        ''' Return the sketch as a dict of json types, to be stored in a result. '''
+        return {'precision': self.precision,
+                'keys': list(self.buckets.keys()),
+                'counts': list(self.buckets.values()),
+                'count': self.count,
+                'mean': self.mean,
+                'm2': self.m2,
+                'min': self.min,
+                'max': self.max,
+                }
+
+    @staticmethod
+    def from_dict(stored):
+        ''' Rebuild a sketch stored with to_dict. '''
+        sketch = Sketch(stored['precision'])
+        sketch.buckets = dict(zip(stored['keys'], stored['counts']))
+        sketch.count = stored['count']
+        sketch.mean = stored['mean']
+        sketch.m2 = stored['m2']
+        sketch.min = stored['min']
+        sketch.max = stored['max']
+        return sketch
+
+
+def from_result(result, key = 'values', precision = PRECISION):
+    ''' Return the sketch of measurements of a result, stored either as a sketch or as values.
+
+    Parameters:
+    result(dict): A stored result.
+    key(str): The field of the measurements.
+    precision(int): Precision of the sketch built from values.
+
+    Returns:
+    Sketch: The sketch, None if the result has no such measurements.
+    '''
+    if key in result.get('sketches', {}):
+        return Sketch.from_dict(result['sketches'][key])
+    if key in result:
+        sketch = Sketch(precision)
+        sketch.add(result[key])
+        return sketch
+    return None
@@ -0,0 +1,220 @@
+#!usr/bin/python3
+''' Tools to evaluate how fast an attacker distinguishes cache hits from misses with a clock.
+The error rate of every number of repetitions (see error_rate_repetitions.py) is
+combined with the time a measurement takes:
+- the eviction of the cache, for misses (--eviction_time),
+- the measurement itself: with performance.now interpolation, waiting for a clock
+  edge then counting until the next one, about 1.5 clock period (MEASURED_PERIODS);
+  with a SharedArrayBuffer clock, two reads of the shared array.
+The clock period and SAB read time come from the rdtsc results of the browser
+(their median, in cycles, converted with --tsc_ghz or the calibration of
+rdtsc_analysis.py), or from --measurement_time.
+
+For each browser, version, clock and COOP/COEP, it reports the minimum number of
+repetitions reaching a target error rate, the measurements and guesses per second,
+and the capacity of the channel in bits/s: a guess over r repetitions with error
+rate e is a binary symmetric channel carrying 1 - H2(e) bits.
+'''
+# Imports :
+import csv
+import os
+import sys
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Locals:
+import config
+import error_rate_repetitions
+import rdtsc_analysis
+import results_store
+
+
+TARGET_ERROR = 0.05
+MEASURED_PERIODS = 1.5 # Waiting for the next edge (half a period on average), then counting one period.
+MAX_REP = 100
+
+
+''' Computes the capacity of a binary symmetric channel.
+
+Parameters:
+error_rates(np.ndarray): Error rates of the channel.
+
+Returns:
+(np.ndarray) The capacity in bits per use, 1 - H2(e). Error rates above 0.5 are flipped guesses, as good as 1 - e.
+'''
+def get_capacity(error_rates):
+    error_rates = np.minimum(np.asarray(error_rates, dtype=np.float64), 1 - np.asarray(error_rates, dtype=np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -(error_rates * np.log2(error_rates) + (1 - error_rates) * np.log2(1 - error_rates))
+    return 1 - np.nan_to_num(entropy, nan=0.0)
+
+
+''' Return the median time of a measurement of the rdtsc results of a browser, in seconds.
+The overhead of performance.rdtsc is removed (see rdtsc_analysis.py).
+
+Parameters:
+browser(str): Either 'chrome' or 'firefox'.
+clock_method(str): Either 'SharedArrayBuffer' or 'performance.now'.
+tsc_ghz(float): Frequency of the time stamp counter, in GHz. Default is the calibration of rdtsc_analysis.py.
+
+Returns:
+(float) The time of a measurement with the clock, None if there are no rdtsc results with it.
+'''
+def get_rdtsc_time(browser, clock_method, tsc_ghz = None):
+    key = 'perf' if clock_method == 'performance.now' else 'sab_read'
+    results = rdtsc_analysis.load_results(browser)
+    cycles = rdtsc_analysis.get_cycles(results)[0][key]
+    tsc_ghz = tsc_ghz or rdtsc_analysis.get_tsc_ghz(results)[0]
+    if len(cycles) == 0 or not tsc_ghz:
+        return None
+    median = float(np.median(cycles))
+    if clock_method == 'performance.now':
+        return MEASURED_PERIODS * median / (tsc_ghz * 1e9)
+    return 2 * median / (tsc_ghz * 1e9) # One read before and one after the access.
+
+
+''' Computes the throughput of the attack for every number of repetitions at once.
+
+Parameters:
+error_rates(dict): The lowest error rate, indexed by the number of repetitions (see get_best_error_rates).
+sample_time(float): Time of a measurement, eviction included, in seconds.
+target_error(float): Error rate to reach.
+
+Returns:
+(dict) The throughput: min_reps (None if the target is not reached), error_rate at min_reps,
+measurements_per_s, guesses_per_s and bits_per_s at min_reps, and the best bits_per_s over all
+repetition counts with its best_reps.
+'''
+def get_throughput(error_rates, sample_time, target_error = TARGET_ERROR):
+    reps = np.array(list(error_rates.keys()), dtype=np.int64)
+    errors = np.array(list(error_rates.values()), dtype=np.float64)
+    bits_per_s = get_capacity(errors) / (reps * sample_time)
+    reached = np.flatnonzero(errors <= target_error)
+    best = int(np.argmax(bits_per_s))
+    throughput = {'min_reps': None, 'error_rate': None, 'measurements_per_s': 1 / sample_time,
+                  'guesses_per_s': None, 'bits_per_s': None,
+                  'best_reps': int(reps[best]), 'best_bits_per_s': float(bits_per_s[best])}
+    if len(reached) > 0:
+        first = reached[0]
+        throughput.update({'min_reps': int(reps[first]), 'error_rate': float(errors[first]),
+                           'guesses_per_s': 1 / (reps[first] * sample_time), 'bits_per_s': float(bits_per_s[first])})
+    return throughput
+
+
+''' Computes the throughput of a version and clock (run in a worker process).
+
+Parameters:
+browser(str): chrome or firefox.
+version(int): studied version.
+clock_method(str): What clock is used. Either SharedArrayBuffer or performance.now
+coop(bool): True if coop/coep enabled.
+sample_time(float): Time of a measurement, eviction included, in seconds.
+target_error(float): Error rate to reach.
+max_rep(int): Repetition counts go from 1 to max_rep - 1.
+
+Returns:
+(dict) The throughput (see get_throughput), None if there are no hits or misses.
+'''
+def get_version_throughput(browser, version, clock_method, coop, sample_time, target_error = TARGET_ERROR, max_rep = MAX_REP):
+    (hits, misses) = results_store.load_hits_misses(browser, version, clock_method, coop)
+    error_rates = error_rate_repetitions.get_best_error_rates(hits, misses, clock_method, max_rep)
+    if error_rates == {}:
+        return None
+    return get_throughput(error_rates, sample_time, target_error)
+
+
+''' Computes the throughput of every version, clock and COOP/COEP setting of a browser with hit/miss results.
+
+Parameters:
+browser(str): chrome or firefox.
+eviction_time(float): Time to evict the cache before a miss, in seconds.
+measurement_time(float): Time of a measurement with the clock, in seconds. Default is read from the rdtsc results.
+tsc_ghz(float): Frequency of the time stamp counter of the rdtsc results, in GHz. Default is calibrated, see rdtsc_analysis.py.
+target_error(float): Error rate to reach.
+max_rep(int): Repetition counts go from 1 to max_rep - 1.
+workers(int): Number of versions computed at the same time. Default is the number of cores.
+
+Returns:
+(list(dict)) For each version, clock and COOP/COEP setting, its throughput (see get_throughput).
+'''
+def sweep(browser, eviction_time = 0, measurement_time = None, tsc_ghz = None, target_error = TARGET_ERROR, max_rep = MAX_REP, workers = None):
+    combinations = sorted({(version, metadata['clock_method'], metadata['coop'])
+                           for (version, metadata, length) in results_store.list_results(browser, name='hit/miss') if length}, key=str)
+    sample_times = {}
+    for clock_method in {clock_method for (_, clock_method, _) in combinations}:
+        clock_time = measurement_time if measurement_time is not None else get_rdtsc_time(browser, clock_method, tsc_ghz)
+        if clock_time is None:
+            raise Exception('No rdtsc results with ' + clock_method + ' for ' + browser + ': set --measurement_time, or --tsc_ghz if the frequency is unknown')
+        sample_times[clock_method] = eviction_time + clock_time
+    if combinations == []:
+        return []
+    (versions, clock_methods, coops) = zip(*combinations)
+    count = len(combinations)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        throughputs = list(executor.map(get_version_throughput, [browser] * count, versions, clock_methods, coops,
+                                        [sample_times[clock_method] for clock_method in clock_methods], [target_error] * count, [max_rep] * count))
+    rows = []
+    for ((version, clock_method, coop), throughput) in zip(combinations, throughputs):
+        if throughput is not None:
+            rows.append(dict(version=version, clock_method=clock_method, coop=coop, sample_time=sample_times[clock_method], **throughput))
+    return rows
+
+
+#                                   DISPLAY                                    #
+COLUMNS = ['version', 'clock_method', 'coop', 'sample_time', 'min_reps', 'error_rate', 'measurements_per_s',
+           'guesses_per_s', 'bits_per_s', 'best_reps', 'best_bits_per_s']
+
+def get_csv_path(browser):
+    ''' Return the path of the csv file of a browser. '''
+    return config.CSV_DIR[browser] + 'throughput-' + browser + '.csv'
+
+def throughput_csv(rows, output):
+    ''' Write the throughputs, one line per version, clock and COOP/COEP setting ('-' when the target is not reached). '''
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output,'w') as file:
+        writer = csv.writer(file,delimiter=' ')
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(['-' if row[column] is None else row[column] for column in COLUMNS])
+
+def print_throughput(rows):
+    print('version clock coop min_reps error(%) measurements/s bits/s best_reps best_bits/s')
+    for row in rows:
+        print(str(row['version']) + ' ' + row['clock_method'] + ' ' + str(row['coop']) + ' '
+              + ('-' if row['min_reps'] is None else str(row['min_reps']) + ' ' + str(round(row['error_rate'] * 100, 2))) + ' '
+              + str(round(row['measurements_per_s'], 1)) + ' '
+              + ('-' if row['bits_per_s'] is None else str(round(row['bits_per_s'], 2))) + ' '
+              + str(row['best_reps']) + ' ' + str(round(row['best_bits_per_s'], 2)))
+
+
+#                                     MAIN                                     #
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--browser', help='Use a specific browser.', type=str, default='firefox')
+    parser.add_argument('-t', '--target', help='Target error rate, in percent.', type=float, default=TARGET_ERROR * 100)
+    parser.add_argument('--eviction_time', help='Time to evict the cache before a miss, in microseconds.', type=float, default=0)
+    parser.add_argument('--measurement_time', help='Time of a measurement with the clock, in microseconds. Default is read from the rdtsc results.', type=float)
+    parser.add_argument('--tsc_ghz', help='Frequency of the time stamp counter of the rdtsc results, in GHz. Default is calibrated, see rdtsc_analysis.py.', type=float)
+    parser.add_argument('--max_rep', help='Maximal number of repetitions', type=int, default=MAX_REP)
+    parser.add_argument('-w', '--workers', help='Number of versions computed at the same time. Default is the number of cores.', type=int, default=None)
+    parser.add_argument('--csv', help='Create csv file (for latex)', action='store_true',default=False)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        sys.stdout.write("Sorry, requires Python 3.x, not Python 2.x\n")
+        sys.exit(1)
+    args = parse_arguments()
+    measurement_time = None if args.measurement_time is None else args.measurement_time * 1e-6
+    rows = sweep(args.browser, args.eviction_time * 1e-6, measurement_time, args.tsc_ghz, args.target / 100, args.max_rep, args.workers)
+    if rows == []:
+        print('No hit/miss results found for ' + args.browser)
+        sys.exit(1)
+    print_throughput(rows)
+    if args.csv:
+        throughput_csv(rows, get_csv_path(args.browser))
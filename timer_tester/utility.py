@@ -1,36 +1,94 @@
 #!usr/bin/python3
 import json
-import statistics
+import numpy as np
 import config
+import results_store
 import os
 
-def get_stats(timings, data=True):
+TESTS = ['sab', 'distribution', 'hit_miss']
+PERCENTILES = [5, 25, 75, 95]
+
+def get_tests(args):
+    ''' Return the tests requested on the command line (--sab, --distribution, --hit_miss), or all of them if none is. '''
+    tests = [test for test in TESTS if getattr(args, test)]
+    if tests == []:
+        print("You have not specified tests, running sab availability, distribution and hit_miss")
+        tests = TESTS
+    return tests
+
+def get_url(page, coop):
+    ''' Return the url of a page of the local server ('hit_miss', 'distribution' or 'rdtsc'), with COOP/COEP if coop is True. '''
+    if coop:
+        return config.URLS[page] + "?coop=True"
+    return config.URLS[page]
+
+def get_stats(timings, data=True, percentiles=PERCENTILES):
+    ''' Return the statistics of measurements (see get_stats_batch), and the measurements themselves if data is True. '''
     stats = {}
     if data:
         stats['values'] = timings
-    stats['average'] = statistics.mean(timings)
-    stats['standard_deviation'] = statistics.stdev(timings)
-    stats['median'] = statistics.median(timings)
+    stats.update(get_stats_batch([timings], percentiles)[0])
+    return stats
+
+def get_stats_batch(arrays, percentiles=PERCENTILES):
+    ''' Compute the statistics of several arrays of measurements with numpy.
+    Arrays of the same length are stacked and computed together, in one call per statistic.
+
+    Parameters:
+    arrays(list(array-like)): The measurements of each result.
+    percentiles(list(float)): Percentiles to compute, between 0 and 100.
+
+    Returns:
+    list(dict): For each array, its average, standard_deviation (sample), median,
+    min, max, median_absolute_deviation and percentiles (by percentile, as strings).
+    '''
+    stats = [None] * len(arrays)
+    groups = {}
+    for (index, values) in enumerate(arrays):
+        if len(values) == 0:
+            raise Exception('No measurements to compute statistics on')
+        groups.setdefault(len(values), []).append(index)
+    for (length, indices) in groups.items():
+        matrix = np.stack([np.asarray(arrays[index], dtype=np.float64) for index in indices])
+        quantiles = np.percentile(matrix, [50] + list(percentiles), axis=1)
+        averages = matrix.mean(axis=1)
+        deviations = matrix.std(axis=1, ddof=1) if length > 1 else np.zeros(len(indices))
+        mads = np.median(np.abs(matrix - quantiles[0][:, None]), axis=1)
+        minima = matrix.min(axis=1)
+        maxima = matrix.max(axis=1)
+        for (row, index) in enumerate(indices):
+            stats[index] = {'average': float(averages[row]),
+                            'standard_deviation': float(deviations[row]),
+                            'median': float(quantiles[0][row]),
+                            'min': float(minima[row]),
+                            'max': float(maxima[row]),
+                            'median_absolute_deviation': float(mads[row]),
+                            'percentiles': {format(percentile, 'g'): float(quantiles[1 + position][row])
+                                            for (position, percentile) in enumerate(percentiles)},
+                            }
     return stats
 
 def write_results(results, version, browser):
-    if not os.path.exists(config.RESULTS_DIR[browser]):
-        os.mkdir(config.RESULTS_DIR[browser])
-    if browser in config.SUPPORTED_BROWSERS:
-        path = config.RESULTS_DIR[browser] + browser + '-' + str(version) + '.json'
-    else :
-        raise Exception('Select a valid browser')
-    try:
-        with open(path,'r') as file:
-            try:
-                data = json.load(file)
-            except json.decoder.JSONDecodeError as e:
-                data = []
-    except FileNotFoundError as e:
-        data = []
-    data.append(results)
-    with open(path,'w') as file:
-        json.dump(data,file,indent=4)
+    results_store.append_result(results, version, browser)
+
+def write_distribution(timings, version, coop, browser):
+    ''' Write the result of a tick distribution test. '''
+    stats = get_stats(timings)
+    stats['name'] = 'Tick distibution'
+    stats['version'] = version
+    stats['coop'] = coop
+    write_results(stats, version, browser)
+
+def write_hits_misses(results, version, clock_method, coop, browser):
+    ''' Write the hit and miss timings of a hit/miss test, as two results. '''
+    for hit_miss in ('hits', 'misses'):
+        stats = get_stats(results[hit_miss])
+        stats['name'] = 'hit/miss'
+        stats['clock_method'] = clock_method
+        stats['hit/miss'] = hit_miss
+        stats['version'] = version
+        stats['coop'] = coop
+        write_results(stats, version, browser)
 
 def read_json(path):
     with open(path,'r') as file: